@@ -169,7 +169,6 @@ Directive must not have spaces before double colon.
 
 import io
 import sys
-import zipfile
 from functools import lru_cache
 from pathlib import Path
 from typing import List, Optional
@@ -240,26 +239,50 @@ def ingest(
     paths: List[Path],
     check: bool = False,
     relink: bool = True,
+    incremental: bool = typer.Option(
+        True,
+        help="Only relink the documents that may refer to the ingested ones.",
+    ),
     dummy_progress: bool = typer.Option(False, help="Disable rich progress bar"),
+    encoding: str = typer.Option(
+        "json", help="Encoding of the ingested documents, json or msgpack."
+    ),
+    jobs: int = typer.Option(
+        1, help="Number of processes used to load and cross reference documents."
+    ),
 ):
     """
-    Given paths to a docbundle folder, ingest it into the known libraries.
+    Given paths to a docbundle folder or zip file, ingest it into the known libraries.
 
     Parameters
     ----------
     paths : List of Path
-        list of paths (directories) to ingest. Maybe later we want to support zipped bundled but it's the not the case
-        yet.
+        list of paths (directories or zip files) to ingest.
     relink : bool
-        after ingesting all the path, should we rescan the whole library to find new crosslinks ?
+        after ingesting all the path, should we rescan the library to find new
+        crosslinks ? The docbundles are already cross-linked with each other.
+    incremental : bool
+        only rescan the documents with references that may resolve to the
+        ingested objects, instead of the whole library.
+    encoding : str
+        encoding used to store the documents, see papyri.encodings. Documents
+        are read whatever their encoding.
+    jobs : int
+        number of processes used to load and cross reference the documents of
+        all the docbundles.
     """
     _intro()
     from . import crosslink as cr
 
-    for p in paths:
-        cr.main(Path(p), check, dummy_progress=dummy_progress)
+    targets = cr.main(
+        [Path(p) for p in paths],
+        check,
+        dummy_progress=dummy_progress,
+        encoding=encoding,
+        jobs=jobs,
+    )
     if relink:
-        cr.relink()
+        cr.relink(targets if incremental else None)
 
 
 @app.command()
@@ -273,7 +296,6 @@ def install(
     """
 
     from io import BytesIO
-    from tempfile import TemporaryDirectory
 
     import httpx
     import rich
@@ -281,6 +303,7 @@ def install(
     from rich.console import Console
 
     from . import crosslink as cr
+    from .bundle import Bundle
 
     console = Console()
 
@@ -347,20 +370,15 @@ def install(
         return results
 
     datas = trio.run(trio_main)
+    bundles = []
     for (name, version), data in datas.items():
         if data is not None:
             # print("Downloaded", name, version, len(data) // 1024, "kb")
-            zf = zipfile.ZipFile(io.BytesIO(data), "r")
-            with TemporaryDirectory() as d:
-                zf.extractall(d)
-                cr.main(
-                    next(iter([x for x in Path(d).iterdir() if x.is_dir()])),
-                    check,
-                    dummy_progress=dummy_progress,
-                )
+            bundles.append(Bundle(io.BytesIO(data)))
         else:
             print(f"Could not find docs for {name}=={version}")
-    cr.relink()
+    if bundles:
+        cr.relink(cr.main(bundles, check, dummy_progress=dummy_progress))
 
 
 @app.command()
@@ -390,6 +408,23 @@ def gen(
     examples: bool = True,
     narrative: bool = True,
     fail: bool = typer.Option(False, help="Fail on first error"),
+    jobs: int = typer.Option(
+        1, help="Number of processes used to parse and serialise API objects."
+    ),
+    incremental: bool = typer.Option(
+        False, help="Reuse unchanged objects from the previous docbundle."
+    ),
+    resume: bool = typer.Option(
+        False,
+        help="Continue an interrupted generation, started with --resume or "
+        "--incremental, where it stopped.",
+    ),
+    archive: bool = typer.Option(
+        False, help="Write the docbundle as a single zip file."
+    ),
+    encoding: Optional[str] = typer.Option(
+        None, help="Encoding of the IR, json or msgpack. Overrides the config file."
+    ),
 ):
     """
     Generate documentation for a given package.
@@ -420,6 +455,11 @@ def gen(
             examples=examples,
             fail=fail,
             narrative=narrative,
+            jobs=jobs,
+            incremental=incremental,
+            resume=resume,
+            archive=archive,
+            encoding=encoding,
         )
 
 
@@ -436,14 +476,26 @@ def bootstrap(file: str):
 
 @app.command()
 def render(
-    ascii: bool = False, html: bool = True, dry_run: bool = False, sidebar: bool = True
+    ascii: bool = False,
+    html: bool = True,
+    dry_run: bool = False,
+    sidebar: bool = True,
+    jobs: int = typer.Option(1, help="Number of processes used to render pages."),
+    incremental: bool = typer.Option(
+        False, help="Only render the pages that changed since the previous render."
+    ),
+    link_assets: bool = typer.Option(
+        False,
+        help="Hard link the images to the ones of the ingest store instead of "
+        "copying them; they are read-only.",
+    ),
 ):
     _intro()
     import trio
 
     from .render import main as m2
 
-    trio.run(m2, ascii, html, dry_run, sidebar)
+    trio.run(m2, ascii, html, dry_run, sidebar, jobs, incremental, link_assets)
 
 
 @app.command()
@@ -457,11 +509,17 @@ def ascii(name: str):
 
 
 @app.command()
-def serve(sidebar: bool = True):
+def serve(
+    sidebar: bool = True,
+    cache_size: int = typer.Option(256, help="Number of pages kept in memory."),
+    cache_dir: Optional[Path] = typer.Option(
+        None, help="Directory where to also keep the rendered pages."
+    ),
+):
     _intro()
     from .render import serve as s2
 
-    s2(sidebar=sidebar)
+    s2(sidebar=sidebar, cache_size=cache_size, cache_dir=cache_dir)
 
 
 @app.command()
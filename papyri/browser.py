@@ -23,7 +23,6 @@
 Urwid tour.  Shows many of the standard widget types and features.
 """
 import json
-import pathlib
 import sys
 from typing import List
 
@@ -38,6 +37,7 @@ from urwid.text_layout import calc_coords
 from urwid.widget import LEFT, SPACE
 
 from papyri.crosslink import load_one
+from papyri.graphstore import GraphStore, Key
 from papyri.take2 import RefInfo
 
 
@@ -232,17 +232,10 @@ def dedup(l):
 
 
 def load(file_path, walk, qa, gen_content, frame):
-    p = file_path
-    br = pathlib.Path(str(p) + ".br")
-    if br.exists():
-        br_data = br.read_text()
-
-        br_bytes = json.dumps(
-            [RefInfo(*x).to_json() for x in json.loads(br_data)]
-        ).encode()
-    else:
-        br_bytes = None
-    blob = load_one(file_path.read_text(), br_bytes)
+    key = Key(*file_path.relative_to(ingest_dir).parts)
+    backrefs = GraphStore(ingest_dir).get_backref(key)
+    br_bytes = json.dumps([RefInfo(*x).to_json() for x in backrefs]).encode()
+    blob = load_one(file_path.read_bytes(), br_bytes)
     assert hasattr(blob, "arbitrary")
     for i in gen_content(blob, frame):
         walk.append(i)
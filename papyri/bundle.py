@@ -0,0 +1,187 @@
+"""
+Reading and writing of docbundles on disk.
+
+A docbundle is a folder with the following structure::
+
+    <root>_<version>/
+        papyri.json        # metadata
+        manifest.json      # fingerprints of objects, see Gen.load_manifest
+        module/<qa>.json   # one serialised DocBlob per API object
+        docs/<name>        # narrative documentation
+        examples/<name>    # gallery examples
+        assets/<name>      # figures and other binary data
+
+It can also be a single zip file of such a folder, with or without the top
+level folder.
+
+"""
+
+import json
+import os
+import shutil
+import zipfile
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, List, Optional, Union
+
+
+class Bundle:
+    """
+    Read access to a docbundle, either a folder or a zip file.
+
+    Members are read directly from the archive, without extracting it.
+
+    Parameters
+    ----------
+    source : Path or binary file
+        path to a docbundle folder or zip file, or an open zip file.
+    """
+
+    def __init__(self, source: Union[Path, IO[bytes]]):
+        self._dir: Optional[Path] = None
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._members: Dict[str, str] = {}
+        if isinstance(source, Path) and source.is_dir():
+            self._dir = source
+            self.name = source.name
+            return
+        self._zip = zipfile.ZipFile(source)
+        names = [n for n in self._zip.namelist() if not n.endswith("/")]
+        tops = {n.split("/", 1)[0] for n in names}
+        prefix = ""
+        if len(tops) == 1 and all("/" in n for n in names):
+            [top] = tops
+            prefix = top + "/"
+            self.name = top
+        else:
+            assert isinstance(source, Path), "can't find name of docbundle"
+            self.name = source.name[: -len(".zip")]
+        self._members = {n[len(prefix) :]: n for n in names}
+
+    def exists(self, path: str) -> bool:
+        if self._dir is not None:
+            return (self._dir / path).exists()
+        return path in self._members
+
+    def read_bytes(self, path: str) -> bytes:
+        if self._dir is not None:
+            return (self._dir / path).read_bytes()
+        assert self._zip is not None
+        return self._zip.read(self._members[path])
+
+    def read_text(self, path: str) -> str:
+        return self.read_bytes(path).decode()
+
+    def list(self, folder: str) -> List[str]:
+        """
+        Sorted names of the files in `folder` of the docbundle.
+        """
+        if self._dir is not None:
+            return sorted(p.name for p in (self._dir / folder).glob("*"))
+        folder = folder.rstrip("/") + "/"
+        return sorted(
+            name[len(folder) :]
+            for name in self._members
+            if name.startswith(folder) and "/" not in name[len(folder) :]
+        )
+
+
+class BundleWriter:
+    """
+    Write a docbundle incrementally.
+
+    Files are written as soon as they are produced into a staging folder next
+    to the target (``<target>.partial``), each file is written atomically.
+    Progress can be recorded with `checkpoint`, so that an interrupted
+    generation can be resumed with ``resume=True``. Once everything is
+    written, `commit` replaces the target folder with the staging one.
+
+    Parameters
+    ----------
+    target : Path
+        final location of the docbundle folder
+    resume : bool
+        whether to keep the content of an existing staging folder, and the
+        checkpoints recorded in it, instead of starting from scratch.
+    archive : bool
+        write the docbundle as a single ``<target>.zip`` file instead of a
+        folder, with all the files under a ``<target name>/`` folder.
+    """
+
+    _checkpoint_name = "checkpoint.jsonl"
+
+    def __init__(self, target: Path, *, resume: bool = False, archive: bool = False):
+        self.target = target
+        self.archive = archive
+        self.resume = resume
+        self.staging = target.with_name(target.name + ".partial")
+        # checkpointed names, and what was recorded for them.
+        self.completed: Dict[str, Any] = {}
+        if resume and (self.staging / self._checkpoint_name).exists():
+            with (self.staging / self._checkpoint_name).open() as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        # interrupted while writing the last checkpoint.
+                        break
+                    name, value = json.loads(line)
+                    self.completed[name] = value
+            for tmp in self.staging.glob("**/*.tmp"):
+                tmp.unlink()
+        elif self.staging.exists():
+            shutil.rmtree(self.staging)
+        for sub in ["module", "docs", "examples", "assets"]:
+            (self.staging / sub).mkdir(parents=True, exist_ok=True)
+        self._checkpoints = (self.staging / self._checkpoint_name).open("a")
+
+    def write(self, path: str, data: Union[str, bytes]) -> None:
+        """
+        Atomically write `data` at `path`, relative to the docbundle root.
+        """
+        dest = self.staging / path
+        tmp = dest.with_name(dest.name + ".tmp")
+        if isinstance(data, str):
+            tmp.write_text(data)
+        else:
+            tmp.write_bytes(data)
+        os.replace(tmp, dest)
+
+    def checkpoint(self, name: str, value: Any = None) -> None:
+        """
+        Record that everything about `name` has been written, along with some
+        json-serialisable `value`; available in `completed` on resume.
+        """
+        self._checkpoints.write(json.dumps([name, value]) + "\n")
+        self._checkpoints.flush()
+        self.completed[name] = value
+
+    def _files(self) -> Iterator[Path]:
+        for path in sorted(self.staging.rglob("*")):
+            if path.is_file():
+                yield path
+
+    def commit(self) -> None:
+        """
+        Replace the target docbundle by the staging one.
+        """
+        self._checkpoints.close()
+        (self.staging / self._checkpoint_name).unlink()
+        if self.archive:
+            dest = self.target.with_name(self.target.name + ".zip")
+            tmp = dest.with_name(dest.name + ".tmp")
+            with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+                for path in self._files():
+                    rel = path.relative_to(self.staging).as_posix()
+                    # fixed date, so that the archive only depends on its content.
+                    info = zipfile.ZipInfo(self.target.name + "/" + rel)
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    zf.writestr(info, path.read_bytes())
+            os.replace(tmp, dest)
+            shutil.rmtree(self.staging)
+            return
+        old = self.target.with_name(self.target.name + ".old")
+        if old.exists():
+            shutil.rmtree(old)
+        if self.target.exists():
+            os.replace(self.target, old)
+        os.replace(self.staging, self.target)
+        if old.exists():
+            shutil.rmtree(old)
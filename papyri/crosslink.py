@@ -3,18 +3,47 @@ from __future__ import annotations
 import builtins
 import json
 import logging
+import multiprocessing
+import os
 import warnings
-from dataclasses import dataclass
+from collections import defaultdict, deque
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from typing import Dict, FrozenSet, List, Optional, Tuple
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 from rich.logging import RichHandler
 from there import print
 
+from .bundle import Bundle
 from .config import ingest_dir
+from .encodings import dumps, loads, sniff
 from .gen import DocBlob, normalise_ref
 from .graphstore import GraphStore, Key
-from .take2 import Node, Param, RefInfo, Section, SeeAlsoItem, Signature
+from .take2 import (
+    Fig,
+    Node,
+    Param,
+    RefInfo,
+    Section,
+    SeeAlsoItem,
+    Signature,
+    schema_digest,
+)
 from .tree import DVR, DirectiveVisiter, resolve_
 from .utils import progress
 
@@ -69,6 +98,94 @@ def find_all_refs(store) -> Tuple[FrozenSet[RefInfo], Dict[str, RefInfo]]:
     return frozenset(known_refs), ref_map
 
 
+def compute_graph(gs: GraphStore, key: Key) -> Dict[str, Any]:
+    """
+    Graph of the neighbourhood of `key`: the documents it refers to, the
+    ones that refer to it, and their backrefs; pruned to about 50 nodes.
+
+    It only depends on the edges of the store, and is stored with
+    `GraphStore.put_graph` at ingest and relink. Nodes have the key of
+    the document they link to, if any.
+    """
+    # nodes_names = [b.path for b in blob.backrefs + blob.refs] + [key[3]]
+    # nodes_names = [n for n in nodes_names if n.startswith('numpy')]
+    weights = {}
+
+    neighbours = gs.get_backref(key) + gs.get_refs(key)
+    all_nodes = [tuple(x) for x in neighbours]
+
+    raw_edges = []
+    for k in neighbours:
+        name = tuple(k)[3]
+        neighbors_refs = gs.get_backref(k)
+        weights[name] = len(neighbors_refs)
+        orig = [x[3] for x in neighbors_refs]
+        all_nodes.extend([tuple(x) for x in neighbors_refs])
+        for o in orig:
+            raw_edges.append((k.path, o))
+
+    data: Dict[str, List[Dict[str, Any]]] = {"nodes": [], "links": []}
+
+    if len(weights) > 50:
+        for thresh in sorted(set(weights.values())):
+            log.info("%s items ; remove items %s or lower", len(weights), thresh)
+            weights = {k: v for k, v in weights.items() if v > thresh}
+            log.info("down to %s items", len(weights))
+            if len(weights) < 50:
+                break
+
+    known_nodes = set(all_nodes)
+    nums_ = set()
+    edges = list(raw_edges)
+    # sorted, so that the stored graphs don't depend on the hash seed.
+    nodes = sorted(set(weights.keys()))
+    for a, b in edges:
+        if (a not in nodes) or (b not in nodes):
+            continue
+        nums_.add(a)
+        nums_.add(b)
+    nums = {x: i for i, x in enumerate(nodes, start=1)}
+
+    for i, (from_, to) in enumerate(edges):
+        if from_ == to:
+            continue
+        if from_ not in nodes:
+            continue
+        if to not in nodes:
+            continue
+        if key[3] in (to, from_):
+            continue
+        data["links"].append({"source": nums[from_], "target": nums[to], "id": i})
+
+    for node in nodes:
+        diam: float = 8
+        if node == key[3]:
+            continue
+            diam = 18
+        elif node in weights:
+            import math
+
+            diam = 8 + math.sqrt(weights[node])
+
+        candidates = [n for n in known_nodes if n[3] == node and "??" not in n]
+        if not candidates:
+            uu = None
+        else:
+            # TODO : be smarter when we have multiple versions. Here we try to pick the latest one.
+            uu = list(sorted(candidates))[-1]
+
+        data["nodes"].append(
+            {
+                "id": nums[node],
+                "val": diam,
+                "label": node,
+                "mod": ".".join(node.split(".")[0:1]),
+                "key": uu,
+            }
+        )
+    return data
+
+
 @dataclass
 class IngestedBlobs(Node):
 
@@ -178,6 +295,11 @@ class IngestedBlobs(Node):
     def process(self, known_refs, aliases, verbose=True):
         """
         Process a doc blob, to find all local and nonlocal references.
+
+        Returns
+        -------
+        unresolved : frozenset of str
+            the references that could not be resolved.
         """
         assert isinstance(known_refs, frozenset)
         assert self._content is not None
@@ -252,6 +374,7 @@ class IngestedBlobs(Node):
                 assert None not in r
         except Exception as e:
             raise type(e)(self.refs)
+        return frozenset(visitor.unresolved)
 
     @classmethod
     def from_json(cls, data):
@@ -267,9 +390,9 @@ def load_one_uningested(
     bytes_: bytes, bytes2_: Optional[bytes], qa, known_refs, aliases, *, version
 ) -> IngestedBlobs:
     """
-    Load the json from a DocBlob and make it an ingested blob.
+    Load a serialised DocBlob and make it an ingested blob.
     """
-    data = json.loads(bytes_)
+    data = loads(bytes_)
 
     old_data = DocBlob.from_json(data)
     assert hasattr(old_data, "arbitrary")
@@ -362,45 +485,72 @@ def load_one_uningested(
     return blob
 
 
+@lru_cache
+def schema_version() -> str:
+    """
+    Version of the schema of ingested documents, see `GraphStore.is_validated`.
+    """
+    return schema_digest(IngestedBlobs)
+
+
+def validate_on_load() -> bool:
+    """
+    Whether documents should be validated again when they are loaded to be
+    rendered.
+
+    Documents are validated when they are ingested, see `schema_version`, so
+    they are not by default. Set the ``PAPYRI_VALIDATE`` environment variable
+    to validate every document on load, when debugging papyri itself.
+    """
+    return bool(os.environ.get("PAPYRI_VALIDATE"))
+
+
 def load_one(
-    bytes_: bytes, bytes2_: bytes, known_refs: FrozenSet[RefInfo] = None, strict=False
+    bytes_: bytes,
+    bytes2_: bytes,
+    known_refs: FrozenSet[RefInfo] = None,
+    strict=False,
+    *,
+    validate=False,
 ) -> IngestedBlobs:
-    data = json.loads(bytes_)
+    data = loads(bytes_)
     assert "backrefs" not in data
     # OK to mutate we are the only owners and don't return it.
     data["backrefs"] = json.loads(bytes2_) if bytes2_ else []
     blob = IngestedBlobs.from_json(data)
+    if validate:
+        blob.validate()
     # TODO move that one up.
     if known_refs is None:
         known_refs = frozenset()
     if not strict:
-        targets = blob.process(known_refs=known_refs, aliases=None)
-        if targets:
-            print("OA", len(targets))
+        blob.process(known_refs=known_refs, aliases=None)
     return blob
 
 
 class Ingester:
-    def __init__(self):
+    def __init__(self, encoding: str = "json"):
         self.ingest_dir = ingest_dir
         self.gstore = GraphStore(self.ingest_dir)
+        # of the documents we write, see papyri.encodings.
+        self.encoding = encoding
 
-    def _ingest_narrative(self, path, gstore):
+    def _ingest_narrative(self, bundle: Bundle, gstore):
 
         for _console, document in progress(
-            (path / "docs").glob("*"), description=f"{path.name} Reading narrative docs"
+            bundle.list("docs"), description=f"{bundle.name} Reading narrative docs"
         ):
             doc = load_one_uningested(
-                document.read_text(),
+                bundle.read_bytes("docs/" + document),
                 None,
-                qa=document.name,
+                qa=document,
                 known_refs=frozenset(),
                 aliases={},
                 version=None,
             )
-            ref = document.name
+            ref = document
 
-            module, version = path.name.split("_")
+            module, version = bundle.name.split("_")
             key = Key(module, "1.22.1", "docs", ref)
             doc.logo = ""
             doc.version = version
@@ -409,33 +559,48 @@ class Ingester:
             del js["backrefs"]
             gstore.put(
                 key,
-                json.dumps(js, indent=2).encode(),
+                dumps(js, self.encoding),
                 [],
+                schema=schema_version(),
             )
 
-    def _ingest_examples(self, path: Path, gstore, known_refs, aliases, version, root):
-
+    def _ingest_examples(
+        self, bundle: Bundle, gstore, known_refs, aliases, version, root
+    ) -> List[List[str]]:
+        """
+        Returns
+        -------
+        gallery : list
+            ``["examples", name, figure]`` for each figure of the examples,
+            see `_write_gallery_index`.
+        """
+        gallery: List[List[str]] = []
         for _, fe in progress(
-            (path / "examples/").glob("*"), description=f"{path.name} Reading Examples"
+            bundle.list("examples"), description=f"{bundle.name} Reading Examples"
         ):
-            s = Section.from_json(json.loads(fe.read_text()))
+            s = Section.from_json(loads(bundle.read_bytes("examples/" + fe)))
             visitor = DVR(
                 "TBD, supposed to be QA", known_refs, {}, aliases, version=version
             )
             s_code = visitor.visit(s)
             refs = list(map(tuple, visitor._targets))
             gstore.put(
-                Key(root, version, "examples", fe.name),
-                json.dumps(s_code.to_json(), indent=2).encode(),
+                Key(root, version, "examples", fe),
+                dumps(s_code.to_json(), self.encoding),
                 refs,
+                unresolved=visitor.unresolved,
             )
-
-    def _ingest_assets(self, path, root, version, aliases, gstore):
-        for _, f2 in progress(
-            (path / "assets").glob("*"),
-            description=f"{path.name} Reading image files ...",
-        ):
-            gstore.put(Key(root, version, "assets", f2.name), f2.read_bytes(), [])
+            gallery.extend(["examples", fe, f] for f in _figures(s_code))
+        return gallery
+
+    def _ingest_assets(self, bundle: Bundle, root, version, aliases, gstore):
+        gstore.put_many(
+            (Key(root, version, "assets", f2), bundle.read_bytes("assets/" + f2), [])
+            for _, f2 in progress(
+                bundle.list("assets"),
+                description=f"{bundle.name} Reading image files ...",
+            )
+        )
 
         gstore.put(
             Key(root, version, "meta", "papyri.json"),
@@ -443,35 +608,88 @@ class Ingester:
             [],
         )
 
-    def ingest(self, path: Path, check: bool):
-
-        gstore = self.gstore
-
-        known_refs, _ = find_all_refs(gstore)
-
-        nvisited_items = {}
+    def _write_gallery_index(self, root, version, gallery: List[List[str]], gstore):
+        """
+        Write the figures of a bundle with the page each one belongs to.
 
-        ###
+        The galleries are rendered from this index alone, see
+        `papyri.render.HtmlRenderer.gallery`. Relink writes the missing ones,
+        see `_compute_gallery_indices`.
 
-        meta_path = path / "papyri.json"
-        data = json.loads(meta_path.read_text())
-        version = data["version"]
-        root = data["module"]
-        logo = data.get("logo", None)
-        # long : short
-        aliases: Dict[str, str] = data.get("aliases", {})
-        rev_aliases = {v: k for k, v in aliases.items()}
+        Parameters
+        ----------
+        gallery : list
+            ``[kind, path, figure]`` for each figure, in the order of the
+            pages; kind is ``"module"`` or ``"examples"``.
+        """
+        gstore.put(
+            Key(root, version, "meta", "gallery.json"),
+            json.dumps(gallery).encode(),
+            [],
+        )
 
-        self._ingest_examples(path, gstore, known_refs, aliases, version, root)
-        self._ingest_assets(path, root, version, aliases, gstore)
-        self._ingest_narrative(path, gstore)
+    def ingest(self, path: Union[Path, Bundle], check: bool, *, jobs: int = 1):
+        """
+        Parameters
+        ----------
+        path : Path or Bundle
+            docbundle to ingest, a folder or a zip file.
+        check : bool
+            whether to skip objects with non-normalised names.
+        jobs : int
+            number of processes used to load and cross reference the
+            documents of the bundle; they are written in the same order
+            whatever the number of jobs.
+
+        Returns
+        -------
+        targets : frozenset of RefInfo
+            the objects that were not known before, see `relink`.
+
+        See Also
+        --------
+        ingest_many
+        """
+        return self.ingest_many([path], check, jobs=jobs)
 
-        for _, f1 in progress(
-            (path / "module").glob("*"),
-            description=f"{path.name} Reading doc bundle files ...",
-        ):
-            assert f1.name.endswith(".json")
-            qa = f1.name[:-5]
+    def ingest_many(
+        self, paths: List[Union[Path, Bundle]], check: bool, *, jobs: int = 1
+    ) -> FrozenSet[RefInfo]:
+        """
+        Ingest several docbundles at once.
+
+        The store is scanned once, and the documents of each bundle are cross
+        referenced with the objects of all the bundles, so they don't need
+        to be relinked against each other.
+
+        Parameters
+        ----------
+        paths : list of Path or Bundle
+            docbundles to ingest, folders or zip files.
+        check : bool
+            whether to skip objects with non-normalised names.
+        jobs : int
+            number of processes used to load and cross reference the
+            documents of all the bundles.
+
+        Returns
+        -------
+        targets : frozenset of RefInfo
+            the objects that were not known before, see `relink`.
+        """
+        bundles = [p if isinstance(p, Bundle) else Bundle(p) for p in paths]
+        # all the documents are written in a single transaction.
+        with self.gstore.batch():
+            return self._ingest(bundles, check, jobs)
+
+    def _bundle_state(
+        self, bundle: Bundle, check: bool, known_refs: FrozenSet[RefInfo]
+    ) -> _IngestState:
+        data = json.loads(bundle.read_text("papyri.json"))
+        names = []
+        for f1 in bundle.list("module"):
+            assert f1.endswith(".json")
+            qa = f1[:-5]
             if check:
                 rqa = normalise_ref(qa)
                 if rqa != qa:
@@ -479,98 +697,252 @@ class Ingester:
                     print(f"skip {qa=}, {rqa=}")
                     continue
                 assert rqa == qa, f"{rqa} !+ {qa}"
-            try:
-                # TODO: version issue
-                nvisited_items[qa] = load_one_uningested(
-                    f1.read_text(),
-                    None,
-                    qa=qa,
-                    known_refs=known_refs,
-                    aliases=aliases,
-                    version=version,
-                )
-                assert hasattr(nvisited_items[qa], "arbitrary")
-            except Exception as e:
-                raise RuntimeError(f"error Reading to {f1}") from e
+            names.append(qa)
+        return _IngestState(
+            bundle.name,
+            data["module"],
+            data["version"],
+            data.get("logo", None),
+            # long : short
+            data.get("aliases", {}),
+            tuple(names),
+            known_refs,
+            # filled once all the bundles are known.
+            frozenset(),
+        )
 
-        known_refs_II = frozenset(nvisited_items.keys())
+    def _ingest(
+        self, bundles: List[Bundle], check: bool, jobs: int
+    ) -> FrozenSet[RefInfo]:
+        global _INGEST_STATE
+        gstore = self.gstore
+
+        known_refs, _ = find_all_refs(gstore)
 
+        states = [self._bundle_state(bundle, check, known_refs) for bundle in bundles]
         # TODO :in progress, crosslink needs version information.
         known_ref_info = frozenset(
-            RefInfo(root, version, "module", qa) for qa in known_refs_II
+            RefInfo(s.root, s.version, "module", qa) for s in states for qa in s.names
         ).union(known_refs)
-
-        for _, (qa, doc_blob) in progress(
-            nvisited_items.items(), description=f"{path.name} Cross referencing"
-        ):
-            refs = doc_blob.process(known_ref_info, verbose=False, aliases=aliases)
-            doc_blob.logo = logo
-            # todo: warning mutation.
-            for sa in doc_blob.see_also:
-                r = resolve_(
-                    qa,
-                    known_ref_info,
-                    frozenset(),
-                    sa.name.name,
-                    rev_aliases=rev_aliases,
+        states = [replace(s, known_ref_info=known_ref_info) for s in states]
+
+        pool = None
+        if jobs > 1 and any(s.names for s in states):
+            # like in Gen.collect_api_docs, the pool needs to be created before
+            # any progress bar starts its refresh thread.
+            _INGEST_STATE = (self, states)
+            pool = multiprocessing.get_context("fork").Pool(jobs)
+        # the figures of the module documents, then the ones of the examples.
+        galleries: List[List[List[str]]] = [[] for _ in bundles]
+        examples: List[List[List[str]]] = []
+        try:
+            for bundle, s in zip(bundles, states):
+                examples.append(
+                    self._ingest_examples(
+                        bundle, gstore, known_refs, s.aliases, s.version, s.root
+                    )
                 )
-                resolved, exists = r.path, r.kind
-                if exists == "module":
-                    sa.name.exists = True
-                    sa.name.ref = resolved
-
-        for _, (qa, doc_blob) in progress(
-            nvisited_items.items(), description=f"{path.name} Writing..."
-        ):
-            # for qa, doc_blob in nvisited_items.items():
-            # we might update other modules with backrefs
-            for k, v in doc_blob.content.items():
-                assert isinstance(v, Section), f"section {k} is not a Section: {v!r}"
-            mod_root = qa.split(".")[0]
-            assert mod_root == root, f"{mod_root}, {root}"
-            doc_blob.version = version
-            assert hasattr(doc_blob, "arbitrary")
-
-            try:
-                doc_blob.validate()
-            except Exception as e:
-                raise type(e)(f"from {qa}")
-            js = doc_blob.to_json()
-            del js["backrefs"]
-
-            # TODO: FIX
-            # when walking the tree of figure we can't properly crosslink
-            # as we don't know the version number.
-            # fix it at serialisation time.
-            rr = []
-            for rq in js["refs"]:
-                assert rq["version"] != "??"
-                if rq["version"] == "??":
-                    rq["version"] = version
-                rr.append(rq)
-            js["refs"] = rr
-
-            refs = [
-                (b["module"], b["version"], b["kind"], b["path"])
-                for b in js.get("refs", [])
+                self._ingest_assets(bundle, s.root, s.version, s.aliases, gstore)
+                self._ingest_narrative(bundle, gstore)
+
+            # the parent reads the bundles, a zip file can't be shared with
+            # the workers; the documents are read as the workers need them.
+            items = (
+                (i, qa, bundle.read_bytes(f"module/{qa}.json"))
+                for i, bundle in enumerate(bundles)
+                for qa in states[i].names
+            )
+            results: Iterator[Tuple[str, bytes, List[Any], Set[str], List[str]]]
+            if pool is None:
+                results = (
+                    self._process_one(states[i], qa, raw) for i, qa, raw in items
+                )
+            else:
+                results = _imap_bounded(
+                    pool, _process_one_in_worker, items, chunksize=4, chunks=2 * jobs
+                )
+            keys = [
+                (i, Key(s.root, s.version, "module", qa))
+                for i, s in enumerate(states)
+                for qa in s.names
             ]
-            for xr in refs:
-                assert None not in xr
-            try:
-                key = Key(mod_root, version, "module", qa)
-                assert mod_root is not None
-                assert version is not None
-                assert None not in key
-                gstore.put(
-                    key,
-                    json.dumps(js, indent=2).encode(),
-                    refs,
+            for _, (i, key) in progress(keys, description="Processing..."):
+                qa, bytes_, refs, unresolved, figures = next(results)
+                assert qa == key.path, (qa, key)
+                try:
+                    gstore.put(
+                        key,
+                        bytes_,
+                        refs,
+                        schema=schema_version(),
+                        unresolved=unresolved,
+                    )
+                except Exception as e:
+                    raise RuntimeError(f"error writing {key}") from e
+                galleries[i].extend(["module", qa, f] for f in figures)
+            for s, gallery, example_gallery in zip(states, galleries, examples):
+                self._write_gallery_index(
+                    s.root, s.version, gallery + example_gallery, gstore
                 )
+        finally:
+            if pool is not None:
+                pool.terminate()
+                _INGEST_STATE = None
+        self._compute_graphs()
+        return known_ref_info - known_refs
+
+    def _process_one(
+        self, state: _IngestState, qa: str, raw: bytes
+    ) -> Tuple[str, bytes, List[Tuple[str, str, str, str]], Set[str], List[str]]:
+        """
+        Load, cross reference and serialise a module document of a bundle.
+
+        Returns
+        -------
+        qa : str
+        bytes : bytes
+            the serialised document.
+        refs : list
+            the forward references of the document.
+        unresolved : set of str
+            the references that could not be resolved.
+        figures : list of str
+            the figures of the examples section, for the gallery.
+        """
+        try:
+            # TODO: version issue
+            doc_blob = load_one_uningested(
+                raw,
+                None,
+                qa=qa,
+                known_refs=state.known_refs,
+                aliases=state.aliases,
+                version=state.version,
+            )
+            assert hasattr(doc_blob, "arbitrary")
+        except Exception as e:
+            raise RuntimeError(f"error Reading to {state.name}/{qa}.json") from e
 
-            except Exception as e:
-                raise RuntimeError(f"error writing to {path}") from e
+        rev_aliases = {v: k for k, v in state.aliases.items()}
+        known_ref_info = state.known_ref_info
+        unresolved = set(
+            doc_blob.process(known_ref_info, verbose=False, aliases=state.aliases)
+        )
+        doc_blob.logo = state.logo
+        # todo: warning mutation.
+        for sa in doc_blob.see_also:
+            r = resolve_(
+                qa,
+                known_ref_info,
+                frozenset(),
+                sa.name.name,
+                rev_aliases=rev_aliases,
+            )
+            resolved, exists = r.path, r.kind
+            if exists == "module":
+                sa.name.exists = True
+                sa.name.ref = resolved
+            else:
+                unresolved.add(sa.name.name)
+
+        # we might update other modules with backrefs
+        for k, v in doc_blob.content.items():
+            assert isinstance(v, Section), f"section {k} is not a Section: {v!r}"
+        mod_root = qa.split(".")[0]
+        assert mod_root == state.root, f"{mod_root}, {state.root}"
+        doc_blob.version = state.version
+        assert hasattr(doc_blob, "arbitrary")
+
+        try:
+            doc_blob.validate()
+        except Exception as e:
+            raise type(e)(f"from {qa}")
+        js = doc_blob.to_json()
+        del js["backrefs"]
+
+        # TODO: FIX
+        # when walking the tree of figure we can't properly crosslink
+        # as we don't know the version number.
+        # fix it at serialisation time.
+        rr = []
+        for rq in js["refs"]:
+            assert rq["version"] != "??"
+            if rq["version"] == "??":
+                rq["version"] = state.version
+            rr.append(rq)
+        js["refs"] = rr
+
+        refs = [
+            (b["module"], b["version"], b["kind"], b["path"])
+            for b in js.get("refs", [])
+        ]
+        for xr in refs:
+            assert None not in xr
+        figures = _figures(doc_blob.example_section_data)
+        return qa, dumps(js, self.encoding), refs, unresolved, figures
+
+    def _affected(
+        self, targets: FrozenSet[RefInfo], rev_aliases: Dict[str, str]
+    ) -> Set[Key]:
+        """
+        Documents with unresolved references that may resolve to `targets`,
+        and documents referring to another version of one of them.
 
-    def relink(self):
+        This mirrors `resolve_`: a reference to an object of another library
+        has to be its full name or one of its aliases, while within the same
+        library it can be any part of the name.
+        """
+        gstore = self.gstore
+        affected = set(gstore.unknown_unresolved())
+        affected |= gstore.other_versions(Key(*t) for t in targets)
+
+        def known(key: Key, module, version) -> bool:
+            # module documents are processed with all the objects of their
+            # bundle at ingest.
+            return key.kind == "module" and key[:2] == (module, version)
+
+        by_name: Dict[str, Set[RefInfo]] = defaultdict(set)
+        for t in targets:
+            by_name[t.path].add(t)
+            by_name["~" + t.path].add(t)
+        for short, long in rev_aliases.items():
+            if long in by_name:
+                by_name[short] |= by_name[long]
+        for key, name in gstore.find_unresolved(by_name):
+            if not all(known(key, t.module, t.version) for t in by_name[name]):
+                affected.add(key)
+
+        # module -> version -> all the paths, to search for parts of names.
+        by_root: Dict[str, Dict[str, List[str]]] = defaultdict(
+            lambda: defaultdict(list)
+        )
+        for t in targets:
+            assert t.module is not None and t.version is not None, t
+            by_root[t.module][t.version].append(t.path)
+        for module, versions in by_root.items():
+            paths = {v: "\n".join(p) for v, p in versions.items()}
+            for key, name in gstore.unresolved(module):
+                candidates = [name.lstrip("~"), rev_aliases.get(name, name)]
+                if any(
+                    c and c in p and not known(key, module, v)
+                    for v, p in paths.items()
+                    for c in candidates
+                ):
+                    affected.add(key)
+        return affected
+
+    def relink(self, targets: Optional[FrozenSet[RefInfo]] = None):
+        """
+        Try to resolve again the references that could not be resolved when
+        the documents were ingested.
+
+        Parameters
+        ----------
+        targets : frozenset of RefInfo, optional
+            objects ingested since the last relink, as returned by `ingest`;
+            only the documents that may refer to them are relinked. All the
+            documents are relinked by default.
+        """
         gstore = self.gstore
         known_refs, _ = find_all_refs(gstore)
         aliases: Dict[str, str] = {}
@@ -579,16 +951,67 @@ class Ingester:
 
         rev_aliases = {v: k for k, v in aliases.items()}
 
-        builtins.print(
-            "Relinking is safe to cancel, but some back references may be broken...."
-        )
+        affected = None
+        if targets is not None:
+            affected = self._affected(targets, rev_aliases)
+            builtins.print(f"Relinking {len(affected)} documents")
+
+        builtins.print("Relinking is safe to cancel, nothing is written until the end.")
         builtins.print("Press Ctrl-C to abort...")
 
-        for _, key in progress(
-            gstore.glob((None, None, "module", None)), description="Relinking..."
+        with gstore.batch():
+            self._relink(known_refs, aliases, rev_aliases, affected)
+            self._compute_graphs()
+            self._compute_gallery_indices()
+
+    def _compute_graphs(self):
+        """
+        Compute the graphs of the documents whose edges changed, see
+        `compute_graph`.
+        """
+        gstore = self.gstore
+        keys = gstore.stale_graphs()
+        for _, key in progress(keys, description="Computing graphs..."):
+            gstore.put_graph(key, json.dumps(compute_graph(gstore, key)))
+
+    def _compute_gallery_indices(self):
+        """
+        Write the gallery index of the modules ingested before they existed,
+        from their stored documents; see `_write_gallery_index`.
+        """
+        gstore = self.gstore
+        missing = [
+            (module, version)
+            for module, version in gstore.glob((None, None))
+            if not gstore.glob((module, version, "meta", "gallery.json"))
+        ]
+        for _, (module, version) in progress(
+            missing, description="Indexing galleries..."
         ):
+            gallery: List[List[str]] = []
+            for key in gstore.glob((module, version, "module", None)):
+                data = loads(gstore.get(key))
+                data["backrefs"] = []
+                doc_blob = IngestedBlobs.from_json(data)
+                figures = _figures(doc_blob.example_section_data)
+                gallery.extend(["module", key.path, f] for f in figures)
+            for key in gstore.glob((module, version, "examples", None)):
+                section = Section.from_json(loads(gstore.get(key)))
+                gallery.extend(["examples", key.path, f] for f in _figures(section))
+            self._write_gallery_index(module, version, gallery, gstore)
+
+    def _relink(self, known_refs, aliases, rev_aliases, affected: Optional[Set[Key]]):
+        gstore = self.gstore
+        keys = gstore.glob((None, None, "module", None))
+        examples = gstore.glob((None, None, "examples", None))
+        if affected is not None:
+            keys = [k for k in keys if k in affected]
+            examples = [k for k in examples if k in affected]
+        for _, key in progress(keys, description="Relinking..."):
+            # relinking keeps the encoding of each document.
+            raw = gstore.get(key)
             try:
-                data = json.loads(gstore.get(key))
+                data = loads(raw)
             except Exception as e:
                 raise ValueError(str(key)) from e
             data["backrefs"] = []
@@ -597,7 +1020,7 @@ class Ingester:
             except Exception as e:
                 raise type(e)(key)
             assert doc_blob.content is not None, data
-            doc_blob.process(known_refs, aliases=aliases)
+            unresolved = set(doc_blob.process(known_refs, aliases=aliases))
 
             # TODO: Move this into process ?
 
@@ -615,22 +1038,32 @@ class Ingester:
                 if exists == "module":
                     sa.name.exists = True
                     sa.name.ref = resolved
+                else:
+                    unresolved.add(sa.name.name)
 
             # end todo
 
+            try:
+                doc_blob.validate()
+            except Exception as e:
+                raise type(e)(f"from {key}")
             data = doc_blob.to_json()
             data.pop("backrefs")
             refs = [
                 (b["module"], b["version"], b["kind"], b["path"])
                 for b in data.get("refs", [])
             ]
-            gstore.put(key, json.dumps(data, indent=2).encode(), refs)
+            gstore.put(
+                key,
+                dumps(data, sniff(raw)),
+                refs,
+                schema=schema_version(),
+                unresolved=unresolved,
+            )
 
-        for _, key in progress(
-            gstore.glob((None, None, "examples", None)),
-            description="Relinking Examples...",
-        ):
-            s = Section.from_json(json.loads(gstore.get(key)))
+        for _, key in progress(examples, description="Relinking Examples..."):
+            raw = gstore.get(key)
+            s = Section.from_json(loads(raw))
             visitor = DVR(
                 "TBD, supposed to be QA", known_refs, {}, aliases, version="?"
             )
@@ -638,32 +1071,125 @@ class Ingester:
             refs = list(map(tuple, visitor._targets))
             gstore.put(
                 key,
-                json.dumps(s_code.to_json(), indent=2).encode(),
+                dumps(s_code.to_json(), sniff(raw)),
                 refs,
+                unresolved=visitor.unresolved,
             )
 
 
-def main(path, check, *, dummy_progress):
+@dataclass(frozen=True)
+class _IngestState:
+    """
+    What `Ingester._process_one` needs to know about a bundle being ingested.
+    """
+
+    name: str
+    root: str
+    version: str
+    logo: Optional[str]
+    # long : short
+    aliases: Dict[str, str]
+    # module documents to ingest
+    names: Tuple[str, ...]
+    # objects known before the bundles, and with the ones of all the bundles
+    # being ingested.
+    known_refs: FrozenSet[RefInfo]
+    known_ref_info: FrozenSet[RefInfo]
+
+
+# state shared with forked worker processes of `Ingester.ingest_many`
+_INGEST_STATE: Optional[Tuple[Ingester, List[_IngestState]]] = None
+
+
+def _figures(section: Section) -> List[str]:
+    """
+    Names of the figures at the top level of `section`, in order.
+    """
+    return [c.value for c in section if isinstance(c, Fig)]
+
+
+def _imap_bounded(
+    pool, func: Callable, items: Iterable, *, chunksize: int, chunks: int
+) -> Iterator:
+    """
+    Like ``pool.imap(func, items, chunksize)``, with at most `chunks` chunks
+    of `items` sent to the workers and not yet consumed.
+
+    `Pool.imap` drains `items` in a thread as fast as it can, which would hold
+    all the raw documents of the bundles in memory at once.
+    """
+    items = iter(items)
+    pending: Deque[Any] = deque()
+
+    def submit():
+        chunk = list(islice(items, chunksize))
+        if chunk:
+            pending.append(pool.map_async(func, chunk, chunksize=chunksize))
+
+    for _ in range(chunks):
+        submit()
+    while pending:
+        results = pending.popleft().get()
+        submit()
+        yield from results
+
+
+def _process_one_in_worker(item: Tuple[int, str, bytes]):
+    """
+    Process a module document in a worker process of `Ingester.ingest_many`.
+
+    The state is inherited from the parent process at fork time, only the
+    index of the bundle, the name and the raw document are sent to the
+    worker.
+    """
+    assert _INGEST_STATE is not None
+    ingester, states = _INGEST_STATE
+    i, qa, raw = item
+    return ingester._process_one(states[i], qa, raw)
+
+
+def main(paths, check, *, dummy_progress, encoding="json", jobs=1):
     """
     Parameters
     ----------
+    paths : Path, Bundle or list of them
+        docbundles to ingest, folders, zip files or already opened bundles.
+        Several bundles are ingested together, see `Ingester.ingest_many`.
+    encoding : str
+        encoding of the documents written in the graph store.
+    jobs : int
+        number of processes used to process the documents, see
+        `Ingester.ingest_many`.
     dummy_progress : bool
         whether to use a dummy progress bar instead of the rich one.
         Usefull when dropping into PDB.
         To be implemented. See gen step.
+
+    Returns
+    -------
+    targets : frozenset of RefInfo
+        the newly ingested objects, to pass to `relink`.
     """
-    builtins.print("Ingesting", path.name, "...")
+    if not isinstance(paths, list):
+        paths = [paths]
+    bundles = []
+    for path in paths:
+        if not isinstance(path, Bundle):
+            assert path.exists(), f"{path} does not exists"
+            path = Bundle(path)
+        bundles.append(path)
+    names = ", ".join(b.name for b in bundles)
+    builtins.print("Ingesting", names, "...")
     from time import perf_counter
 
     now = perf_counter()
 
-    assert path.exists(), f"{path} does not exists"
-    assert path.is_dir(), f"{path} is not a directory"
-    Ingester().ingest(path, check)
+    targets = Ingester(encoding=encoding).ingest_many(bundles, check, jobs=jobs)
     delta = perf_counter() - now
 
-    builtins.print(f"{path.name} Ingesting done in {delta:0.2f}s")
+    builtins.print(f"{names} Ingesting done in {delta:0.2f}s")
+    return targets
 
 
-def relink():
-    Ingester().relink()
+def relink(targets=None):
+    Ingester().relink(targets)
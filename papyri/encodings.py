@@ -0,0 +1,82 @@
+"""
+Serialisation of the documentation IR.
+
+The IR (the ``to_json()`` form of the ``take2`` nodes) is written either as
+json, readable and convenient to debug, or with a compact binary encoding
+(msgpack, when installed). Readers do not need to know which encoding was
+used: it is detected from the first byte of the data, see `sniff`.
+
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+ENCODINGS = ("json", "msgpack")
+
+
+def _check(encoding: str) -> None:
+    if encoding not in ENCODINGS:
+        raise ValueError(
+            f"Unknown encoding {encoding!r}, should be one of {', '.join(ENCODINGS)}"
+        )
+    if encoding == "msgpack" and msgpack is None:
+        raise ImportError("The msgpack encoding requires msgpack, pip install msgpack")
+
+
+def sniff(data: bytes) -> str:
+    """
+    Name of the encoding used for `data`.
+
+    A json document starts with an ascii character, while msgpack maps,
+    arrays and strings start with a byte >= 0x80, so the first byte is enough
+    to distinguish them for the IR.
+    """
+    if data[:1] and data[0] >= 0x80:
+        return "msgpack"
+    return "json"
+
+
+def _sort_keys(data: Any) -> Any:
+    # like json.dumps(sort_keys=True), the order of the keys is used when
+    # rendering, so both encodings need to give the same documents.
+    if isinstance(data, dict):
+        return {k: _sort_keys(data[k]) for k in sorted(data)}
+    if isinstance(data, (list, tuple)):
+        return [_sort_keys(x) for x in data]
+    return data
+
+
+def dumps(data: Any, encoding: str = "json") -> bytes:
+    """
+    Serialise the json-compatible `data` with `encoding`.
+
+    Parameters
+    ----------
+    data : Any
+        json-compatible data, usually the ``to_json()`` of a Node.
+    encoding : {"json", "msgpack"}
+        json is indented to be easy to read and to diff. Keys are sorted with
+        both encodings.
+    """
+    _check(encoding)
+    if encoding == "msgpack":
+        return msgpack.packb(_sort_keys(data), use_bin_type=True)
+    return json.dumps(data, indent=2, sort_keys=True).encode()
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """
+    Deserialise `data`, whatever the encoding it was written with.
+    """
+    if isinstance(data, str):
+        return json.loads(data)
+    encoding = sniff(data)
+    if encoding == "msgpack":
+        _check(encoding)
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data)
@@ -32,3 +32,11 @@ class VisitCitationNotImplementedError(NotImplementedError):
 
 class SerialisationError(Exception):
     pass
+
+
+class SandboxError(RuntimeError):
+    pass
+
+
+class SandboxTimeoutError(SandboxError, TimeoutError):
+    pass
@@ -11,25 +11,37 @@ likely be separated into a separate module at some point.
 from __future__ import annotations
 
 import dataclasses
-import datetime
 import importlib
 import inspect
 import json
 import logging
+import multiprocessing
 import os
 import re
 import site
+import sqlite3
 import sys
 import tempfile
+import time
 import warnings
 from collections import defaultdict
 from dataclasses import dataclass
 from functools import lru_cache
 from hashlib import sha256
-from itertools import count
+from itertools import chain, count
 from pathlib import Path
 from types import FunctionType, ModuleType
-from typing import Any, Dict, List, MutableMapping, Optional, Sequence, Tuple
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    MutableMapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import jedi
 import toml
@@ -42,8 +54,11 @@ from rich.progress import BarColumn, Progress, TextColumn
 from there import print
 from velin.examples_section_utils import InOut, splitblank, splitcode
 
+from . import __version__ as papyri_version
+from .bundle import Bundle, BundleWriter
+from .encodings import dumps
 from .errors import IncorrectInternalDocsLen, NumpydocParseError
-from .miscs import BlockExecutor, DummyP
+from .miscs import BlockExecutor, DummyP, SandboxedExecutor
 from .take2 import (
     Code,
     Fig,
@@ -75,6 +90,9 @@ class ErrorCollector:
             for name in names:
                 self._expected_unseen.setdefault(name, []).append(err)
         self._errors = {}
+        # ordered (qa, error name) pairs, so that errors seen in a worker
+        # process can be replayed in the parent.
+        self.events = []
 
     def __call__(self, qa):
         self._qa = qa
@@ -87,18 +105,27 @@ class ErrorCollector:
     def raise_if_unseen_errors(self):
         pass
 
+    def record(self, qa, ename) -> bool:
+        """
+        Record that ``qa`` raised an error named ``ename``.
+
+        Returns whether this error was expected by the configuration.
+        """
+        self.events.append((qa, ename))
+        if ename in self._expected_unseen.get(qa, []):
+            self._expected_unseen[qa].remove(ename)
+            if not self._expected_unseen[qa]:
+                del self._expected_unseen[qa]
+            return True
+        self._errors.setdefault(ename, []).append(qa)
+        return False
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         if isinstance(exc_type, KeyboardInterrupt):
             return
         if exc_type:
             self.errored = True
-            ename = exc_type.__name__
-            if ename in self._expected_unseen.get(self._qa, []):
-                self._expected_unseen[self._qa].remove(ename)
-                if not self._expected_unseen[self._qa]:
-                    del self._expected_unseen[self._qa]
-            else:
-                self._errors.setdefault(ename, []).append(self._qa)
+            if not self.record(self._qa, exc_type.__name__):
                 self.log.exception("Unexpected error")
             if not self.config.early_error:
                 return True
@@ -133,32 +160,122 @@ def paragraph(lines: List[str]) -> Any:
     return p2
 
 
-_JEDI_CACHE = Path("~/.cache/papyri/jedi/").expanduser()
-
-
-def _hashf(text):
-    ##  for cache expiring every day.
-    ## for every hours, change to 0:13.
+class JediCache:
+    """
+    On disk cache of jedi inference results for `parse_script`.
 
-    return sha256(text.encode()).hexdigest() + datetime.datetime.now().isoformat()[0:10]
+    Results are stored in a single sqlite database, keyed by the script, the
+    names (and types) available in the namespace, whether inference is
+    enabled, the jedi version and the name and version of the library we are
+    generating documentation for. Once the database grows above ``max_size``
+    bytes, the least recently used entries are evicted.
 
+    The connection is re-opened when used from a forked process, and the
+    `hits` and `misses` counters are per-process. The access times of the
+    entries that are read are written in batches, see `flush`.
+    """
 
-def _jedi_get_cache(text):
+    # check the total size every that many insertions.
+    _check_every = 100
+
+    def __init__(self, path: Path, max_size: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+        self.library: Tuple[str, str] = ("", "")
+        self.hits = 0
+        self.misses = 0
+        self._inserted = 0
+        # key -> access time of the entries read since the last flush.
+        self._touched: Dict[str, float] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
 
-    _JEDI_CACHE.mkdir(exist_ok=True, parents=True)
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            self.path.parent.mkdir(exist_ok=True, parents=True)
+            conn = sqlite3.connect(str(self.path), timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # a cache can lose its last writes on power loss, no need to fsync
+            # each one.
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jedi("
+                "key TEXT PRIMARY KEY, value TEXT, size INTEGER, atime REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jedi_atime ON jedi(atime)")
+            self._conn = conn
+            self._pid = os.getpid()
+            # the parent writes its own.
+            self._touched = {}
+        assert self._conn is not None
+        return self._conn
+
+    def key(self, text: str, ns: Dict[str, Any], infer: bool) -> str:
+        context = sorted((k, type(v).__qualname__) for k, v in ns.items())
+        parts = [text, context, infer, jedi.__version__, self.library]
+        return sha256(json.dumps(parts).encode()).hexdigest()
+
+    def get(self, key: str) -> Any:
+        row = self.conn.execute("SELECT value FROM jedi WHERE key=?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touched[key] = time.time()
+        if len(self._touched) >= self._check_every:
+            self.flush()
+        return json.loads(row[0])
 
-    _cache = _JEDI_CACHE / _hashf(text)
-    if _cache.exists():
-        return tuple(tuple(x) for x in json.loads(_cache.read_text()))
+    def flush(self) -> None:
+        """
+        Write the access times of the entries read since the last flush, in a
+        single transaction.
+        """
+        if not self._touched:
+            return
+        touched, self._touched = self._touched, {}
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "UPDATE jedi SET atime=? WHERE key=?",
+                [(atime, key) for key, atime in touched.items()],
+            )
 
-    return None
+    def set(self, key: str, value: Any) -> None:
+        data = json.dumps(value)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO jedi VALUES (?, ?, ?, ?)",
+            (key, data, len(data), time.time()),
+        )
+        self._inserted += 1
+        if self._inserted % self._check_every == 0:
+            self.evict()
 
+    def evict(self) -> None:
+        """
+        Remove least recently used entries until the cache is back below 90%
+        of its maximum size.
+        """
+        self.flush()
+        (total,) = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM jedi"
+        ).fetchone()
+        if total <= self.max_size:
+            return
+        to_free = total - int(self.max_size * 0.9)
+        cutoff = None
+        for atime, size in self.conn.execute(
+            "SELECT atime, size FROM jedi ORDER BY atime"
+        ):
+            to_free -= size
+            cutoff = atime
+            if to_free <= 0:
+                break
+        self.conn.execute("DELETE FROM jedi WHERE atime <= ?", (cutoff,))
 
-def _jedi_set_cache(text, value):
-    _JEDI_CACHE.mkdir(exist_ok=True, parents=True)
 
-    _cache = _JEDI_CACHE / _hashf(text)
-    _cache.write_text(json.dumps(value))
+_JEDI_CACHE = JediCache(Path("~/.cache/papyri/jedi.db").expanduser())
 
 
 def obj_from_qualname(name):
@@ -201,33 +318,77 @@ def parse_script(
     reference : str
         fully qualified name of the type of current token
 
+    See Also
+    --------
+    infer_chunks
+
+    """
+    [entries] = infer_chunks([script], ns, config, prev=prev, where=where)
+    return entries
+
+
+def infer_chunks(
+    chunks: List[str], ns: Dict, config, *, prev: str = "", where=None
+) -> List[Optional[List[Tuple[str, Optional[str]]]]]:
+    """
+    Parse consecutive scripts of an example section into tokens and use Jedi
+    to infer the fully qualified names of each token.
+
+    The full text of the section is analysed by a single jedi Interpreter (or
+    Script), and each chunk is resolved against it with the previous chunks
+    as context. This avoids re-analysing the growing text of the section for
+    each chunk.
+
+    Parameters
+    ----------
+    chunks : list of str
+        the successive scripts to tokenize and infer types on
+    ns : dict
+        Extra namespace to use with jedi's Interpreter. This will be used for
+        implicit imports, for example that `np` is interpreted as numpy.
+    prev : str
+        previous lines that lead to the first chunk.
+
+    Return
+    ------
+    For each chunk, None if inference failed, otherwise a list of tuples with
+    the token text and the fully qualified name of its type.
+
     """
     assert isinstance(ns, dict)
-    jeds = []
-    warnings.simplefilter("ignore", UserWarning)
+    full_text = prev + "".join("\n" + script for script in chunks)
+    # tokenizing alone is cheaper than a cache lookup.
+    cache_key = None
+    if config.infer:
+        # the same text split in different chunks has different results.
+        cache_key = _JEDI_CACHE.key(json.dumps([prev, chunks]), ns, True)
+    if cache_key is not None:
+        cached = _JEDI_CACHE.get(cache_key)
+        if cached is not None:
+            return [None if e is None else [(t, r) for t, r in e] for e in cached]
 
-    l_delta = len(prev.split("\n"))
-    contextscript = prev + "\n" + script
-    if ns:
-        jeds.append(jedi.Interpreter(contextscript, namespaces=[ns]))
-    full_text = prev + "\n" + script
-    k = _jedi_get_cache(full_text)
-    if k is not None:
-        return k
-    jeds.append(jedi.Script(full_text))
+    warnings.simplefilter("ignore", UserWarning)
+    jed = None
+    if config.infer:
+        if ns:
+            jed = jedi.Interpreter(full_text, namespaces=[ns])
+        else:
+            jed = jedi.Script(full_text)
     P = PythonLexer()
 
-    acc: List[Tuple[str, Optional[str]]] = []
-
-    for index, _type, text in P.get_tokens_unprocessed(script):
-        line_n, col_n = pos_to_nl(script, index)
-        line_n += l_delta
-        ref = None
-        if not config.infer or (text in (" .=()[],")) or not text.isidentifier():
-            acc.append((text, ""))
-            continue
+    results: List[Optional[List[Tuple[str, Optional[str]]]]] = []
+    l_delta = len(prev.split("\n"))
+    for script in chunks:
+        acc: List[Tuple[str, Optional[str]]] = []
+        failed = False
+        for index, _type, text in P.get_tokens_unprocessed(script):
+            line_n, col_n = pos_to_nl(script, index)
+            line_n += l_delta
+            ref = None
+            if jed is None or (text in (" .=()[],")) or not text.isidentifier():
+                acc.append((text, ""))
+                continue
 
-        for jed in jeds:
             try:
                 inf = jed.infer(line_n + 1, col_n)
                 if inf:
@@ -236,7 +397,7 @@ def parse_script(
                     ref = inf[0].full_name
             except (AttributeError, TypeError) as e:
                 raise type(e)(
-                    f"{contextscript}, {line_n=}, {col_n=}, {prev=}, {jed=}"
+                    f"{full_text}, {line_n=}, {col_n=}, {prev=}, {jed=}"
                 ) from e
             except jedi.inference.utils.UncaughtAttributeError:
                 if config.jedi_failure_mode in (None, "error"):
@@ -248,12 +409,15 @@ def parse_script(
                         line_n,
                         col_n,
                     )
-                    return None
-            break
-        acc.append((text, ref))
-    _jedi_set_cache(full_text, acc)
+                    failed = True
+                    break
+            acc.append((text, ref))
+        results.append(None if failed else acc)
+        l_delta += len(script.split("\n"))
+    if cache_key is not None:
+        _JEDI_CACHE.set(cache_key, results)
     warnings.simplefilter("default", UserWarning)
-    return acc
+    return results
 
 
 from enum import Enum
@@ -278,6 +442,38 @@ def _execute_inout(item):
     return script, item.out, ce_status.value
 
 
+def make_executor(config, ns: Dict[str, Any], spec: Dict[str, str]):
+    """
+    Return an executor for code blocks, sandboxed in a worker process if the
+    configuration ask for it.
+
+    Parameters
+    ----------
+    config : Config
+        current configuration
+    ns : dict
+        namespace in which to execute code in current process
+    spec : dict
+        the same namespace as a mapping of names to the fully qualified names
+        of its values, to re-create it in a worker process.
+    """
+    if config.exec and config.exec_sandbox:
+        return SandboxedExecutor(
+            spec,
+            timeout=config.exec_timeout,
+            memory_limit=config.exec_memory_limit and config.exec_memory_limit * 2**20,
+            recycle=config.exec_recycle,
+        )
+    return BlockExecutor(ns)
+
+
+def _same_namespace(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """
+    Whether two namespaces bind the same names to the same objects.
+    """
+    return a.keys() == b.keys() and all(a[k] is b[k] for k in a)
+
+
 def get_example_data(
     example_section, *, obj, qa: str, config, log
 ) -> Tuple[Section, List[Any]]:
@@ -349,12 +545,16 @@ def get_example_data(
     import matplotlib.pyplot as plt
     import numpy as np
 
-    acc = ""
+    scripts: List[Tuple[str, Dict[str, Any]]] = []
+    # position in the section, output and status of each code block.
+    codes: List[Tuple[int, str, str]] = []
     figure_names = (f"fig-{qa}-{i}.png" for i in count(0))
     ns = {"np": np, "plt": plt, obj.__name__: obj}
     for k, v in config.implied_imports.items():
         ns[k] = obj_from_qualname(v)
-    executor = BlockExecutor(ns)
+    spec = {"np": "numpy", "plt": "matplotlib.pyplot", obj.__name__: qa}
+    spec.update(config.implied_imports)
+    executor = make_executor(config, ns, spec)
     figs = []
     # fig_managers = _pylab_helpers.Gcf.get_all_fig_managers()
     fig_managers = executor.fig_man()
@@ -393,7 +593,7 @@ def get_example_data(
                             raise_in_fig = True
                             for fig, figname in zip(executor.get_figs(), figure_names):
                                 figs.append((figname, fig))
-                            plt.close("all")
+                            executor.close_figs()
                             raise_in_fig = False
 
                     except Exception:
@@ -412,7 +612,7 @@ def get_example_data(
                                     print(
                                         f"Still fig manager(s) open for {qa}: {figname}"
                                     )
-                                plt.close("all")
+                                executor.close_figs()
                             fig_managers = executor.fig_man()
                             assert len(fig_managers) == 0, fig_managers + [
                                 did_except,
@@ -424,25 +624,45 @@ def get_example_data(
                     else:
                         pass
                         # captured output differ TBD
-                entries = parse_script(script, ns=ns, prev=acc, config=config, where=qa)
-                if entries is None:
-                    entries = [("jedi failed", "jedi failed")]
-
-                acc += "\n" + script
-                example_section_data.append(
-                    Code(entries, "\n".join(item.out), ce_status)
+                # inference is done once all chunks are executed, see below.
+                scripts.append((script, dict(ns)))
+                codes.append(
+                    (len(example_section_data.children), "\n".join(item.out), ce_status)
                 )
+                example_section_data.append(Code([], *codes[-1][1:]))
                 if figname:
                     example_section_data.append(Fig(figname))
             else:
                 assert isinstance(item.out, list)
                 example_section_data.append(Text("\n".join(item.out)))
 
+    # jedi's Interpreter look at the runtime value of the namespace, which
+    # changes as chunks are executed; infer consecutive chunks that see the
+    # same namespace at once.
+    groups: List[Tuple[Dict[str, Any], List[str]]] = []
+    for script, snapshot in scripts:
+        if groups and _same_namespace(groups[-1][0], snapshot):
+            groups[-1][1].append(script)
+        else:
+            groups.append((snapshot, [script]))
+    all_entries = []
+    prev = ""
+    for snapshot, group in groups:
+        all_entries.extend(
+            infer_chunks(group, ns=snapshot, config=config, prev=prev, where=qa)
+        )
+        prev += "".join("\n" + script for script in group)
+
+    for (index, out, ce_status), entries in zip(codes, all_entries):
+        if entries is None:
+            entries = [("jedi failed", "jedi failed")]
+        example_section_data.children[index] = Code(entries, out, ce_status)
+
     # TODO fix this if plt.close not called and still a ligering figure.
     fig_managers = executor.fig_man()
     if len(fig_managers) != 0:
         print(f"Unclosed figures in {qa}!!")
-        plt.close("all")
+        executor.close_figs()
 
     return processed_example_data(example_section_data), figs
 
@@ -542,6 +762,13 @@ class Config:
     implied_imports: Dict[str, str] = dataclasses.field(default_factory=dict)
     expected_errors: Dict[str, List[str]] = dataclasses.field(default_factory=dict)
     early_error: bool = True
+    # execute code in a worker process, see SandboxedExecutor; type inference
+    # does not see the values created by executed code in that case.
+    exec_sandbox: bool = False
+    exec_timeout: Optional[float] = 60  # seconds, per executed code block
+    exec_memory_limit: Optional[int] = None  # MiB
+    exec_recycle: Optional[int] = 100  # restart the worker after N code blocks
+    encoding: str = "json"  # of the IR, see papyri.encodings
 
     def replace(self, **kwargs):
         return dataclasses.replace(self, **kwargs)
@@ -573,6 +800,11 @@ def gen_main(
     examples: bool,
     fail,
     narrative,
+    jobs: int = 1,
+    incremental: bool = False,
+    resume: bool = False,
+    archive: bool = False,
+    encoding: Optional[str] = None,
 ) -> None:
     """
     Main entry point to generate docbundle files,
@@ -604,6 +836,19 @@ def gen_main(
         don't write to disk
     debug : bool
         set log level to debug
+    jobs : int
+        number of processes to use to build the API docs.
+    incremental : bool
+        reuse the documentation of objects that did not change since the
+        previous docbundle was generated.
+    resume : bool
+        continue an interrupted generation instead of starting from scratch;
+        only the objects written by a generation started with `resume` or
+        `incremental` are fingerprinted, and can be skipped.
+    archive : bool
+        write the docbundle as a single zip file.
+    encoding : str | None
+        CLI override of the encoding of the IR, see papyri.encodings
 
     Returns
     -------
@@ -616,6 +861,8 @@ def gen_main(
         config.exec = exec_
     if infer is not None:
         config.infer = infer
+    if encoding is not None:
+        config.encoding = encoding
 
     target_dir = Path("~/.papyri/data").expanduser()
 
@@ -635,19 +882,21 @@ def gen_main(
         target_module_name,
         relative_dir=Path(target_file).parent,
     )
+    p = target_dir / (g.root + "_" + g.version)
+    if incremental:
+        g.load_manifest(p.with_name(p.name + ".zip") if archive else p)
+    g.stream_to(BundleWriter(p, resume=resume, archive=archive))
     if examples:
         g.collect_examples_out()
     if api:
-        g.collect_api_docs(target_module_name)
+        g.collect_api_docs(target_module_name, jobs=jobs)
     if narrative:
         g.collect_narrative_docs()
 
-    p = target_dir / (g.root + "_" + g.version)
-    p.mkdir(exist_ok=True)
-
     g.log.info("Saving current Doc bundle to %s", p)
-    g.clean(p)
-    g.write(p)
+    g.finish()
+    _JEDI_CACHE.flush()
+    g.log.info("Jedi cache: %s hits, %s misses", _JEDI_CACHE.hits, _JEDI_CACHE.misses)
     if dry_run:
         temp_dir.cleanup()
 
@@ -1116,6 +1365,13 @@ class Gen:
         self.metadata = {}
         self.examples = {}
         self.docs = {}
+        # fingerprints of the objects of current run, and of previous run if
+        # we are asked to reuse unchanged objects.
+        self.manifest: Dict[str, Dict[str, Any]] = {}
+        self._previous: Optional[Tuple[Bundle, Dict[str, Dict[str, Any]]]] = None
+        # whether to fingerprint the objects, see load_manifest.
+        self.incremental = False
+        self.writer: Optional[BundleWriter] = None
 
     def clean(self, where: Path):
         """
@@ -1141,6 +1397,8 @@ class Gen:
             (where / "assets").rmdir()
         if (where / "papyri.json").exists():
             (where / "papyri.json").unlink()
+        if (where / "manifest.json").exists():
+            (where / "manifest.json").unlink()
         if (where / "docs").exists():
             (where / "docs").rmdir()
 
@@ -1176,63 +1434,85 @@ class Gen:
             blob.references = None
             blob.refs = []
 
-            self.docs[parts] = json.dumps(blob.to_json(), indent=2, sort_keys=True)
+            self.docs[parts] = dumps(blob.to_json(), self.config.encoding)
             # data = p.read_bytes()
 
-    def write_narrative(self, where: Path) -> None:
-        (where / "docs").mkdir(exist_ok=True)
-        for k, v in self.docs.items():
-            subf = where / "docs"
-            file = k[-1].rsplit(".", maxsplit=1)[0]
-            file = ":".join(k[:-1]) + ":" + file
-            subf.mkdir(exist_ok=True, parents=True)
-            with (subf / file).open("w") as f:
-                f.write(v)
-
-    def write_examples(self, where: Path) -> None:
-        (where / "examples").mkdir(exist_ok=True)
-        for k, v in self.examples.items():
-            with (where / "examples" / k).open("w") as f:
-                f.write(v)
-
-    def write_api(self, where: Path):
+    def _files(self) -> Iterator[Tuple[str, Union[str, bytes]]]:
         """
-        write the API section of the docbundles.
+        Iterate over the path relative to the docbundle root and the content
+        of all the files that have not been written yet.
         """
-        (where / "module").mkdir(exist_ok=True)
         for k, v in self.data.items():
-            with (where / "module" / k).open("w") as f:
-                f.write(v)
+            yield "module/" + k, v
+        for parts, v in self.docs.items():
+            file = parts[-1].rsplit(".", maxsplit=1)[0]
+            yield "docs/" + ":".join(parts[:-1]) + ":" + file, v
+        for k, v in self.examples.items():
+            yield "examples/" + k, v
+        for k, b in self.bdata.items():
+            yield "assets/" + k, b
+        yield "papyri.json", json.dumps(self.metadata, indent=2, sort_keys=True)
+        yield "manifest.json", json.dumps(
+            {"papyri_version": papyri_version, "objects": self.manifest},
+            indent=2,
+            sort_keys=True,
+        )
 
     def write(self, where: Path):
         """
         Write a docbundle folder.
         """
-        self.write_api(where)
-        self.write_narrative(where)
-        self.write_examples(where)
-        self.write_assets(where)
-        with (where / "papyri.json").open("w") as f:
-            f.write(json.dumps(self.metadata, indent=2, sort_keys=True))
-
-    def write_assets(self, where: Path) -> None:
-        assets = where / "assets"
-        assets.mkdir()
-        for k, v in self.bdata.items():
-            with (assets / k).open("wb") as f:
-                f.write(v)
+        for sub in ["module", "docs", "examples", "assets"]:
+            (where / sub).mkdir(exist_ok=True)
+        for path, data in self._files():
+            if isinstance(data, str):
+                (where / path).write_text(data)
+            else:
+                (where / path).write_bytes(data)
+
+    def stream_to(self, writer: BundleWriter) -> None:
+        """
+        Write API objects and assets to `writer` as soon as they are produced,
+        instead of keeping them in memory until `write`.
+
+        Use `finish` to write the rest of the docbundle once all the
+        documentation is collected.
+        """
+        self.writer = writer
+        for k, v in self.data.items():
+            writer.write("module/" + k, v)
+        for k, b in self.bdata.items():
+            writer.write("assets/" + k, b)
+        self.data = {}
+        self.bdata = {}
+
+    def finish(self) -> None:
+        """
+        Write the remaining files of the docbundle to the writer given to
+        `stream_to`, and move the docbundle into place.
+        """
+        assert self.writer is not None
+        for path, data in self._files():
+            self.writer.write(path, data)
+        self.writer.commit()
 
     def put(self, path: str, data):
         """
         put some json data at the given path
         """
-        self.data[path + ".json"] = data
+        if self.writer is not None:
+            self.writer.write("module/" + path + ".json", data)
+        else:
+            self.data[path + ".json"] = data
 
     def put_raw(self, path: str, data):
         """
         put some rbinary data at the given path.
         """
-        self.bdata[path] = data
+        if self.writer is not None:
+            self.writer.write("assets/" + path, data)
+        else:
+            self.bdata[path] = data
 
     def _transform_1(self, blob, ndoc):
         blob.content = {k: v for k, v in ndoc._parsed_data.items()}
@@ -1498,7 +1778,7 @@ class Gen:
             for example in examples:
                 p2.update(taskp, description=str(example).ljust(7))
                 p2.advance(taskp)
-                executor = BlockExecutor({})
+                executor = make_executor(config, {}, {})
                 script = example.read_text()
                 ce_status = "None"
                 figs = []
@@ -1579,7 +1859,7 @@ class Gen:
             for edoc, figs in examples_data:
                 self.examples.update(
                     {
-                        k: json.dumps(v.to_json(), indent=2, sort_keys=True)
+                        k: dumps(v.to_json(), self.config.encoding)
                         for k, v in edoc.items()
                     }
                 )
@@ -1643,11 +1923,254 @@ class Gen:
 
         module = __import__(root)
         self.version = module.__version__
+        _JEDI_CACHE.library = (root, self.version)
 
-    def collect_api_docs(
+    def _collect_one(
         self,
-        root: str,
-    ):
+        qa: str,
+        target_item: Any,
+        *,
+        aliases: List[str],
+        known_refs,
+        error_collector: ErrorCollector,
+        failure_collection: Dict[str, List[str]],
+    ) -> Optional[Tuple[bytes, List[Tuple[str, bytes]]]]:
+        """
+        Parse, process and serialise the documentation of a single object.
+
+        Parameters
+        ----------
+        qa : str
+            fully qualified name of the object
+        target_item
+            the object itself
+        aliases : list of str
+            other known names for this object
+        known_refs : frozenset of RefInfo
+            all the objects of current library we can refer to.
+        error_collector : ErrorCollector
+            collector in which errors are recorded.
+        failure_collection : dict
+            mapping of numpydoc parsing failure to qualified names, updated
+            in place.
+
+        Returns
+        -------
+        None if the object should be skipped, otherwise a tuple with the
+        serialised DocBlob and the list of (name, bytes) figures.
+
+        """
+        with error_collector(qa=qa) as c:
+            item_docstring, arbitrary, api_object = self.helper_1(
+                qa=qa,
+                target_item=target_item,
+            )
+        if c.errored:
+            return None
+
+        try:
+            if item_docstring is None:
+                return None
+            else:
+                ndoc = NumpyDocString(dedent_but_first(item_docstring))
+                # note currentlu in ndoc we use:
+                # _parsed_data
+                # direct access to  ["See Also"], and [""]
+                # and :
+                # ndoc.ordered_sections
+        except Exception as e:
+            if not isinstance(target_item, ModuleType):
+                self.log.exception(
+                    "Unexpected error parsing %s – %s",
+                    qa,
+                    target_item.__name__,
+                )
+                failure_collection["NumpydocError-" + str(type(e))].append(qa)
+            if isinstance(target_item, ModuleType):
+                # TODO: ndoc-placeholder : remove placeholder here
+                ndoc = NumpyDocString(f"To remove in the future –– {qa}")
+            else:
+                return None
+        if not isinstance(target_item, ModuleType):
+            arbitrary = []
+        ex = self._should_exec(qa)
+        dv = DirectiveVisiter(qa, known_refs, local_refs={}, aliases={})
+
+        # TODO: ndoc-placeholder : make sure ndoc placeholder handled here.
+        with error_collector(qa=qa) as c:
+            doc_blob, figs = self.prepare_doc_for_one_object(
+                target_item,
+                ndoc,
+                qa=qa,
+                config=self.config.replace(exec=ex),
+                aliases=aliases,
+                api_object=api_object,
+            )
+        if c.errored:
+            return None
+        doc_blob.arbitrary = [dv.visit(s) for s in arbitrary]
+        doc_blob.example_section_data = dv.visit(doc_blob.example_section_data)
+
+        # eg, dask: str, dask.array.gufunc.apply_gufun: List[str]
+        assert isinstance(doc_blob.references, (list, str, type(None))), (
+            repr(doc_blob.references),
+            qa,
+        )
+
+        if isinstance(doc_blob.references, str):
+            print(repr(doc_blob.references))
+        doc_blob.references = None
+
+        # end processing
+        try:
+            doc_blob.validate()
+        except Exception as e:
+            raise type(e)(f"Error in {qa}")
+        return dumps(doc_blob.to_json(), self.config.encoding), figs
+
+    def _should_exec(self, qa: str) -> bool:
+        """
+        Whether examples of `qa` should be executed with current configuration.
+        """
+        return self.config.exec and not any(
+            qa.startswith(pat) for pat in self.config.execute_exclude_patterns
+        )
+
+    def _fingerprint(self, qa: str, target_item: Any, *, aliases, known_digest) -> str:
+        """
+        Compute a fingerprint of everything that goes into the documentation of
+        a single object.
+
+        If the fingerprint of an object did not change since the previous run,
+        the previously generated documentation can be reused as is.
+
+        Parameters
+        ----------
+        qa : str
+            fully qualified name of the object
+        target_item
+            the object itself
+        aliases : list of str
+            other known names for this object
+        known_digest : str
+            digest of all the qualified names collected in the library, as
+            those are used to resolve references.
+
+        Notes
+        -----
+        This does not track the source of other objects that type inference
+        may look into, so inferred types in examples might be stale if only
+        the implementation of another object changed.
+        """
+        try:
+            sig = str(inspect.signature(target_item))
+            sig = re.sub("at 0x[0-9a-f]+", "at 0x0000000", sig)
+        except (ValueError, TypeError):
+            sig = None
+        try:
+            item_file = find_file(target_item)
+        except Exception:
+            item_file = None
+        try:
+            item_line = inspect.getsourcelines(target_item)[1]
+        except (OSError, TypeError):
+            item_line = None
+        parts = [
+            papyri_version,
+            qa,
+            target_item.__doc__,
+            sig,
+            type(target_item).__name__,
+            item_file,
+            item_line,
+            list(aliases),
+            self._should_exec(qa),
+            self.config.infer and qa not in self.config.exclude_jedi,
+            self.config.implied_imports,
+            self.config.wait_for_plt_show,
+            self.config.exec_sandbox,
+            self.config.exec_timeout,
+            self.config.encoding,
+            known_digest,
+        ]
+        return sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def load_manifest(self, where: Path) -> None:
+        """
+        Load the manifest of a previously generated docbundle, objects whose
+        fingerprint did not change will be reused by `collect_api_docs`.
+
+        Parameters
+        ----------
+        where : Path
+            path to the previous docbundle folder or zip file.
+        """
+        # even without a previous manifest, so that the next run can use ours.
+        self.incremental = True
+        if not where.exists() or not (bundle := Bundle(where)).exists("manifest.json"):
+            self.log.info("No previous manifest in %s, building everything", where)
+            return
+        self._previous = (
+            bundle,
+            json.loads(bundle.read_text("manifest.json"))["objects"],
+        )
+
+    def _unchanged(self, qa: str, fingerprint: str) -> bool:
+        """
+        Whether `qa` can be reused from the previous docbundle, that is to say
+        its fingerprint did not change and all its files are still there.
+        """
+        if self._previous is None:
+            return False
+        where, objects = self._previous
+        entry = objects.get(qa)
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return False
+        if entry["figures"] is None:
+            return True
+        return where.exists("module/" + qa + ".json") and all(
+            where.exists("assets/" + name) for name in entry["figures"]
+        )
+
+    def _load_previous(
+        self, qa: str
+    ) -> Optional[Tuple[bytes, List[Tuple[str, bytes]]]]:
+        """
+        Load the serialised DocBlob and figures of `qa` from the previous
+        docbundle, None if `qa` was skipped.
+        """
+        assert self._previous is not None
+        where, objects = self._previous
+        figures = objects[qa]["figures"]
+        if figures is None:
+            return None
+        return (
+            where.read_bytes("module/" + qa + ".json"),
+            [(name, where.read_bytes("assets/" + name)) for name in figures],
+        )
+
+    def _collect_parallel(self, pool, collected, error_collector, failure_collection):
+        """
+        Run `_collect_one` for all collected objects in `pool`.
+
+        Results are yielded in the same order as `collected`, and the errors
+        and failures seen in the workers are merged back into
+        `error_collector` and `failure_collection` in that same order so that
+        the output is identical to a serial run. The jedi cache statistics of
+        the workers are added to the ones of current process.
+        """
+        for qa, res, events, failures, (hits, misses) in pool.imap(
+            _collect_one_in_worker, collected.keys(), chunksize=4
+        ):
+            _JEDI_CACHE.hits += hits
+            _JEDI_CACHE.misses += misses
+            for eqa, ename in events:
+                error_collector.record(eqa, ename)
+            for k, v in failures.items():
+                failure_collection[k].extend(v)
+            yield qa, res
+
+    def collect_api_docs(self, root: str, *, jobs: int = 1):
         """
         Crawl one module and stores resulting docbundle in self.store.
 
@@ -1655,12 +2178,21 @@ class Gen:
         ----------
         root : str
             module name to generate docbundle for.
+        jobs : int
+            number of processes to use to parse and serialise objects. Each
+            process executes examples with its own (matplotlib) global state.
+
+        Objects whose fingerprint matches the one of the manifest loaded with
+        `load_manifest` are not processed again, their previous serialised
+        DocBlob and figures are reused.
 
         See Also
         --------
         prepare_doc_for_one_object
+        load_manifest
 
         """
+        global _WORKER_STATE
 
         p = lambda: self.Progress(
             TextColumn("[progress.description]{task.description}", justify="right"),
@@ -1695,91 +2227,111 @@ class Gen:
             {RefInfo(root, self.version, "module", qa) for qa in collected.keys()}
         )
 
-        error_collector = ErrorCollector(self.config, self.log)
-        with p() as p2:
+        known_digest = sha256(json.dumps(sorted(collected.keys())).encode()).hexdigest()
+        # only needed to reuse objects, and not free to compute.
+        fingerprints = {}
+        if self.incremental or (self.writer is not None and self.writer.resume):
+            fingerprints = {
+                qa: self._fingerprint(
+                    qa, item, aliases=collector.aliases[qa], known_digest=known_digest
+                )
+                for qa, item in collected.items()
+            }
+        # objects already written by an interrupted run we are resuming.
+        completed = self.writer.completed if self.writer is not None else {}
+        resumed = {
+            qa
+            for qa, fingerprint in fingerprints.items()
+            if completed.get(qa, {}).get("fingerprint") == fingerprint
+        }
+        for qa in resumed:
+            self.manifest[qa] = completed[qa]
+        if resumed:
+            self.log.info("Resuming after %s already written objects", len(resumed))
+        reused = []
+        if self._previous is not None:
+            reused = [
+                qa
+                for qa, fingerprint in fingerprints.items()
+                if qa not in resumed and self._unchanged(qa, fingerprint)
+            ]
+            self.log.info(
+                "Reusing %s unchanged objects out of %s", len(reused), len(collected)
+            )
+        skipped = resumed.union(reused)
+        to_process = {k: v for k, v in collected.items() if k not in skipped}
 
-            # just nice display of progression.
-            taskp = p2.add_task(description="parsing", total=len(collected))
+        error_collector = ErrorCollector(self.config, self.log)
+        failure_collection: Dict[str, List[str]] = defaultdict(lambda: [])
 
-            failure_collection: Dict[str, List[str]] = defaultdict(lambda: [])
+        pool = None
+        if jobs > 1 and to_process:
+            # The pool need to be created before the progress bar starts its
+            # refresh thread, forking with a running thread is not safe.
+            _WORKER_STATE = (self, collected, collector.aliases, known_refs)
+            pool = multiprocessing.get_context("fork").Pool(jobs)
+            self.log.info("Processing %s objects with %s jobs", len(to_process), jobs)
 
-            for qa, target_item in collected.items():
-                p2.update(taskp, description=qa)
-                p2.advance(taskp)
+        with p() as p2:
 
-                with error_collector(qa=qa) as c:
-                    item_docstring, arbitrary, api_object = self.helper_1(
-                        qa=qa,
-                        target_item=target_item,
-                    )
-                if c.errored:
-                    continue
+            # just nice display of progression.
+            taskp = p2.add_task(
+                description="parsing", total=len(reused) + len(to_process)
+            )
 
-                try:
-                    if item_docstring is None:
-                        continue
-                    else:
-                        ndoc = NumpyDocString(dedent_but_first(item_docstring))
-                        # note currentlu in ndoc we use:
-                        # _parsed_data
-                        # direct access to  ["See Also"], and [""]
-                        # and :
-                        # ndoc.ordered_sections
-                except Exception as e:
-                    if not isinstance(target_item, ModuleType):
-                        self.log.exception(
-                            "Unexpected error parsing %s – %s",
+            if pool is None:
+                results = (
+                    (
+                        qa,
+                        self._collect_one(
                             qa,
-                            target_item.__name__,
-                        )
-                        failure_collection["NumpydocError-" + str(type(e))].append(qa)
-                    if isinstance(target_item, ModuleType):
-                        # TODO: ndoc-placeholder : remove placeholder here
-                        ndoc = NumpyDocString(f"To remove in the future –– {qa}")
-                    else:
-                        continue
-                if not isinstance(target_item, ModuleType):
-                    arbitrary = []
-                ex = self.config.exec
-                if self.config.exec and any(
-                    qa.startswith(pat) for pat in self.config.execute_exclude_patterns
-                ):
-                    ex = False
-                dv = DirectiveVisiter(qa, known_refs, local_refs={}, aliases={})
-
-                # TODO: ndoc-placeholder : make sure ndoc placeholder handled here.
-                with error_collector(qa=qa) as c:
-                    doc_blob, figs = self.prepare_doc_for_one_object(
-                        target_item,
-                        ndoc,
-                        qa=qa,
-                        config=self.config.replace(exec=ex),
-                        aliases=collector.aliases[qa],
-                        api_object=api_object,
+                            target_item,
+                            aliases=collector.aliases[qa],
+                            known_refs=known_refs,
+                            error_collector=error_collector,
+                            failure_collection=failure_collection,
+                        ),
                     )
-                if c.errored:
-                    continue
-                doc_blob.arbitrary = [dv.visit(s) for s in arbitrary]
-                doc_blob.example_section_data = dv.visit(doc_blob.example_section_data)
-
-                # eg, dask: str, dask.array.gufunc.apply_gufun: List[str]
-                assert isinstance(doc_blob.references, (list, str, type(None))), (
-                    repr(doc_blob.references),
-                    qa,
+                    for qa, target_item in to_process.items()
+                )
+            else:
+                results = self._collect_parallel(
+                    pool, to_process, error_collector, failure_collection
                 )
 
-                if isinstance(doc_blob.references, str):
-                    print(repr(doc_blob.references))
-                doc_blob.references = None
-
-                # end processing
-                try:
-                    doc_blob.validate()
-                except Exception as e:
-                    raise type(e)(f"Error in {qa}")
-                self.put(qa, json.dumps(doc_blob.to_json(), indent=2, sort_keys=True))
-                for name, data in figs:
-                    self.put_raw(name, data)
+            n_events = 0
+            try:
+                previous = ((qa, self._load_previous(qa)) for qa in reused)
+                for qa, res in chain(previous, results):
+                    p2.update(taskp, description=qa)
+                    p2.advance(taskp)
+                    # objects that errored are not recorded in the manifest,
+                    # so that their errors are reported again on next run.
+                    errored = len(error_collector.events) > n_events or any(
+                        qa in v for v in failure_collection.values()
+                    )
+                    n_events = len(error_collector.events)
+                    if res is None:
+                        if not errored:
+                            self.manifest[qa] = {
+                                "fingerprint": fingerprints.get(qa),
+                                "figures": None,
+                            }
+                    else:
+                        doc_json, figs = res
+                        self.manifest[qa] = {
+                            "fingerprint": fingerprints.get(qa),
+                            "figures": [name for name, _ in figs],
+                        }
+                        self.put(qa, doc_json)
+                        for name, data in figs:
+                            self.put_raw(name, data)
+                    if self.writer is not None and qa in self.manifest:
+                        self.writer.checkpoint(qa, self.manifest[qa])
+            finally:
+                if pool is not None:
+                    pool.terminate()
+                    _WORKER_STATE = None
             if error_collector._errors:
                 self.log.info("ERRORS:" + toml.dumps(error_collector._errors))
             if error_collector._expected_unseen:
@@ -1808,6 +2360,36 @@ class Gen:
             }
 
 
+# state shared with forked worker processes of `Gen.collect_api_docs`
+_WORKER_STATE: Optional[Tuple[Gen, Dict[str, Any], Dict[str, List[str]], Any]] = None
+
+
+def _collect_one_in_worker(qa: str):
+    """
+    Process a single object in a worker process of `Gen.collect_api_docs`.
+
+    The worker state is inherited from the parent process at fork time,
+    so only the qualified name need to be sent to the worker.
+    """
+    assert _WORKER_STATE is not None
+    gen, collected, aliases, known_refs = _WORKER_STATE
+    error_collector = ErrorCollector(gen.config, gen.log)
+    failure_collection: Dict[str, List[str]] = defaultdict(lambda: [])
+    hits, misses = _JEDI_CACHE.hits, _JEDI_CACHE.misses
+    res = gen._collect_one(
+        qa,
+        collected[qa],
+        aliases=aliases[qa],
+        known_refs=known_refs,
+        error_collector=error_collector,
+        failure_collection=failure_collection,
+    )
+    # workers can be terminated at any time once they are done.
+    _JEDI_CACHE.flush()
+    cache_stats = (_JEDI_CACHE.hits - hits, _JEDI_CACHE.misses - misses)
+    return qa, res, error_collector.events, dict(failure_collection), cache_stats
+
+
 def is_private(path):
     """
     Determine if a import path, or fully qualified is private.
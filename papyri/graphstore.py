@@ -1,8 +1,21 @@
 import json
+import os
 import sqlite3
-from collections import namedtuple
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from hashlib import sha256
 from pathlib import Path as _Path
-from typing import List, Tuple
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
 
 class Path:
@@ -40,6 +53,25 @@ class Path:
 
 Key = namedtuple("Key", ["module", "version", "kind", "path"])
 
+# version of the tables in papyri.db, see GraphStore._migrate
+SCHEMA_VERSION = 7
+
+_KEY = ", ".join(Key._fields)
+_KEY_TEXT = ", ".join(f"{f} TEXT" for f in Key._fields)
+_SOURCE = ", ".join(f"source_{f}" for f in Key._fields)
+_DEST = ", ".join(f"dest_{f}" for f in Key._fields)
+_IS_KEY = " and ".join(f"{f}=?" for f in Key._fields)
+_IS_SOURCE = " and ".join(f"source_{f}=?" for f in Key._fields)
+_IS_DEST = " and ".join(f"dest_{f}=?" for f in Key._fields)
+
+
+# the mode of the content-addressed files of the assets.
+_BLOB_MODE = 0o444
+
+
+def _document_info(bytes_: bytes) -> Tuple[int, str]:
+    return len(bytes_), sha256(bytes_).hexdigest()
+
 
 class GraphStore:
     """
@@ -73,9 +105,10 @@ class GraphStore:
     should update the edges accordingly.
 
     I don't really want to store a global edge document – though it might seem
-    the most reasonable; sqlite ? So I was thinking of storing a companion
-    document with all the back references; but maybe sqlite is a better
-    approach.
+    the most reasonable; sqlite ? We used to store a companion ``.br`` document
+    with all the back references; the edges are now only in the ``links``
+    table of a sqlite database at the root of the store, indexed on both the
+    source and the destination.
 
     One more question is about the dangling documents? Like document we have references to,
     but do not exist yet, and a bunch of other stuff.
@@ -84,28 +117,286 @@ class GraphStore:
 
     def __init__(self, root: _Path, link_finder=None):
 
-        # for now we are going to try to do in-memory operation, just to
-        # see how we can handle that with SQL, and move to on-disk later.
-        p = _Path("~/.papyri/ingest/papyri.db")
-        p = p.expanduser()
-        if not p.exists():
-            self.table = sqlite3.connect(str(p))
-            print("Creating link table")
-            self.table.cursor().execute(
-                "CREATE TABLE links(source, dest, reason, unique(source, dest, reason))"
-            )
-        else:
-            self.table = sqlite3.connect(str(p))
-
         # assert isinstance(link_finder, dict)
         assert isinstance(root, _Path)
         self._root = Path(root)
         self._link_finder = link_finder
+        # the file each document put during a batch is staged in, None for
+        # the removed ones; they replace the documents when it ends, see batch.
+        self._pending: Optional[Dict[Key, Optional[_Path]]] = None
+        # digests of assets that may not be used anymore, see _release_blobs.
+        self._released: Set[str] = set()
+        self._has_hard_links: Optional[bool] = None
+
+        # the links table is the only record of the edges, backrefs are
+        # queries on dest; keys are stored column by column.
+        root.mkdir(parents=True, exist_ok=True)
+        self.table = sqlite3.connect(str(root / "papyri.db"))
+        (user_version,) = self.table.execute("PRAGMA user_version").fetchone()
+        if user_version < SCHEMA_VERSION:
+            self._migrate(user_version)
+
+    def _migrate(self, user_version: int) -> None:
+        """
+        Create the tables, or update the ones of stores created by older
+        versions of papyri.
+
+        Version 0 stored keys as ``str(key)`` in the links and validated tables
+        and kept the backrefs of each document in a json ``.br`` file next to
+        it; version 1 had no index of the documents, version 2 stored a
+        copy of each asset, version 3 did not record unresolved references,
+        version 4 had no generation counter, version 5 did not keep the
+        graph of each document and version 6 left the blobs of the assets
+        writable.
+        """
+        brs = []
+        with self.table:
+            # sqlite3 does not open a transaction before DDL statements.
+            self.table.execute("BEGIN")
+            if user_version < 1:
+                brs = self._migrate_links()
+            if user_version < 2:
+                self._index_documents()
+            if user_version < 3:
+                self._share_assets()
+            if user_version < 4:
+                self._create_unresolved()
+            if user_version < 5:
+                self._create_generation()
+            if user_version < 6:
+                self._create_graphs()
+            if user_version < 7:
+                self._protect_blobs()
+            self.table.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        for br in brs:
+            br.unlink()
+
+    def _migrate_links(self) -> List[_Path]:
+        tables = {
+            name
+            for (name,) in self.table.execute(
+                "select name from sqlite_master where type='table'"
+            )
+        }
+        brs = [p for p in self._root.glob("*/*/*/*.br")]
+        if tables or brs:
+            print("Migrating link table")
+
+        def parse(s: str) -> Key:
+            return eval(s, {"Key": Key, "__builtins__": {}})
+
+        for name in tables & {"links", "validated"}:
+            self.table.execute(f"ALTER TABLE {name} RENAME TO old_{name}")
+        self.table.execute(f"""CREATE TABLE links({_SOURCE}, {_DEST}, reason,
+            UNIQUE({_SOURCE}, {_DEST}, reason))""")
+        self.table.execute(f"CREATE INDEX links_dest ON links({_DEST})")
+        self.table.execute(
+            f"CREATE TABLE validated({_KEY}, schema, PRIMARY KEY({_KEY}))"
+        )
+        if "links" in tables:
+            self.table.executemany(
+                "insert or ignore into links values (?,?,?,?,?,?,?,?,?)",
+                (
+                    (*parse(s), *parse(d), r)
+                    for s, d, r in self.table.execute(
+                        "select source, dest, reason from old_links"
+                    )
+                ),
+            )
+            self.table.execute("DROP TABLE old_links")
+        if "validated" in tables:
+            self.table.executemany(
+                "insert or replace into validated values (?,?,?,?,?)",
+                (
+                    (*parse(k), schema)
+                    for k, schema in self.table.execute(
+                        "select key, schema from old_validated"
+                    )
+                ),
+            )
+            self.table.execute("DROP TABLE old_validated")
+        for br in brs:
+            dest = self._path_to_key(br.with_name(br.name[: -len(".br")]))
+            self.table.executemany(
+                "insert or ignore into links values (?,?,?,?,?,?,?,?,?)",
+                ((*source, *dest, "debug") for source in json.loads(br.read_text())),
+            )
+        return brs
+
+    def _index_documents(self) -> None:
+        self.table.execute(
+            f"""CREATE TABLE documents({_KEY_TEXT}, size INTEGER, digest TEXT,
+            PRIMARY KEY({_KEY}))"""
+        )
+        paths = [
+            p
+            for p in self._root.glob("*/*/*/*")
+            if p.is_file() and not p.name.endswith((".br", ".staged", ".tmp"))
+        ]
+        if paths:
+            print("Indexing documents")
+        self.table.executemany(
+            "insert into documents values (?,?,?,?,?,?)",
+            ((*self._path_to_key(p), *_document_info(p.read_bytes())) for p in paths),
+        )
+
+    def _share_assets(self) -> None:
+        self.table.execute("CREATE INDEX documents_digest ON documents(digest)")
+        assets = self.table.execute(
+            f"select {_KEY}, digest from documents where kind='assets'"
+        ).fetchall()
+        if assets:
+            print("Deduplicating assets")
+        for *key, digest in assets:
+            self._link_blob(self._key_to_path(Key(*key)).path, digest)
+
+    def _create_unresolved(self) -> None:
+        self.table.execute(f"CREATE TABLE unresolved({_KEY}, name)")
+        self.table.execute(f"CREATE INDEX unresolved_key ON unresolved({_KEY})")
+        self.table.execute("CREATE INDEX unresolved_name ON unresolved(name)")
+        # we don't know what the existing documents failed to resolve, mark
+        # them so that they are relinked, see unknown_unresolved.
+        self.table.execute(f"""insert into unresolved select {_KEY}, NULL from documents
+            where kind in ('module', 'examples')""")
+
+    def _create_generation(self) -> None:
+        self.table.execute("CREATE TABLE generation(value INTEGER NOT NULL)")
+        self.table.execute("insert into generation values (0)")
+
+    def _create_graphs(self) -> None:
+        # all the graphs are missing, the next relink computes them.
+        self.table.execute(
+            f"CREATE TABLE graphs({_KEY_TEXT}, data TEXT, PRIMARY KEY({_KEY}))"
+        )
+
+    def _protect_blobs(self) -> None:
+        for blob in self._root.path.glob(".blobs/*/*"):
+            blob.chmod(_BLOB_MODE)
+
+    def _hard_links(self) -> bool:
+        """
+        Whether the file system of the store supports hard links.
+        """
+        if self._has_hard_links is None:
+            probe = self._root.path / ".probe"
+            probe.write_bytes(b"")
+            try:
+                os.link(probe, probe.with_name(".probe-link"))
+                probe.with_name(".probe-link").unlink()
+                self._has_hard_links = True
+            except OSError:
+                self._has_hard_links = False
+            probe.unlink()
+        return self._has_hard_links
+
+    def _blob_path(self, digest: str) -> _Path:
+        return self._root.path / ".blobs" / digest[:2] / digest
+
+    def _link_blob(self, path: _Path, digest: str) -> None:
+        """
+        Make `path` a hard link to the blob of its content.
+        """
+        blob = self._blob_path(digest)
+        try:
+            if not blob.exists():
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                os.link(path, blob)
+            elif not blob.samefile(path):
+                tmp = path.with_name(path.name + ".tmp")
+                os.link(blob, tmp)
+                os.replace(tmp, path)
+        except OSError:
+            # no hard links on this file system, keep the copy.
+            pass
+
+    def _write(self, key: Key, bytes_: bytes) -> None:
+        """
+        Write a document to disk.
+
+        Assets are content-addressed: their bytes are stored once in
+        ``.blobs/``, and the file of each key is a hard link to it.
+        """
+        self._replace(key, self._stage(key, bytes_))
+
+    def _stage(self, key: Key, bytes_: bytes) -> _Path:
+        """
+        Write the bytes of a document next to its file, or to its blob for
+        assets, without replacing the current document; see `_replace`.
 
-    def _key_to_paths(self, key: Key) -> Tuple[Path, Path]:
+        Blobs are read-only: the files of the assets, and the copies made with
+        `link`, are the same file, editing one in place would change them all.
+        Without hard links, assets are staged like the other documents.
+        """
+        if self._is_blob(key):
+            _, digest = _document_info(bytes_)
+            staged = self._blob_path(digest)
+            if staged.exists():
+                return staged
+        else:
+            path = self._key_to_path(key).path
+            staged = path.with_name(path.name + ".staged")
+        staged.parent.mkdir(parents=True, exist_ok=True)
+        tmp = staged.with_name(staged.name + ".tmp")
+        tmp.write_bytes(bytes_)
+        if self._is_blob(key):
+            tmp.chmod(_BLOB_MODE)
+        os.replace(tmp, staged)
+        return staged
+
+    def _is_blob(self, key: Key) -> bool:
+        return key.kind == "assets" and self._hard_links()
+
+    def _replace(self, key: Key, staged: _Path) -> None:
+        """
+        Atomically make the document at `key` the one staged by `_stage`.
+        """
+        path = self._key_to_path(key).path
+        if not self._is_blob(key):
+            os.replace(staged, path)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists() and path.samefile(staged):
+            return
+        tmp = path.with_name(path.name + ".tmp")
+        os.link(staged, tmp)
+        os.replace(tmp, path)
+
+    def _discard(self, key: Key, staged: _Path) -> None:
+        """
+        Delete what `_stage` wrote, once the transaction is rolled back.
+        """
+        if self._is_blob(key):
+            # the blob may be shared with documents already in the store.
+            self._released.add(staged.name)
+        else:
+            staged.unlink(missing_ok=True)
+
+    def _release(self, key: Key) -> None:
+        """
+        Mark the blob of the asset currently at `key` for deletion, if it's not
+        used anymore once the transaction is committed.
+        """
+        if key.kind != "assets":
+            return
+        row = self.table.execute(
+            f"select digest from documents where {_IS_KEY}", key
+        ).fetchone()
+        if row is not None:
+            self._released.add(row[0])
+
+    def _release_blobs(self) -> None:
+        released, self._released = self._released, set()
+        for digest in released:
+            used = self.table.execute(
+                "select 1 from documents where digest=? and kind='assets' limit 1",
+                (digest,),
+            ).fetchone()
+            if used is None:
+                self._blob_path(digest).unlink(missing_ok=True)
+
+    def _key_to_path(self, key: Key) -> Path:
         """
         Given A key, return path to the current file
-        and the back referenced.
 
         Parameters
         ----------
@@ -114,16 +405,13 @@ class GraphStore:
         Returns
         -------
         data_path:  _Path
-        backref_path : _Path
 
         """
         path = self._root
         assert None not in key, key
-        for k in key[:-1]:
+        for k in key:
             path = path / k
-        path0 = path / (key[-1])
-        path_br = path / (key[-1] + ".br")
-        return path0, path_br
+        return path
 
     def _path_to_key(self, path: Path):
         """
@@ -146,157 +434,445 @@ class GraphStore:
         else:
             return path.parts
 
-    def remove(self, key: Key) -> None:
-        data, backrefs = self._key_to_paths(key)
-        data.unlink()
-        #  this is likely incorrect if we want to deal with dangling links.
-        backrefs.unlink()
-        print("Removign link from table")
-        self.table.execute(
-            "delete from links where source=?",
-            (str(key),),
-        )
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Group all the `put` and `remove` in the block in a single transaction.
 
-    def get(self, key: Key) -> bytes:
-        assert isinstance(key, Key)
-        path, _ = self._key_to_paths(key)
+        The documents are staged on disk as they are put, and replace the
+        current ones, or are removed, when the block ends; nothing changes if
+        it raises. Batches can be nested, only the outermost one commits.
 
-        ## Verification block
-        path_br = _
+        Examples
+        --------
+        >>> with store.batch():  # doctest: +SKIP
+        ...     for key, bytes_, refs in documents:
+        ...         store.put(key, bytes_, refs)
 
-        if path_br.path.exists():
-            xx = path_br.read_json()
-            backrefs = {Key(*item) for item in xx}
-        else:
-            backrefs = set()
+        """
+        if self._pending is not None:
+            yield
+            return
+        pending: Dict[Key, Optional[_Path]] = {}
+        self._pending = pending
+        try:
+            with self.table:
+                yield
+                self._bump_generation()
+        except BaseException:
+            for key, staged in pending.items():
+                if staged is not None:
+                    self._discard(key, staged)
+            self._release_blobs()
+            raise
+        finally:
+            self._pending = None
+        try:
+            for key, staged in pending.items():
+                if staged is None:
+                    self._key_to_path(key).path.unlink(missing_ok=True)
+                else:
+                    self._replace(key, staged)
+            self._release_blobs()
+        finally:
+            self._released = set()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        if self._pending is not None:
+            yield
+            return
+        try:
+            with self.table:
+                yield
+                self._bump_generation()
+            self._release_blobs()
+        finally:
+            self._released = set()
 
-        sql_backref_unparsed = self.table.execute(
-            "select distinct source from links where dest=?", (str(key),)
-        )
+    def _bump_generation(self) -> None:
+        self.table.execute("update generation set value = value + 1")
 
-        sql_backrefs = {eval(s[0]) for s in sql_backref_unparsed}
+    def generation(self) -> int:
+        """
+        Number of writes committed to the store.
 
-        if not sql_backrefs == backrefs:
-            print(f"Backreferences for {key} differ:")
-            print(f"    there are {len(sql_backrefs)=}")
-            print(f"    and {len(backrefs)=}")
-            print(" + sql : ", sql_backrefs - backrefs)
-            print(" - json:", backrefs - sql_backrefs)
+        It changes whenever documents are put or removed, by this process or
+        any other one, a batch counting as a single write. Caches of the
+        content of the store can be invalidated when it changes.
+        """
+        (value,) = self.table.execute("select value from generation").fetchone()
+        return value
 
-        ## end verification block
+    def remove(self, key: Key) -> None:
+        if self._pending is not None:
+            staged = self._pending.get(key)
+            if staged is not None and not self._is_blob(key):
+                staged.unlink()
+            # removed when the batch ends.
+            self._pending[key] = None
+        #  this is likely incorrect if we want to deal with dangling links.
+        with self._transaction():
+            self._release(key)
+            old_refs = set(self.get_refs(key))
+            self.table.execute(f"delete from links where {_IS_SOURCE}", key)
+            self._invalidate_graphs(key, old_refs)
+            self.table.execute(f"delete from validated where {_IS_KEY}", key)
+            self.table.execute(f"delete from documents where {_IS_KEY}", key)
+            self.table.execute(f"delete from unresolved where {_IS_KEY}", key)
+            self.table.execute(f"delete from graphs where {_IS_KEY}", key)
+        if self._pending is None:
+            # once the document is not listed anymore.
+            self._key_to_path(key).path.unlink(missing_ok=True)
 
-        return path.read_bytes()
+    def get(self, key: Key) -> bytes:
+        assert isinstance(key, Key)
+        if self._pending is not None and key in self._pending:
+            staged = self._pending[key]
+            if staged is None:
+                raise FileNotFoundError(str(key))
+            return staged.read_bytes()
+        return self._key_to_path(key).read_bytes()
+
+    def get_refs(self, key: Key) -> List[Key]:
+        """
+        Keys of the documents `key` references, sorted.
+        """
+        return [
+            Key(*row)
+            for row in self.table.execute(
+                f"select distinct {_DEST} from links where {_IS_SOURCE} "
+                f"order by {_DEST}",
+                tuple(key),
+            )
+        ]
 
-    def get_backref(self, key: Key):
-        _, pathbr = self._key_to_paths(key)
+    def get_backref(self, key: Key) -> List[Key]:
+        """
+        Keys of the documents that reference `key`, sorted.
+        """
+        return [
+            Key(*row)
+            for row in self.table.execute(
+                f"select distinct {_SOURCE} from links where {_IS_DEST} "
+                f"order by {_SOURCE}",
+                tuple(key),
+            )
+        ]
 
-        # print("getting backrefs from table")
-        self.table.execute(
-            "select source, reason from links where dest=?",
-            (str(key),),
-        )
+    def neighbourhood_digest(self, key: Key) -> Optional[str]:
+        """
+        Digest of the document at `key` and of its neighbourhood in the graph,
+        None if there is no such document.
 
-        if pathbr.path.exists():
-            return pathbr.read_json()
-        else:
-            return []
+        The neighbourhood is made of the documents it refers to, the ones that
+        refer to it, and the backrefs of all of those. It changes iff a `put`
+        or a `remove` changes what a page showing the document and its graph
+        depends on, see `get_graph`.
+        """
+        row = self.table.execute(
+            f"select digest from documents where {_IS_KEY}", tuple(key)
+        ).fetchone()
+        if row is None:
+            return None
+        h = sha256(row[0].encode())
+        n_key = ", ".join(f"n.{f}" for f in Key._fields)
+        same_dest = " and ".join(f"b.dest_{f}=n.{f}" for f in Key._fields)
+        b_source = ", ".join(f"b.source_{f}" for f in Key._fields)
+        for row in self.table.execute(
+            f"with n({_KEY}) as ("
+            f"select {_DEST} from links where {_IS_SOURCE} union "
+            f"select {_SOURCE} from links where {_IS_DEST}) "
+            f"select distinct {n_key}, {b_source} from n "
+            f"left join links as b on {same_dest} "
+            f"order by {n_key}, {b_source}",
+            (*key, *key),
+        ):
+            h.update(json.dumps(row).encode())
+        return h.hexdigest()
+
+    def find_unresolved(self, names: Iterable[str]) -> List[Tuple[Key, str]]:
+        """
+        ``(key, name)`` of the documents that failed to resolve one of `names`.
+        """
+        names = list(set(names))
+        res: List[Tuple[Key, str]] = []
+        # stay under the limit of parameters of older sqlite versions.
+        for i in range(0, len(names), 500):
+            chunk = names[i : i + 500]
+            res.extend(
+                (Key(*row[:4]), row[4])
+                for row in self.table.execute(
+                    f"""select {_KEY}, name from unresolved
+                    where name in ({", ".join("?" * len(chunk))})""",
+                    chunk,
+                )
+            )
+        return res
 
-    def _add_edge(self, source: Key, dest: Key):
+    def unresolved(self, module: str) -> List[Tuple[Key, str]]:
         """
-        Add a backward edge from source to dest in dest br file.
+        ``(key, name)`` of all the references the documents of `module` failed
+        to resolve.
         """
-        _, p = self._key_to_paths(dest)
-        if p.path.exists():
-            data = {tuple(x) for x in p.read_json()}
-        else:
-            p.parent.mkdir(parents=True, exist_ok=True)
-            data = set()
-        data.add(source)
-        p.write_json(list(sorted(data)))
+        return [
+            (Key(*row[:4]), row[4])
+            for row in self.table.execute(
+                f"""select {_KEY}, name from unresolved
+                where module=? and name is not NULL""",
+                (module,),
+            )
+        ]
+
+    def unknown_unresolved(self) -> List[Key]:
+        """
+        Documents stored without recording their unresolved references, by
+        versions of papyri that did not do it.
+        """
+        return [
+            Key(*row)
+            for row in self.table.execute(
+                f"select {_KEY} from unresolved where name is NULL"
+            )
+        ]
 
-    def _remove_edge(self, source: Key, dest: Key):
+    def other_versions(self, keys: Iterable[Key]) -> Set[Key]:
         """
-        Remove the edge from `source` to `dest`,
-        that is to say, goes in to `dest` backrefs and remove it.
+        Documents referencing the same module, kind and path as one of `keys`,
+        at another version.
         """
-        assert isinstance(source, Key)
-        assert isinstance(dest, Key)
-        _, p = self._key_to_paths(dest)
-        if p.exists():
-            data = {Key(*x) for x in p.read_json()}
-            data.discard(source)
-            p.write_json(list(sorted(data)))
+        by_kind: Dict[Tuple[str, str], Dict[str, Set[str]]] = defaultdict(
+            lambda: defaultdict(set)
+        )
+        for key in keys:
+            by_kind[(key.module, key.kind)][key.path].add(key.version)
+        res: Set[Key] = set()
+        for (module, kind), paths in by_kind.items():
+            for row in self.table.execute(
+                f"""select distinct {_SOURCE}, dest_path, dest_version from links
+                where dest_module=? and dest_kind=?""",
+                (module, kind),
+            ):
+                path, version = row[4:]
+                if path in paths and version not in paths[path]:
+                    res.add(Key(*row[:4]))
+        return res
 
-    def put(self, key: Key, bytes_, refs) -> None:
+    def is_validated(self, key: Key, schema: str) -> bool:
+        """
+        Whether the document at `key` was validated against `schema` when it
+        was stored.
+        """
+        row = self.table.execute(
+            f"select schema from validated where {_IS_KEY}", tuple(key)
+        ).fetchone()
+        return row is not None and row[0] == schema
+
+    def put(
+        self,
+        key: Key,
+        bytes_,
+        refs,
+        *,
+        schema: Optional[str] = None,
+        unresolved: Iterable[str] = (),
+    ) -> None:
         """
         Store object ``bytes``, as path ``key`` with the corresponding
         links to other objects.
 
         refs : List[Key] ?
 
+        schema : str, optional
+            schema version the document has been validated against, if any;
+            see `is_validated`.
+
+        unresolved : iterable of str
+            references of the document that could not be resolved, see
+            `find_unresolved`.
+
         TODO: refs is forward refs, and we are updating backward believe
         """
         assert isinstance(key, Key)
         for r in refs:
             assert isinstance(r, tuple), r
             assert len(r) == 4
-        path, _ = self._key_to_paths(key)
-        path.path.parent.mkdir(parents=True, exist_ok=True)
+        if self._pending is not None:
+            self._pending[key] = self._stage(key, bytes_)
+        else:
+            self._write(key, bytes_)
 
-        if "assets" not in key and path.exists():
-            __tmp = json.loads(path.read_bytes().decode())
+        with self._transaction():
+            self._release(key)
+            self.table.execute(
+                "insert or replace into documents values (?,?,?,?,?,?)",
+                (*key, *_document_info(bytes_)),
+            )
+            if schema is None:
+                self.table.execute(f"delete from validated where {_IS_KEY}", key)
+            else:
+                self.table.execute(
+                    "insert or replace into validated values (?,?,?,?,?)",
+                    (*key, schema),
+                )
+            old_refs = set(self.get_refs(key))
+            self.table.execute(f"delete from links where {_IS_SOURCE}", key)
+            self.table.executemany(
+                "insert or ignore into links values (?,?,?,?,?,?,?,?,?)",
+                ((*key, *ref, "debug") for ref in set(refs)),
+            )
+            self._invalidate_graphs(key, old_refs ^ {Key(*ref) for ref in refs})
+            self.table.execute(f"delete from unresolved where {_IS_KEY}", key)
+            self.table.executemany(
+                "insert into unresolved values (?,?,?,?,?)",
+                ((*key, name) for name in set(unresolved)),
+            )
 
-            old_refs = {
-                (b["module"], b["version"], b["kind"], b["path"])
-                for b in __tmp.get("refs", [])
-            }
-        else:
-            old_refs = set()
+    def _invalidate_graphs(self, key: Key, changed: Set[Key]) -> None:
+        # the graph of a document is made of its neighbours and of their
+        # backrefs, a new or removed edge key -> dest changes the graphs of
+        # both ends and of the neighbours of dest.
+        if not changed:
+            return
+        stale = {key} | changed
+        for dest in changed:
+            stale.update(self.get_backref(dest))
+            stale.update(self.get_refs(dest))
+        self.table.executemany(f"delete from graphs where {_IS_KEY}", stale)
+
+    def get_graph(self, key: Key) -> Optional[str]:
+        """
+        The graph of the neighbourhood of `key` as put by `put_graph`, None if
+        it is missing or the edges changed since.
+        """
+        row = self.table.execute(
+            f"select data from graphs where {_IS_KEY}", tuple(key)
+        ).fetchone()
+        return None if row is None else row[0]
 
-        path.write_bytes(bytes_)
+    def put_graph(self, key: Key, data: str) -> None:
+        """
+        Store the graph of the neighbourhood of `key`, a document derived from
+        the edges. It is dropped whenever they change in a way that may
+        change it, see `stale_graphs`.
+        """
+        with self._transaction():
+            self.table.execute(
+                "insert or replace into graphs values (?,?,?,?,?)", (*key, data)
+            )
 
-        new_refs = set(refs)
+    def page_digests(self, kind: str = "module") -> Dict[Key, str]:
+        """
+        Digest of each document of `kind` with its backrefs and its graph,
+        what a page showing it depends on in the store.
 
-        removed_refs = old_refs - new_refs
-        added_refs = new_refs - old_refs
+        Documents with no graph, see `stale_graphs`, are not listed.
+        """
+        same_key = " and ".join(f"g.{f}=d.{f}" for f in Key._fields)
+        d_key = ", ".join(f"d.{f}" for f in Key._fields)
+        hashes = {}
+        for *key, digest, data in self.table.execute(
+            f"select {d_key}, d.digest, g.data from documents as d "
+            f"join graphs as g on {same_key} where d.kind=?",
+            (kind,),
+        ):
+            hashes[Key(*key)] = h = sha256(digest.encode())
+            h.update(data.encode())
+        for row in self.table.execute(
+            f"select distinct {_DEST}, {_SOURCE} from links where dest_kind=? "
+            f"order by {_DEST}, {_SOURCE}",
+            (kind,),
+        ):
+            if Key(*row[:4]) in hashes:
+                hashes[Key(*row[:4])].update(json.dumps(row[4:]).encode())
+        return {key: h.hexdigest() for key, h in hashes.items()}
+
+    def stale_graphs(self, kind: str = "module") -> List[Key]:
+        """
+        Keys of the documents of `kind` with no graph, sorted.
+        """
+        same_key = " and ".join(f"g.{f}=d.{f}" for f in Key._fields)
+        d_key = ", ".join(f"d.{f}" for f in Key._fields)
+        return [
+            Key(*row)
+            for row in self.table.execute(
+                f"select {d_key} from documents as d left join graphs as g "
+                f"on {same_key} where d.kind=? and g.data is null order by {d_key}",
+                (kind,),
+            )
+        ]
 
-        #        if removed_refs or added_refs:
-        #            print(key)
-        #            for o in sorted(removed_refs):
-        #                print("    -", o)
-        #            for n in sorted(added_refs):
-        #                print("    +", n)
+    def link(self, key: Key, target: _Path, *, hard: bool = False) -> None:
+        """
+        Make `target` a copy of the document at `key`.
 
-        with self.table:
-            for ref in added_refs:
-                self._add_edge(key, ref)
-                refkey = Key(*ref)
-                self.table.execute(
-                    "insert or ignore into links values (?,?,?)",
-                    (str(key), str(refkey), "debug"),
-                )
-            for ref in removed_refs:
-                refkey = Key(*ref)
-                self._remove_edge(key, refkey)
-                self.table.execute(
-                    "delete from links where source=? and dest=? and reason=?",
-                    (str(key), str(refkey), "debug"),
-                )
+        Parameters
+        ----------
+        hard : bool
+            make `target` a hard link to the document when possible. The
+            documents of assets are read-only, as they may be shared, and so
+            would be `target`.
+        """
+        if target.exists():
+            target.unlink()
+        if hard:
+            try:
+                os.link(self._key_to_path(key).path, target)
+                return
+            except OSError:
+                pass
+        target.write_bytes(self.get(key))
+
+    def put_many(
+        self,
+        documents: Iterable[Tuple[Key, bytes, Sequence[tuple]]],
+        *,
+        schema: Optional[str] = None,
+    ) -> None:
+        """
+        `put` all the ``(key, bytes, refs)`` of `documents` in one batch.
+
+        See Also
+        --------
+        batch
+        """
+        with self.batch():
+            for key, bytes_, refs in documents:
+                self.put(key, bytes_, refs, schema=schema)
+
+    def glob(self, pattern) -> List[Any]:
+        """
+        Keys of the documents matching `pattern`, from the documents index.
+
+        Parameters
+        ----------
+        pattern : tuple
+            up to 4 items, each one being None to match anything, an exact
+            value, or a sqlite GLOB pattern with ``*``, ``?`` or ``[``.
 
-    def glob(self, pattern) -> List[Key]:
-        acc = ""
-        for p in pattern:
+        Returns
+        -------
+        keys : list
+            sorted `Key` for 4 items patterns, otherwise distinct tuples of
+            the first ``len(pattern)`` fields, like ``(module, version)``.
+        """
+        pattern = tuple(pattern)
+        assert 0 < len(pattern) <= 4, pattern
+        fields = Key._fields[: len(pattern)]
+        where = []
+        args = []
+        for field, p in zip(fields, pattern):
             if p is None:
-                acc += "/*"
-            else:
-                acc += "/" + p
-        acc = acc[1:]
-        try:
-            res = [
-                self._path_to_key(p)
-                for p in self._root.glob(acc)
-                if not p.name.endswith(".br")
-            ]  # !!
-        except Exception as e:
-            raise type(e)("Acc:" + acc, pattern)
-        return res
+                continue
+            where.append(f"{field} GLOB ?" if set("*?[") & set(p) else f"{field}=?")
+            args.append(p)
+        columns = ", ".join(fields)
+        # keys are unique, shorter prefixes are not.
+        distinct = "" if len(pattern) == 4 else "distinct "
+        sql = f"select {distinct}{columns} from documents"
+        if where:
+            sql += " where " + " and ".join(where)
+        rows = self.table.execute(sql + f" order by {columns}", args)
+        if len(pattern) == 4:
+            return [Key(*row) for row in rows]
+        return [tuple(row) for row in rows]
@@ -62,11 +62,16 @@ either 2 Authors or 2 Reviewers.
 - it is also compatible with Rust Serde with adjacently tagged Unions (not
       critical but nice to have)
 
-"""
+The first time an annotation is seen, a specialised function to serialise
+(resp. de-serialise) it is generated and cached, see `_serializer` and
+`_deserializer`. Those do not describe errors; on failure the annotation is
+interpreted again with `_serialize` (resp. `_deserialize`), which gives the
+same result or a detailed error message.
 
+"""
 
 from functools import lru_cache
-from typing import Union
+from typing import Any, Callable, Dict, Union
 from typing import get_type_hints as gth
 
 base_types = {int, str, bool, type(None)}
@@ -78,6 +83,225 @@ def get_type_hints(type_):
 
 
 def serialize(instance, annotation):
+    try:
+        return _serializer(annotation)(instance)
+    except Exception:
+        pass
+    return _serialize(instance, annotation)
+
+
+# type_ and annotation are _likely_ duplicate here as an annotation is likely a type, or  a List, Union, ....)
+def deserialize(type_, annotation, data):
+    try:
+        return _deserializer(annotation)(data)
+    except Exception:
+        pass
+    return _deserialize(type_, annotation, data)
+
+
+class _Mismatch(Exception):
+    """
+    Raised by generated functions when an instance does not match its
+    annotation.
+    """
+
+
+_serializers: Dict[Any, Callable[[Any], Any]] = {}
+_deserializers: Dict[Any, Callable[[Any], Any]] = {}
+
+
+def _is_optional(args) -> bool:
+    return len(args) == 2 and args[1] == type(None)
+
+
+def _serializer(annotation) -> Callable[[Any], Any]:
+    """
+    Function serialising an instance of `annotation`, like `_serialize`
+    but without re-inspecting the annotation.
+    """
+    try:
+        return _serializers[annotation]
+    except KeyError:
+        pass
+    orig = getattr(annotation, "__origin__", None)
+    if annotation in base_types:
+
+        def ser(instance):
+            if isinstance(instance, annotation):
+                return instance
+            raise _Mismatch
+
+    elif orig is tuple:
+        inner = _serializer(annotation.__args__[0])
+
+        def ser(instance):
+            if not isinstance(instance, tuple):
+                raise _Mismatch
+            return tuple([inner(x) for x in instance])
+
+    elif orig is list:
+        inner = _serializer(annotation.__args__[0])
+
+        def ser(instance):
+            if not isinstance(instance, list):
+                raise _Mismatch
+            return [inner(x) for x in instance]
+
+    elif orig is dict:
+        inner = _serializer(annotation.__args__[1])
+
+        def ser(instance):
+            return {k: inner(v) for k, v in instance.items()}
+
+    elif orig is Union and _is_optional(annotation.__args__):
+        inner = _serializer(annotation.__args__[0])
+
+        def ser(instance):
+            if instance is None:
+                return None
+            return inner(instance)
+
+    elif orig is Union:
+        tags: Dict[type, Any] = {}
+        for t in annotation.__args__:
+            tags.setdefault(t, (t.__name__, _serializer(t)))
+
+        def ser(instance):
+            try:
+                tag, inner = tags[type(instance)]
+            except KeyError:
+                raise _Mismatch
+            return {"type": tag, "data": inner(instance)}
+
+    elif orig is None and isinstance(annotation, type):
+        return _compile_serializer(annotation)
+    else:
+
+        def ser(instance):
+            return _serialize(instance, annotation)
+
+    _serializers[annotation] = ser
+    return ser
+
+
+def _compile_serializer(cls: type) -> Callable[[Any], Any]:
+    hints = list(get_type_hints(cls).items())
+    ns: Dict[str, Any] = {"cls": cls, "_Mismatch": _Mismatch}
+    lines = [
+        "def serialize(instance):",
+        "    if type(instance) is not cls:",
+        "        raise _Mismatch",
+    ]
+    if not hints:
+        lines.append("    raise _Mismatch")
+    if hasattr(cls, "_validate"):
+        lines.append("    instance._validate()")
+    items = []
+    for i, (k, ann) in enumerate(hints):
+        if ann in base_types:
+            ns[f"t{i}"] = ann
+            lines.append(f"    v{i} = instance.{k}")
+            lines.append(f"    if not isinstance(v{i}, t{i}):")
+            lines.append("        raise _Mismatch")
+            items.append(f"{k!r}: v{i}")
+        else:
+            items.append(f"{k!r}: s{i}(instance.{k})")
+    lines.append("    return {" + ", ".join(items) + "}")
+    exec("\n".join(lines), ns)
+    # registered before compiling the fields, for recursive annotations.
+    ser = _serializers[cls] = ns["serialize"]
+    for i, (_, ann) in enumerate(hints):
+        if ann not in base_types:
+            ns[f"s{i}"] = _serializer(ann)
+    return ser
+
+
+def _deserializer(annotation) -> Callable[[Any], Any]:
+    """
+    Function de-serialising data of `annotation`, like `_deserialize` but
+    without re-inspecting the annotation.
+    """
+    try:
+        return _deserializers[annotation]
+    except KeyError:
+        pass
+    orig = getattr(annotation, "__origin__", None)
+    if annotation in (str, int, bool):
+
+        def de(data):
+            return data
+
+    elif orig is tuple:
+        inner = _deserializer(annotation.__args__[0])
+
+        def de(data):
+            return tuple([inner(x) for x in data])
+
+    elif orig is list:
+        inner = _deserializer(annotation.__args__[0])
+
+        def de(data):
+            return [inner(x) for x in data]
+
+    elif orig is dict:
+        inner = _deserializer(annotation.__args__[1])
+
+        def de(data):
+            return {k: inner(x) for k, x in data.items()}
+
+    elif orig is Union and _is_optional(annotation.__args__):
+        inner = _deserializer(annotation.__args__[0])
+
+        def de(data):
+            if data is None:
+                return None
+            return inner(data)
+
+    elif orig is Union:
+        tags: Dict[str, Any] = {}
+        for t in annotation.__args__:
+            tags.setdefault(t.__name__, t)
+        tagged = {name: _deserializer(t) for name, t in tags.items()}
+
+        def de(data):
+            return tagged[data["type"]](data["data"])
+
+    elif (
+        orig is None
+        and type(annotation) is type
+        and annotation.__module__ not in ("builtins", "typing")
+    ):
+        return _compile_deserializer(annotation)
+    else:
+
+        def de(data):
+            return _deserialize(annotation, annotation, data)
+
+    _deserializers[annotation] = de
+    return de
+
+
+def _compile_deserializer(cls: type) -> Callable[[Any], Any]:
+    hints = list(get_type_hints(cls).items())
+    factory = cls._deserialise if hasattr(cls, "_deserialise") else cls
+    ns: Dict[str, Any] = {"factory": factory}
+    args = []
+    for i, (k, ann) in enumerate(hints):
+        if ann in (str, int, bool):
+            args.append(f"{k}=data[{k!r}]")
+        else:
+            args.append(f"{k}=d{i}(data[{k!r}])")
+    src = "def deserialize(data):\n    return factory(" + ", ".join(args) + ")"
+    exec(src, ns)
+    # registered before compiling the fields, for recursive annotations.
+    de = _deserializers[cls] = ns["deserialize"]
+    for i, (_, ann) in enumerate(hints):
+        if ann not in (str, int, bool):
+            ns[f"d{i}"] = _deserializer(ann)
+    return de
+
+
+def _serialize(instance, annotation):
     # print("will serialise", type(instance), "as", annotation)
     exception_already_desribed = False
     try:
@@ -89,18 +313,18 @@ def serialize(instance, annotation):
             # this may be slightly incorrect as usually tuple as positionally type dependant.
             inner_annotation = annotation.__args__
             # assert len(inner_annotation) == 1, inner_annotation
-            return tuple(serialize(x, inner_annotation[0]) for x in instance)
+            return tuple(_serialize(x, inner_annotation[0]) for x in instance)
         elif getattr(annotation, "__origin__", None) is list and isinstance(
             instance, list
         ):
             inner_annotation = annotation.__args__
             # assert len(inner_annotation) == 1, inner_annotation
-            return [serialize(x, inner_annotation[0]) for x in instance]
+            return [_serialize(x, inner_annotation[0]) for x in instance]
         elif getattr(annotation, "__origin__", None) is dict:
             # assert type(instance) == dict
             key_annotation, value_annotation = annotation.__args__
             # assert key_annotation == str, key_annotation
-            return {k: serialize(v, value_annotation) for k, v in instance.items()}
+            return {k: _serialize(v, value_annotation) for k, v in instance.items()}
 
         elif getattr(annotation, "__origin__", None) is Union:
 
@@ -111,14 +335,14 @@ def serialize(instance, annotation):
                 if instance is None:
                     return None
                 else:
-                    return serialize(instance, inner_annotation[0])
+                    return _serialize(instance, inner_annotation[0])
             assert (
                 type(instance) in inner_annotation
             ), f"{type(instance)} not in {inner_annotation}, {instance} or type {type(instance)}"
             ma = [x for x in inner_annotation if type(instance) is x]
             # assert len(ma) == 1
             ann_ = ma[0]
-            return {"type": ann_.__name__, "data": serialize(instance, ann_)}
+            return {"type": ann_.__name__, "data": _serialize(instance, ann_)}
         elif (
             (type(annotation) is type)
             and type.__module__ not in ("builtins", "typing")
@@ -130,7 +354,7 @@ def serialize(instance, annotation):
             data = {}
             for k, v in get_type_hints(type(instance)).items():
                 try:
-                    data[k] = serialize(getattr(instance, k), v)
+                    data[k] = _serialize(getattr(instance, k), v)
                 except Exception as e:
                     exception_already_desribed = True
                     raise type(e)(f"Error serializing field {k!r} of {instance!r}")
@@ -154,8 +378,7 @@ def serialize(instance, annotation):
         ) from e
 
 
-# type_ and annotation are _likely_ duplicate here as an annotation is likely a type, or  a List, Union, ....)
-def deserialize(type_, annotation, data):
+def _deserialize(type_, annotation, data):
     # assert type_ is annotation
     # assert annotation != {}
     # assert annotation is not dict
@@ -176,20 +399,20 @@ def deserialize(type_, annotation, data):
             inner_annotation = annotation.__args__
             # assert len(inner_annotation) == 1, inner_annotation
             return tuple(
-                deserialize(inner_annotation[0], inner_annotation[0], x) for x in data
+                _deserialize(inner_annotation[0], inner_annotation[0], x) for x in data
             )
         elif orig is list:
             # assert isinstance(data, list)
             inner_annotation = annotation.__args__
             # assert len(inner_annotation) == 1, inner_annotation
             return [
-                deserialize(inner_annotation[0], inner_annotation[0], x) for x in data
+                _deserialize(inner_annotation[0], inner_annotation[0], x) for x in data
             ]
         elif orig is dict:
             # assert isinstance(data, dict)
             _, value_annotation = annotation.__args__
             return {
-                k: deserialize(value_annotation, value_annotation, x)
+                k: _deserialize(value_annotation, value_annotation, x)
                 for k, x in data.items()
             }
         elif orig is Union:
@@ -199,11 +422,11 @@ def deserialize(type_, annotation, data):
                 if data is None:
                     return None
                 else:
-                    return deserialize(inner_annotation[0], inner_annotation[0], data)
+                    return _deserialize(inner_annotation[0], inner_annotation[0], data)
             real_type = [t for t in inner_annotation if t.__name__ == data["type"]]
             # assert len(real_type) == 1, real_type
             real_type = real_type[0]
-            return deserialize(real_type, real_type, data["data"])
+            return _deserialize(real_type, real_type, data["data"])
         else:
             assert False
     elif (type(annotation) is type) and annotation.__module__ not in (
@@ -217,7 +440,7 @@ def deserialize(type_, annotation, data):
             # assert k in data.keys(), f"{k} not int {data.keys()}"
             # if data[k] != 0:
             #     assert data[k] != {}, f"{data}, {k}"
-            intermediate = deserialize(v, v, data[k])
+            intermediate = _deserialize(v, v, data[k])
             # assert intermediate != {}, f"{v}, {data}, {k}"
             loc[k] = intermediate
         if hasattr(annotation, "_deserialise"):
@@ -3,12 +3,21 @@ Misc helper functions
 """
 
 import io
+import os
 import sys
 import ast
+import atexit
+import importlib
+import pickle
+import select
+import subprocess
 
 from rich.progress import Progress
 
 from contextlib import redirect_stdout, redirect_stderr, contextmanager
+from typing import Any, Dict, Optional
+
+from .errors import SandboxError, SandboxTimeoutError
 
 
 @contextmanager
@@ -63,10 +72,13 @@ class BlockExecutor:
         assert (len(self.fig_man())) == 0, f"init fail in {len(self.fig_man())}"
 
     def __exit__(self, *args, **kwargs):
+        self.close_figs()
+        assert (len(self.fig_man())) == 0, f"init fail in {len(self.fig_man())}"
+
+    def close_figs(self):
         import matplotlib.pyplot as plt
 
         plt.close("all")
-        assert (len(self.fig_man())) == 0, f"init fail in {len(self.fig_man())}"
 
     def fig_man(self):
         from matplotlib import _pylab_helpers
@@ -118,3 +130,241 @@ class BlockExecutor:
         stdout.seek(0)
         stderr.seek(0)
         return res, fig_managers, stdout.read(), stderr.read()
+
+
+def import_object(name: str) -> Any:
+    """
+    Import an object given its fully qualified name.
+
+    The name can either be of the form ``module:attribute.attribute``, or a
+    dotted name, in which case the longest importable prefix is the module.
+    """
+    if ":" in name:
+        mod_name, _, attrs = name.partition(":")
+        obj = importlib.import_module(mod_name)
+        parts = attrs.split(".") if attrs else []
+    else:
+        parts = name.split(".")
+        for i in range(len(parts), 0, -1):
+            try:
+                obj = importlib.import_module(".".join(parts[:i]))
+            except ImportError:
+                continue
+            parts = parts[i:]
+            break
+        else:
+            raise ImportError(f"Could not import {name!r}")
+    for part in parts:
+        obj = getattr(obj, part)
+    return obj
+
+
+def _sandbox_main():
+    """
+    Main loop of a `SandboxedExecutor` worker process.
+
+    Requests are read from stdin and replies are written to stdout as pickles;
+    the code we execute sees /dev/null as stdin and stderr as stdout.
+    """
+    requests = os.fdopen(os.dup(0), "rb")
+    replies = os.fdopen(os.dup(1), "wb")
+    os.dup2(os.open(os.devnull, os.O_RDONLY), 0)
+    os.dup2(2, 1)
+
+    memory_limit = int(sys.argv[1])
+    if memory_limit:
+        try:
+            import resource
+
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        except (ImportError, ValueError, OSError):
+            print("Could not limit memory of sandbox", file=sys.stderr)
+
+    executor = None
+    while True:
+        try:
+            command, arg = pickle.load(requests)
+        except EOFError:
+            return
+        try:
+            if command == "init":
+                ns = {}
+                for key, name in arg.items():
+                    try:
+                        ns[key] = import_object(name)
+                    except Exception:
+                        print(f"Could not import {name} in sandbox", file=sys.stderr)
+                executor = BlockExecutor(ns)
+                executor.close_figs()
+                reply: Any = None
+            elif command == "exec":
+                res, fig_managers, sout, serr = executor.exec(arg)
+                reply = (
+                    None if res is None else repr(res),
+                    len(fig_managers),
+                    sout,
+                    serr,
+                )
+            elif command == "fig_man":
+                reply = len(executor.fig_man())
+            elif command == "get_figs":
+                reply = executor.get_figs()
+            elif command == "close_figs":
+                executor.close_figs()
+                reply = None
+            else:
+                raise ValueError(f"Unknown sandbox command {command!r}")
+            pickle.dump(("ok", reply), replies)
+        except Exception as e:
+            try:
+                data = pickle.dumps(e)
+            except Exception:
+                data = pickle.dumps(SandboxError(f"{type(e).__name__}: {e}"))
+            pickle.dump(("error", data), replies)
+        replies.flush()
+
+
+class _SandboxWorker:
+    """
+    Handle on a worker process of `SandboxedExecutor`.
+    """
+
+    def __init__(self, memory_limit: Optional[int]):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(p for p in sys.path if p)
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "from papyri.miscs import _sandbox_main; _sandbox_main()",
+                str(memory_limit or 0),
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+        )
+        self.executions = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def request(self, command: str, arg: Any, timeout: Optional[float]) -> Any:
+        assert self.process.stdin is not None
+        assert self.process.stdout is not None
+        try:
+            pickle.dump((command, arg), self.process.stdin)
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            self.kill()
+            raise SandboxError("Sandbox worker died") from None
+        readable, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not readable:
+            self.kill()
+            raise SandboxTimeoutError(f"Sandbox {command} timed out after {timeout}s")
+        try:
+            status, reply = pickle.load(self.process.stdout)
+        except EOFError:
+            self.kill()
+            raise SandboxError(
+                f"Sandbox worker died with exit code {self.process.returncode}"
+            ) from None
+        if status == "error":
+            try:
+                exc = pickle.loads(reply)
+            except Exception:
+                exc = SandboxError("Sandbox error could not be unpickled")
+            raise exc
+        return reply
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.wait()
+
+    def close(self) -> None:
+        if self.alive:
+            assert self.process.stdin is not None
+            self.process.stdin.close()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.kill()
+
+
+# one worker per process, as `gen --jobs` fork processes.
+_SANDBOX_WORKERS: Dict[int, _SandboxWorker] = {}
+
+
+@atexit.register
+def _close_sandbox_workers():
+    worker = _SANDBOX_WORKERS.pop(os.getpid(), None)
+    if worker is not None:
+        worker.close()
+
+
+class SandboxedExecutor:
+    """
+    A `BlockExecutor` that runs code in a long lived worker process.
+
+    A code block that runs for more than ``timeout`` seconds (or crashes the
+    worker) raises a `SandboxTimeoutError` (or a `SandboxError`) and the
+    worker is restarted; the state of previous blocks is then lost. The
+    worker memory can be limited to ``memory_limit`` bytes, and it is
+    restarted every ``recycle`` executed blocks to limit the state leaking
+    from one object to the next.
+
+    As the namespace lives in the worker, it is given as a mapping of names
+    to fully qualified names of the objects to import there. Values of code
+    blocks are returned as their repr, and figures as PNG bytes.
+    """
+
+    def __init__(
+        self,
+        spec: Dict[str, str],
+        *,
+        timeout: Optional[float] = None,
+        memory_limit: Optional[int] = None,
+        recycle: Optional[int] = None,
+    ):
+        self.spec = spec
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        worker = _SANDBOX_WORKERS.get(os.getpid())
+        if worker is not None and recycle and worker.executions >= recycle:
+            worker.close()
+            del _SANDBOX_WORKERS[os.getpid()]
+        self._initialized: Optional[_SandboxWorker] = None
+
+    def _request(self, command: str, arg: Any = None) -> Any:
+        worker = _SANDBOX_WORKERS.get(os.getpid())
+        if worker is None or not worker.alive:
+            worker = _SANDBOX_WORKERS[os.getpid()] = _SandboxWorker(self.memory_limit)
+        if self._initialized is not worker:
+            # the timeout is for code blocks, not for starting the worker.
+            worker.request("init", self.spec, None)
+            self._initialized = worker
+        return worker.request(command, arg, self.timeout)
+
+    def __enter__(self):
+        assert (len(self.fig_man())) == 0, f"init fail in {len(self.fig_man())}"
+
+    def __exit__(self, *args, **kwargs):
+        self.close_figs()
+        assert (len(self.fig_man())) == 0, f"init fail in {len(self.fig_man())}"
+
+    def close_figs(self):
+        self._request("close_figs")
+
+    def fig_man(self):
+        return list(range(self._request("fig_man")))
+
+    def get_figs(self):
+        return self._request("get_figs")
+
+    def exec(self, text):
+        try:
+            res, n_figs, sout, serr = self._request("exec", text)
+        finally:
+            if os.getpid() in _SANDBOX_WORKERS:
+                _SANDBOX_WORKERS[os.getpid()].executions += 1
+        return res, list(range(n_figs)), sout, serr
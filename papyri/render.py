@@ -1,6 +1,7 @@
 import builtins
 import json
 import logging
+import multiprocessing
 import operator
 import os
 import random
@@ -8,23 +9,34 @@ import shutil
 from collections import OrderedDict, defaultdict
 from dataclasses import dataclass
 from functools import lru_cache
+from hashlib import sha256
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
 
 from flatlatex import converter
 from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
 from pygments.formatters import HtmlFormatter
-from quart import redirect
+from quart import Response, redirect, request
 from quart_trio import QuartTrio
 from rich.logging import RichHandler
 from there import print
 
+from . import __version__ as papyri_version
 from . import config as default_config
 from .config import ingest_dir
-from .crosslink import IngestedBlobs, RefInfo, find_all_refs, load_one
+from .crosslink import (
+    IngestedBlobs,
+    RefInfo,
+    compute_graph,
+    find_all_refs,
+    load_one,
+    validate_on_load,
+)
+from .encodings import loads
 from .graphstore import GraphStore, Key
 from .stores import Store
 from .take2 import RefInfo
+from .tree import resolver_cache
 from .utils import progress
 
 FORMAT = "%(message)s"
@@ -61,7 +73,7 @@ class CleanLoader(FileSystemLoader):
     """
 
     def get_source(self, *args, **kwargs):
-        (source, filename, uptodate) = super().get_source(*args, **kwargs)
+        source, filename, uptodate = super().get_source(*args, **kwargs)
         return until_ruler(source), filename, uptodate
 
 
@@ -102,7 +114,7 @@ async def examples(module, store, version, subpath, ext="", sidebar=None):
     efile = store / module / version / "examples" / subpath
     from .take2 import Section
 
-    ex = Section.from_json(json.loads(await efile.read_text()))
+    ex = Section.from_json(loads(await efile.read_bytes()))
 
     class Doc:
         pass
@@ -144,15 +156,7 @@ async def examples(module, store, version, subpath, ext="", sidebar=None):
 
 def compute_siblings_II(ref, family: set):
     """ """
-    from collections import defaultdict
-
-    module_versions = defaultdict(lambda: set())
-    for f in family:
-        module_versions[f.module].add(f.version)
-
-    module_versions_max = {k: max(v) for k, v in module_versions.items()}
-
-    family = {f for f in family if f.version == module_versions_max[f.module]}
+    family = _latest_family(family)
 
     parts = ref.split(".") + ["+"]
     siblings = OrderedDict()
@@ -175,6 +179,97 @@ def compute_siblings_II(ref, family: set):
     return siblings
 
 
+def _latest_family(family):
+    # only the latest version of each module is used for navigation.
+    module_versions = defaultdict(lambda: set())
+    for f in family:
+        module_versions[f.module].add(f.version)
+
+    module_versions_max = {k: max(v) for k, v in module_versions.items()}
+
+    return {f for f in family if f.version == module_versions_max[f.module]}
+
+
+@dataclass(frozen=True)
+class RefsSnapshot:
+    """
+    What ``papyri serve`` knows about the graph store at a given generation.
+
+    It is built once per generation of the store, see
+    `GraphStore.generation`, and shared by all the requests so that they
+    don't need to scan the store.
+
+    Attributes
+    ----------
+    generation : int
+        generation of the store the snapshot was taken at.
+    known_refs : frozenset of RefInfo
+    ref_map : dict
+        path -> RefInfo, as returned by `find_all_refs`.
+    children : dict
+        ``"numpy.linalg."`` -> sorted ``(RefInfo, name)`` of the objects
+        directly under ``numpy.linalg``; the empty prefix lists the top level
+        modules. The qualname tree used for navigation, see `siblings`.
+    digest : str
+        digest of the known references, it changes iff they do.
+    """
+
+    generation: int
+    known_refs: FrozenSet[RefInfo]
+    ref_map: Dict[str, RefInfo]
+    children: Dict[str, List[Tuple[RefInfo, str]]]
+    digest: str
+
+    @classmethod
+    def from_store(cls, gstore: GraphStore) -> "RefsSnapshot":
+        # read before the documents, a snapshot is never newer than its
+        # generation.
+        generation = gstore.generation()
+        known_refs, ref_map = find_all_refs(gstore)
+        children = defaultdict(set)
+        for f in _latest_family(known_refs):
+            if "." not in f.path:
+                continue
+            parts = f.path.split(".")
+            for i in range(len(parts)):
+                prefix = "".join(p + "." for p in parts[:i])
+                children[prefix].add(
+                    RefInfo(f.module, f.version, "api", ".".join(parts[: i + 1]))
+                )
+        return cls(
+            generation,
+            known_refs,
+            ref_map,
+            {
+                prefix: [
+                    (c, c.path.split(".")[-1])
+                    for c in sorted(cs, key=operator.attrgetter("path"))
+                ]
+                for prefix, cs in children.items()
+            },
+            sha256(
+                json.dumps(
+                    sorted((r.module, r.version, r.kind, r.path) for r in known_refs)
+                ).encode()
+            ).hexdigest(),
+        )
+
+    def siblings(self, ref: str):
+        """
+        Same as ``compute_siblings_II(ref, self.known_refs)``, from the
+        precomputed tree.
+        """
+        parts = ref.split(".") + ["+"]
+        siblings = OrderedDict()
+        cpath = ""
+        for part in parts:
+            siblings[part] = self.children.get(cpath, [])
+            cpath += part + "."
+        if not siblings["+"]:
+            del siblings["+"]
+        return siblings
+
+
 def make_tree(names):
 
     rd = lambda: defaultdict(rd)
@@ -240,82 +335,18 @@ def cs2(ref, tree, ref_map):
     return siblings
 
 
-def compute_graph(gs, blob, key):
-    # nodes_names = [b.path for b in blob.backrefs + blob.refs] + [key[3]]
-    # nodes_names = [n for n in nodes_names if n.startswith('numpy')]
-    weights = {}
-
-    all_nodes = [tuple(x) for x in blob.backrefs + blob.refs]
-
-    raw_edges = []
-    for k in blob.backrefs + blob.refs:
-        name = tuple(k)[3]
-        neighbors_refs = gs.get_backref(tuple(k))
-        weights[name] = len(neighbors_refs)
-        orig = [x[3] for x in neighbors_refs]
-        all_nodes.extend([tuple(x) for x in neighbors_refs])
-        for o in orig:
-            raw_edges.append((k.path, o))
-
-    data = {"nodes": [], "links": []}
-
-    if len(weights) > 50:
-        for thresh in sorted(set(weights.values())):
-            log.info("%s items ; remove items %s or lower", len(weights), thresh)
-            weights = {k: v for k, v in weights.items() if v > thresh}
-            log.info("down to %s items", len(weights))
-            if len(weights) < 50:
-                break
-
-    all_nodes = set(all_nodes)
-    nums_ = set()
-    edges = list(raw_edges)
-    nodes = list(set(weights.keys()))
-    for a, b in edges:
-        if (a not in nodes) or (b not in nodes):
-            continue
-        nums_.add(a)
-        nums_.add(b)
-    nums = {x: i for i, x in enumerate(nodes, start=1)}
-
-    for i, (from_, to) in enumerate(edges):
-        if from_ == to:
-            continue
-        if from_ not in nodes:
-            continue
-        if to not in nodes:
-            continue
-        if key[3] in (to, from_):
-            continue
-        data["links"].append({"source": nums[from_], "target": nums[to], "id": i})
-
-    for node in nodes:
-        diam = 8
-        if node == key[3]:
-            continue
-            diam = 18
-        elif node in weights:
-            import math
-
-            diam = 8 + math.sqrt(weights[node])
-
-        candidates = [n for n in all_nodes if n[3] == node and "??" not in n]
-        if not candidates:
-            uu = None
-        else:
-            # TODO : be smarter when we have multiple versions. Here we try to pick the latest one.
-            latest_version = list(sorted(candidates))[-1]
-            uu = url(RefInfo(*latest_version))
+def load_graph(gs, key):
+    """
+    Data of the graph of the neighbourhood of `key`, for the d3 template.
 
-        data["nodes"].append(
-            {
-                "id": nums[node],
-                "val": diam,
-                "label": node,
-                "mod": ".".join(node.split(".")[0:1]),
-                "url": uu,
-            }
-        )
+    The graph is computed at ingest and relink, see `crosslink.compute_graph`,
+    it is only computed here for stores that have not been relinked since.
+    """
+    raw = gs.get_graph(key)
+    data = json.loads(raw) if raw is not None else compute_graph(gs, key)
+    for node in data["nodes"]:
+        k = node.pop("key")
+        node["url"] = None if k is None else url(RefInfo(*k))
     return data
 
 
@@ -323,14 +354,127 @@ async def _route_data(gstore, ref, version, known_refs):
     print("!!", ref)
     root = ref.split("/")[0].split(".")[0]
     key = Key(root, version, "module", ref)
-    gbytes = gstore.get(key).decode()
-    x_, y_ = find_all_refs(gstore)
-    doc_blob = load_one(gbytes, b"[]", known_refs=known_refs, strict=True)
-    return x_, y_, doc_blob
+    gbytes = gstore.get(key)
+    doc_blob = load_one(
+        gbytes,
+        b"[]",
+        known_refs=known_refs,
+        strict=True,
+        validate=validate_on_load(),
+    )
+    return doc_blob
+
+
+class PageCache:
+    """
+    LRU of the html of the pages served by ``papyri serve``.
+
+    Each page has an ETag derived from everything it depends on, see
+    `GraphStore.neighbourhood_digest`, and is tagged with the generation of
+    the store it was last checked at. While the generation does not change
+    pages are served straight from memory; after a write their ETag is
+    computed again, and only the pages that changed are rendered again.
+
+    Parameters
+    ----------
+    maxsize : int
+        maximum number of pages kept in memory.
+    directory : Path, optional
+        where to also write the pages, by key and ETag, to keep them across
+        restarts and when they are evicted from memory. Only the last version
+        of each page is kept.
+    """
+
+    def __init__(self, maxsize: int = 256, directory: Optional[Path] = None):
+        self.maxsize = maxsize
+        self.directory = directory
+        if directory is not None:
+            directory.mkdir(parents=True, exist_ok=True)
+        # key -> (generation, etag, html), the least recently used first.
+        self._pages: Dict[Key, Tuple[int, str, str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Key, generation: int) -> Optional[Tuple[str, str]]:
+        """
+        ETag and html of the page of `key`, if it was checked at `generation`.
+        """
+        entry = self._pages.get(key)
+        if entry is None or entry[0] != generation:
+            return None
+        self.hits += 1
+        self._store(key, *entry)
+        return entry[1], entry[2]
+
+    def revalidate(self, key: Key, generation: int, etag: str) -> Optional[str]:
+        """
+        Html of the page of `key` with this `etag`, from memory or from disk.
+
+        The page is then known to be valid at `generation`.
+        """
+        entry = self._pages.get(key)
+        html = None
+        if entry is not None and entry[1] == etag:
+            html = entry[2]
+        elif self.directory is not None:
+            path = self._page_dir(key) / f"{etag}.html"
+            if path.exists():
+                html = path.read_text()
+        if html is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._store(key, generation, etag, html)
+        return html
+
+    def put(self, key: Key, generation: int, etag: str, html: str) -> None:
+        self._store(key, generation, etag, html)
+        if self.directory is None:
+            return
+        page_dir = self._page_dir(key)
+        page_dir.mkdir(parents=True, exist_ok=True)
+        path = page_dir / f"{etag}.html"
+        # a page interrupted while being written is never served.
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(html)
+        os.replace(tmp, path)
+        for old in page_dir.glob("*.html"):
+            if old != path:
+                old.unlink()
+
+    def _page_dir(self, key: Key) -> Path:
+        assert self.directory is not None
+        return self.directory.joinpath(*key)
+
+    def _store(self, key: Key, generation: int, etag: str, html: str) -> None:
+        self._pages.pop(key, None)
+        if len(self._pages) >= self.maxsize:
+            del self._pages[next(iter(self._pages))]
+        self._pages[key] = (generation, etag, html)
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def stats(self):
+        """
+        Size and hit rate of the cache, for monitoring.
+        """
+        total = self.hits + self.misses
+        return {
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+# the kind of the pages in the gallery index, and where they are served.
+_GALLERY_KINDS = {"module": "api", "examples": "examples"}
 
 
 class HtmlRenderer:
-    def __init__(self, store, *, sidebar, old_store):
+    def __init__(self, store, *, sidebar, old_store, pages=None):
         self.store = store
         self.old_store = old_store
         prefix = "/p/"
@@ -345,48 +489,56 @@ class HtmlRenderer:
         self.env.globals["prefix"] = prefix
         self.env.globals["sidebar"] = sidebar
         self.sidebar = sidebar
+        self._snapshot: Optional[RefsSnapshot] = None
+        self.pages = PageCache() if pages is None else pages
 
-    async def gallery(self, module, version, ext=""):
-
-        figmap = defaultdict(lambda: [])
-        res = self.store.glob((module, version, "assets", None))
-        backrefs = set()
-        for key in res:
-            brs = {tuple(x) for x in self.store.get_backref(key)}
-            backrefs = backrefs.union(brs)
-
-        for key in backrefs:
-            data = json.loads(self.store.get(Key(*key)).decode())
-            data["backrefs"] = []
-
-            i = IngestedBlobs.from_json(data)
-            i.process(frozenset(), {})
-
-            for k in [
-                u.value for u in i.example_section_data if u.__class__.__name__ == "Fig"
-            ]:
-                module, v, kind, _path = key
-                # module, filename, link
-                impath = f"/p/{module}/{v}/img/{k}"
-                link = f"/p/{module}/{v}/api/{_path}"
-                # figmap.append((impath, link, name)
-                figmap[module].append((impath, link, _path))
-
-        for target_path in self.old_store.glob(f"{module}/{version}/examples/*"):
-            data = json.loads(await target_path.read_text())
-            from .take2 import Section
+    def snapshot(self) -> RefsSnapshot:
+        """
+        The `RefsSnapshot` of the current generation of the store.
 
-            s = Section.from_json(data)
+        A new snapshot replaces the previous one when the store changed, the
+        requests in flight keep the one they started with.
+        """
+        generation = self.store.generation()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.generation != generation:
+            # the known references of a previous state of the store won't be
+            # seen again.
+            resolver_cache.set_generation(generation)
+            snapshot = RefsSnapshot.from_store(self.store)
+            self._snapshot = snapshot
+        return snapshot
+
+    async def gallery(self, module, version=None, ext=""):
+        """
+        Render the gallery of the figures of `module`.
 
-            for k in [u.value for u in s.children if u.__class__.__name__ == "Fig"]:
-                module, v, _, _path = target_path.path.parts[-4:]
+        The gallery is rendered from the gallery indices written at ingest,
+        see `papyri.crosslink.Ingester._write_gallery_index`.
 
+        Parameters
+        ----------
+        module : str
+            ``"*"`` for the figures of all the modules.
+        version : str, optional
+            all the versions by default.
+        """
+        figmap = defaultdict(lambda: [])
+        indices = self.store.glob((module, version, "meta", "gallery.json"))
+        if not indices and self.store.glob((module, version)):
+            # ingested before the gallery indices existed.
+            log.warning(
+                "No gallery index for %s %s, run `papyri relink` to write it",
+                module,
+                version or "",
+            )
+        for key in indices:
+            for kind, path, figure in json.loads(self.store.get(key)):
                 # module, filename, link
-                impath = f"/p/{module}/{v}/img/{k}"
-                link = f"/p/{module}/{v}/examples/{target_path.name}"
-                name = target_path.name
-                # figmap.append((impath, link, name)
-                figmap[module].append((impath, link, name))
+                prefix = f"/p/{key.module}/{key.version}"
+                impath = f"{prefix}/img/{figure}"
+                link = f"{prefix}/{_GALLERY_KINDS[kind]}/{path}"
+                figmap[key.module].append((impath, link, path))
 
         env = Environment(
             loader=FileSystemLoader(os.path.dirname(__file__)),
@@ -403,11 +555,11 @@ class HtmlRenderer:
         doc = D()
         doc.logo = "logo.png"
 
-        pap_files = self.old_store.glob("*/*/papyri.json")
         parts = {module: []}
-        for pp in pap_files:
-            mod, ver = pp.path.parts[-3:-1]
-            parts[module].append((RefInfo(mod, ver, "api", mod), mod))
+        for key in self.store.glob((None, None, "meta", "gallery.json")):
+            parts[module].append(
+                (RefInfo(key.module, key.version, "api", key.module), key.module)
+            )
 
         return env.get_template("gallery.tpl.j2").render(
             figmap=figmap,
@@ -425,8 +577,15 @@ class HtmlRenderer:
         Serve the narrative part of the documentation for given package
         """
         # return "Not Implemented"
-        bytes = self.store.get(Key(package, version, "docs", ref))
-        doc_blob = load_one(bytes, b"[]", known_refs=frozenset(), strict=True)
+        key = Key(package, version, "docs", ref)
+        bytes = self.store.get(key)
+        doc_blob = load_one(
+            bytes,
+            b"[]",
+            known_refs=frozenset(),
+            strict=True,
+            validate=validate_on_load(),
+        )
         print(doc_blob)
         # return "OK"
 
@@ -446,6 +605,35 @@ class HtmlRenderer:
             sidebar=self.sidebar,
         )
 
+    async def page(self, ref, store, version) -> Tuple[Optional[str], str]:
+        """
+        ETag and html of the page of `ref`, from `self.pages` if it did not
+        change.
+
+        Pages of objects we have no documentation for are not cached, and
+        have no ETag.
+        """
+        import papyri
+
+        generation = self.store.generation()
+        key = Key(ref.split(".")[0], version, "module", ref)
+        cached = self.pages.get(key, generation)
+        if cached is not None:
+            return cached
+        digest = self.store.neighbourhood_digest(key)
+        if digest is None:
+            return None, await self._route(ref, store, version)
+        # the navigation depends on all the known references.
+        snapshot = self.snapshot()
+        etag = sha256(
+            f"{papyri.__version__}:{self.sidebar}:{snapshot.digest}:{digest}".encode()
+        ).hexdigest()[:32]
+        html = self.pages.revalidate(key, generation, etag)
+        if html is None:
+            html = await self._route(ref, store, version)
+            self.pages.put(key, generation, etag, html)
+        return etag, html
+
     async def _route(
         self,
         ref,
@@ -462,15 +650,13 @@ class HtmlRenderer:
         template = env.get_template("html.tpl.j2")
         root = ref.split(".")[0]
 
-        known_refs, ref_map = find_all_refs(store)
+        snapshot = self.snapshot()
 
         # technically incorrect we don't load backrefs
-        x_, y_, doc_blob = await _route_data(self.store, ref, version, known_refs)
-        assert x_ == known_refs
-        assert y_ == ref_map
+        doc_blob = await _route_data(self.store, ref, version, snapshot.known_refs)
         assert version is not None
 
-        siblings = compute_siblings_II(ref, known_refs)
+        siblings = snapshot.siblings(ref)
 
         # End computing siblings.
         if version is not None:
@@ -493,7 +679,7 @@ class HtmlRenderer:
             else:
                 br = None
 
-            data = compute_graph(self.store, doc_blob, (root, version, "module", ref))
+            data = load_graph(self.store, Key(root, version, "module", ref))
             json_str = json.dumps(data)
             parts_links = {}
             acc = ""
@@ -577,16 +763,31 @@ def logo() -> bytes:
         return f.read()
 
 
-def serve(*, sidebar: bool):
+def serve(*, sidebar: bool, cache_size: int = 256, cache_dir: Optional[Path] = None):
 
     app = QuartTrio(__name__)
 
     store = Store(str(ingest_dir))
     gstore = GraphStore(ingest_dir)
-    html_renderer = HtmlRenderer(gstore, sidebar=sidebar, old_store=store)
+    html_renderer = HtmlRenderer(
+        gstore,
+        sidebar=sidebar,
+        old_store=store,
+        pages=PageCache(cache_size, cache_dir),
+    )
 
     async def full(package, version, ref):
-        return await html_renderer._route(ref, store, version)
+        etag, html = await html_renderer.page(ref, store, version)
+        if etag is None:
+            return html
+        if etag in request.if_none_match:
+            response = Response("", status=304)
+        else:
+            response = Response(html)
+        response.set_etag(etag)
+        # always check with us, pages change when libraries are ingested.
+        response.cache_control.no_cache = True
+        return response
 
     async def full_gallery(module, version):
         return await html_renderer.gallery(module, version)
@@ -603,6 +804,12 @@ def serve(*, sidebar: bool):
         v = str(papyri.__version__)
         return redirect(f"/p/papyri/{v}/api/papyri")
 
+    async def stats():
+        return {
+            "resolver": resolver_cache.stats(),
+            "pages": html_renderer.pages.stats(),
+        }
+
     async def ex(module, version, subpath):
         return await examples(
             module=module,
@@ -623,6 +830,7 @@ def serve(*, sidebar: bool):
     app.route("/gallery/")(gr)
     app.route("/gallery/<module>")(g)
     app.route("/")(index)
+    app.route("/_stats")(stats)
     port = int(os.environ.get("PORT", 1234))
     print("Seen config port ", port)
     prod = os.environ.get("PROD", None)
@@ -744,7 +952,7 @@ async def _ascii_render(key, store, known_refs=None, template=None):
     # version = keys[0][-1]
 
     env, template = _ascii_env()
-    bytes_ = store.get(key).decode()
+    bytes_ = store.get(key)
 
     # TODO:
     # brpath = store / root / rsion / "module" / f"{ref}.br"
@@ -755,12 +963,12 @@ async def _ascii_render(key, store, known_refs=None, template=None):
     #    br = None
     br = None
 
-    doc_blob = load_one(bytes_, br, strict=True)
+    doc_blob = load_one(bytes_, br, strict=True, validate=validate_on_load())
 
     # exercise the reprs
     assert str(doc_blob)
 
-    data = compute_graph(store, doc_blob, key)
+    data = load_graph(store, key)
     json_str = json.dumps(data)
     return render_one(
         template=template,
@@ -859,7 +1067,7 @@ async def loc(document: Key, *, store: GraphStore, tree, known_refs, ref_map):
         else:
             assert False
         doc_blob: IngestedBlobs = load_one(
-            bytes_, br, known_refs=known_refs, strict=True
+            bytes_, br, known_refs=known_refs, strict=True, validate=validate_on_load()
         )
 
     except Exception as e:
@@ -980,9 +1188,19 @@ class StaticRenderingConfig:
     html_sidebar: bool
     ascii: bool
     output_dir: Optional[Path]
+    # hard link the assets to the ones of the store instead of copying them.
+    link_assets: bool = False
 
 
-async def main(ascii: bool, html, dry_run, sidebar):
+async def main(
+    ascii: bool,
+    html,
+    dry_run,
+    sidebar,
+    jobs=1,
+    incremental=False,
+    link_assets=False,
+):
     """
     This does static rendering of all the given files.
 
@@ -996,6 +1214,14 @@ async def main(ascii: bool, html, dry_run, sidebar):
         do not write the output.
     Sidebar:bool
         render the sidebar in html
+    jobs: int
+        number of processes used to render the API pages.
+    incremental: bool
+        only render the API pages whose inputs changed since the previous
+        render, see `_page_fingerprints`, instead of erasing the output.
+    link_assets: bool
+        hard link the assets to the ones of the store instead of copying
+        them; they are then read-only.
 
     """
 
@@ -1007,7 +1233,7 @@ async def main(ascii: bool, html, dry_run, sidebar):
         assert html_dir_ is not None
         output_dir = html_dir_ / "p"
         output_dir.mkdir(exist_ok=True)
-    config = StaticRenderingConfig(html, sidebar, ascii, output_dir)
+    config = StaticRenderingConfig(html, sidebar, ascii, output_dir, link_assets)
 
     gstore = GraphStore(ingest_dir, {})
     store = Store(ingest_dir)
@@ -1034,12 +1260,37 @@ async def main(ascii: bool, html, dry_run, sidebar):
     family = frozenset(_.path for _ in known_refs)
 
     tree = make_tree(family)
+    previous: Dict[str, str] = {}
     if html_dir_ is not None:
-        log.info("going to erase %s", html_dir_)
-        shutil.rmtree(html_dir_)
+        if incremental and (html_dir_ / "manifest.json").exists():
+            previous = json.loads((html_dir_ / "manifest.json").read_text())["pages"]
+            _prune_versions(html_dir_ / "p", gstore)
+        else:
+            log.info("going to erase %s", html_dir_)
+            shutil.rmtree(html_dir_)
     else:
         log.info("no output dir, we'll try not to touch the filesystem")
 
+    pages: Dict[str, str] = {}
+    if html_dir_ is not None and config.html:
+        fingerprints = _page_fingerprints(
+            gstore, gfiles, tree, ref_map, config, css_data
+        )
+        paths = {key: _page_path(key) for key in gfiles}
+        pages = {paths[key]: fp for key, fp in fingerprints.items()}
+        for path in set(previous) - set(paths.values()):
+            # the document is gone.
+            (html_dir_ / path).unlink(missing_ok=True)
+        gfiles = [
+            key
+            for key in gfiles
+            if key not in fingerprints
+            or previous.get(paths[key]) != fingerprints[key]
+            or not (html_dir_ / paths[key]).exists()
+        ]
+        if previous:
+            log.info("%s pages did not change", len(paths) - len(gfiles))
+
     # shuffle files to detect bugs, just in case.
     random.shuffle(gfiles)
     # Gallery
@@ -1057,7 +1308,16 @@ async def main(ascii: bool, html, dry_run, sidebar):
         template,
         css_data,
         config,
+        jobs=jobs,
     )
+    if html_dir_ is not None and config.html:
+        (html_dir_ / "manifest.json").write_text(
+            json.dumps(
+                {"papyri_version": papyri_version, "pages": pages},
+                indent=2,
+                sort_keys=True,
+            )
+        )
 
     await _self_render_as_index_page(
         html_dir_, gstore, tree, known_refs, ref_map, config, template, css_data
@@ -1065,6 +1325,71 @@ async def main(ascii: bool, html, dry_run, sidebar):
     await copy_assets(config, gstore)
 
 
+def _page_path(key: Key) -> str:
+    """
+    Path of the html page of `key`, relative to the html directory.
+    """
+    return f"p/{key.module}/{key.version}/api/{key.path}.html"
+
+
+def _prune_versions(output_dir: Path, gstore) -> None:
+    """
+    Remove the output of the (module, version) pairs that have no documents in
+    the store any more: their API, example and gallery pages and their images.
+    """
+    current = set(gstore.glob((None, None)))
+    for module in [p for p in output_dir.iterdir() if p.is_dir()]:
+        for version in [p for p in module.iterdir() if p.is_dir()]:
+            if (module.name, version.name) not in current:
+                log.info("removing %s, no longer in the store", version)
+                shutil.rmtree(version)
+        if not any(module.iterdir()):
+            module.rmdir()
+
+
+def _page_fingerprints(gstore, gfiles, tree, ref_map, config, css_data):
+    """
+    Hash of the inputs of the API page of each of `gfiles`.
+
+    A page depends on its document, backrefs and graph, on its siblings in
+    the navigation, and on the templates and rendering options. Pages of
+    documents with no graph in the store have no fingerprint, they are
+    always rendered.
+    """
+    common = sha256(
+        json.dumps(
+            [papyri_version, config.html_sidebar, config.ascii, css_data]
+        ).encode()
+    )
+    for template in sorted(Path(__file__).parent.glob("*.j2")):
+        common.update(template.read_bytes())
+
+    digests = gstore.page_digests("module")
+    fingerprints = {}
+    for key in gfiles:
+        if key not in digests:
+            continue
+        h = common.copy()
+        h.update(digests[key].encode())
+        siblings = cs2(key.path, tree, ref_map)
+        h.update(
+            json.dumps(
+                [
+                    [
+                        part,
+                        [
+                            [c.module, c.version, c.kind, c.path, name]
+                            for c, name in sibs
+                        ],
+                    ]
+                    for part, sibs in siblings.items()
+                ]
+            ).encode()
+        )
+        fingerprints[key] = h.hexdigest()
+    return fingerprints
+
+
 async def _write_example_files(gstore, config):
     if not config.html:
         return
@@ -1111,7 +1436,7 @@ async def render_single_examples(env, module, gstore, version, ext, sidebar, dat
 
     from .take2 import Section
 
-    ex = Section.from_json(json.loads(data))
+    ex = Section.from_json(loads(data))
 
     class Doc:
         pass
@@ -1141,48 +1466,120 @@ async def _write_api_file(
     template,
     css_data,
     config,
+    jobs=1,
 ):
+    """
+    Render all the API pages, with `jobs` processes.
 
-    for _, key in progress(gfiles, description="Rendering API..."):
-        module, version = key.module, key.version
-        if config.ascii:
-            await _ascii_render(key, store=gstore)
-        if config.html:
-            doc_blob, qa, siblings, parts_links = await loc(
-                key,
-                store=gstore,
-                tree=tree,
-                known_refs=known_refs,
-                ref_map=ref_map,
+    The pages are independent, each worker process renders a share of them
+    with its own connection to the graph store.
+    """
+    global _RENDER_STATE
+    args = (tree, known_refs, ref_map, template, css_data, config)
+    pool = None
+    if jobs > 1 and gfiles:
+        # like in Gen.collect_api_docs, the pool needs to be created before
+        # the progress bar starts its refresh thread.
+        _RENDER_STATE = args
+        pool = multiprocessing.get_context("fork").Pool(
+            jobs, initializer=_open_store_in_worker
+        )
+    try:
+        if pool is None:
+            for _, key in progress(gfiles, description="Rendering API..."):
+                await _write_api_page(key, gstore, *args)
+        else:
+            done = pool.imap_unordered(_write_api_page_in_worker, gfiles, chunksize=8)
+            for _, _key in progress(gfiles, description="Rendering API..."):
+                next(done)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            _RENDER_STATE = None
+
+
+async def _write_api_page(
+    key,
+    gstore,
+    tree,
+    known_refs,
+    ref_map,
+    template,
+    css_data,
+    config,
+):
+    module, version = key.module, key.version
+    if config.ascii:
+        await _ascii_render(key, store=gstore)
+    if config.html:
+        doc_blob, qa, siblings, parts_links = await loc(
+            key,
+            store=gstore,
+            tree=tree,
+            known_refs=known_refs,
+            ref_map=ref_map,
+        )
+        data = load_graph(gstore, key)
+        json_str = json.dumps(data)
+        data = render_one(
+            template=template,
+            doc=doc_blob,
+            qa=qa,
+            ext=".html",
+            parts=siblings,
+            parts_links=parts_links,
+            backrefs=doc_blob.backrefs,
+            pygment_css=css_data,
+            graph=json_str,
+            sidebar=config.html_sidebar,
+        )
+        if config.output_dir:
+            (config.output_dir / module / version / "api").mkdir(
+                parents=True, exist_ok=True
             )
-            data = compute_graph(gstore, doc_blob, key)
-            json_str = json.dumps(data)
-            data = render_one(
-                template=template,
-                doc=doc_blob,
-                qa=qa,
-                ext=".html",
-                parts=siblings,
-                parts_links=parts_links,
-                backrefs=doc_blob.backrefs,
-                pygment_css=css_data,
-                graph=json_str,
-                sidebar=config.html_sidebar,
+            (config.output_dir / module / version / "api" / f"{qa}.html").write_text(
+                data
             )
-            if config.output_dir:
-                (config.output_dir / module / version / "api").mkdir(
-                    parents=True, exist_ok=True
-                )
-                (
-                    config.output_dir / module / version / "api" / f"{qa}.html"
-                ).write_text(data)
+
+
+# state shared with forked worker processes of `_write_api_file`
+_RENDER_STATE: Optional[Tuple[Any, ...]] = None
+# connection to the graph store of a worker process
+_WORKER_GSTORE: Optional[GraphStore] = None
+
+
+def _open_store_in_worker():
+    global _WORKER_GSTORE
+    # the sqlite connection of the parent process can't be used after fork.
+    _WORKER_GSTORE = GraphStore(ingest_dir, {})
+
+
+def _write_api_page_in_worker(key: Key) -> Key:
+    """
+    Render an API page in a worker process of `_write_api_file`.
+
+    The read-only state (tree, known refs, template...) is inherited from the
+    parent process at fork time, only the key is sent to the worker.
+    """
+    assert _RENDER_STATE is not None
+    # the worker is forked from within trio.run and can't start another
+    # one; rendering a page does not actually wait on anything.
+    coro = _write_api_page(key, _WORKER_GSTORE, *_RENDER_STATE)
+    try:
+        coro.send(None)
+    except StopIteration:
+        return key
+    coro.close()
+    raise RuntimeError(f"rendering {key} should not wait")
 
 
 async def copy_assets(config, gstore):
     """
     Copy assets from to their final destination.
 
-    Assets are all the binary files that we don't want to change.
+    Assets are all the binary files that we don't want to change, they are
+    copied, or hard linked to the ones of the graph store with
+    ``config.link_assets``.
     """
     if config.output_dir is None:
         return
@@ -1191,5 +1588,4 @@ async def copy_assets(config, gstore):
     for _, asset in progress(assets_2, description="Copying assets"):
         b = config.output_dir / asset.module / asset.version / "img"
         b.mkdir(parents=True, exist_ok=True)
-        data = gstore.get(asset)
-        (b / asset.path).write_bytes(data)
+        gstore.link(asset, b / asset.path, hard=config.link_assets)
@@ -59,6 +59,7 @@ from __future__ import annotations
 
 import sys
 from dataclasses import dataclass
+from hashlib import sha256
 from typing import List, Optional, Tuple, Union
 
 from papyri.utils import dedent_but_first
@@ -159,6 +160,32 @@ def validate(obj):
         raise ValueError(f"Wrong type at field :: {res}")
 
 
+def schema_digest(*roots) -> str:
+    """
+    Digest of the type annotations of `roots`, and of all the classes that
+    can be reached from them.
+
+    A document validated against a given digest does not need to be validated
+    again as long as the digest does not change.
+    """
+    seen = {}
+    todo = list(roots)
+    while todo:
+        annotation = todo.pop()
+        if hasattr(annotation, "__origin__"):
+            todo.extend(annotation.__args__)
+        elif (
+            isinstance(annotation, type)
+            and annotation.__module__ != "builtins"
+            and annotation not in seen
+        ):
+            hints = get_type_hints(annotation)
+            seen[annotation] = [(k, repr(v)) for k, v in hints.items()]
+            todo.extend(hints.values())
+    desc = sorted((f"{t.__module__}.{t.__qualname__}", h) for t, h in seen.items())
+    return sha256(repr(desc).encode()).hexdigest()
+
+
 class Base:
     def validate(self):
         validate(self)
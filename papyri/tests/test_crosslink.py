@@ -0,0 +1,301 @@
+import json
+import multiprocessing
+import sys
+
+import pytest
+
+from papyri import crosslink
+from papyri.crosslink import (
+    IngestedBlobs,
+    load_one,
+    load_one_uningested,
+    schema_version,
+)
+from papyri.encodings import dumps, loads
+from papyri.gen import Config, Gen
+from papyri.graphstore import Key
+from papyri.take2 import Fig, RefInfo
+
+
+def test_load_one_validate():
+    config = Config(exec=False, infer=False, submodules=["examples"])
+    g = Gen(dummy_progress=True, config=config)
+    g.collect_package_metadata("papyri", relative_dir=None)
+    g.collect_api_docs("papyri")
+    ingested = load_one_uningested(
+        g.data["papyri.examples.example1.json"],
+        None,
+        qa="papyri.examples.example1",
+        known_refs=frozenset(),
+        aliases={},
+        version="1.0",
+    )
+    ingested.logo = None
+    data = ingested.to_json()
+    del data["backrefs"]
+    data = loads(dumps(data))
+    blob = load_one(dumps(data), b"[]", strict=True, validate=True)
+    assert isinstance(blob, IngestedBlobs)
+
+    # wrong type that is not caught by de-serialisation.
+    data["item_line"] = "12"
+    blob = load_one(dumps(data), b"[]", strict=True)
+    assert blob.item_line == "12"
+    with pytest.raises(ValueError, match="item_line"):
+        load_one(dumps(data), b"[]", strict=True, validate=True)
+
+
+def test_validate_on_load(monkeypatch):
+    monkeypatch.delenv("PAPYRI_VALIDATE", raising=False)
+    assert not crosslink.validate_on_load()
+    monkeypatch.setenv("PAPYRI_VALIDATE", "1")
+    assert crosslink.validate_on_load()
+
+
+def test_schema_version():
+    assert schema_version() == schema_version()
+    assert len(schema_version()) == 64
+
+
+def test_affected(tmp_path, monkeypatch):
+    monkeypatch.setattr(crosslink, "ingest_dir", tmp_path)
+    ingester = crosslink.Ingester()
+    documents = {
+        # full name, or alias, from another library.
+        Key("other", "1", "module", "other.f"): ["mod.sub.a"],
+        Key("other", "1", "module", "other.h"): ["m.sub.a"],
+        Key("other", "1", "examples", "ex"): ["~mod.sub.a"],
+        # part of the name, only within the library
+        Key("other", "1", "module", "other.g"): ["sub.a"],
+        Key("mod", "0.9", "module", "mod.y"): ["sub.a"],
+        # already processed with the objects of their bundle
+        Key("mod", "1", "module", "mod.x"): ["sub.a", "mod.sub.a"],
+        Key("mod", "1", "examples", "ex"): ["mod.sub.a"],
+    }
+    for key, unresolved in documents.items():
+        ingester.gstore.put(key, b"", [], unresolved=unresolved)
+    targets = frozenset([RefInfo("mod", "1", "module", "mod.sub.a")])
+    assert ingester._affected(targets, {"m.sub.a": "mod.sub.a"}) == {
+        Key("other", "1", "module", "other.f"),
+        Key("other", "1", "module", "other.h"),
+        Key("other", "1", "examples", "ex"),
+        Key("mod", "0.9", "module", "mod.y"),
+        Key("mod", "1", "examples", "ex"),
+    }
+
+
+def test_relink_new_version(tmp_path, monkeypatch):
+    """
+    After ingesting a new version of a library, relinking only the affected
+    documents gives the same store as relinking all of them.
+    """
+    from papyri.bundle import BundleWriter
+
+    def bundle(name, version, body):
+        tmp_path.joinpath(f"{name}.py").write_text(
+            f'"""\nModule {name}.\n"""\n__version__ = "{version}"\n{body}'
+        )
+        monkeypatch.syspath_prepend(str(tmp_path))
+        monkeypatch.delitem(sys.modules, name, raising=False)
+        g = Gen(dummy_progress=True, config=Config(exec=False, infer=False))
+        g.collect_package_metadata(name, relative_dir=None)
+        g.stream_to(BundleWriter(tmp_path / "bundles" / f"{name}_{version}"))
+        g.collect_api_docs(name)
+        g.finish()
+        return tmp_path / "bundles" / f"{name}_{version}"
+
+    ma = """
+def f():
+    \"\"\"
+    Function of papyri_ra.
+    \"\"\"
+"""
+    mb = """
+def g():
+    \"\"\"
+    Like `papyri_ra.f`.
+
+    See Also
+    --------
+    papyri_ra.f
+    \"\"\"
+"""
+    first = [bundle("papyri_ra", "1.0", ma), bundle("papyri_rb", "1.0", mb)]
+    second = bundle("papyri_ra", "2.0", ma)
+
+    stores = []
+    for incremental in [True, False]:
+        monkeypatch.setattr(crosslink, "ingest_dir", tmp_path / f"i{incremental}")
+        ingester = crosslink.Ingester()
+        ingester.relink(ingester.ingest_many(first, False))
+        targets = ingester.ingest(second, False)
+        ingester.relink(targets if incremental else None)
+        stores.append(ingester.gstore)
+
+    g = Key("papyri_rb", "1.0", "module", "papyri_rb.g")
+    assert stores[0].get_refs(g) == [Key("papyri_ra", "1.0", "module", "papyri_ra.f")]
+    assert g in crosslink.Ingester()._affected(targets, {})
+
+    incremental, full = stores
+    keys = full.glob((None, None, None, None))
+    assert incremental.glob((None, None, None, None)) == keys
+    for key in keys:
+        assert incremental.get(key) == full.get(key), key
+        assert incremental.get_refs(key) == full.get_refs(key), key
+
+
+def test_ingest_jobs(tmp_path, monkeypatch):
+    from papyri.bundle import Bundle, BundleWriter
+
+    config = Config(exec=False, infer=False, submodules=["examples"])
+    g = Gen(dummy_progress=True, config=config)
+    g.collect_package_metadata("papyri", relative_dir=None)
+    g.stream_to(BundleWriter(tmp_path / "papyri_x", archive=True))
+    g.collect_api_docs("papyri")
+    g.finish()
+
+    stores = []
+    for jobs in [1, 2]:
+        monkeypatch.setattr(crosslink, "ingest_dir", tmp_path / f"ingest{jobs}")
+        ingester = crosslink.Ingester()
+        targets = ingester.ingest(Bundle(tmp_path / "papyri_x.zip"), False, jobs=jobs)
+        assert RefInfo("papyri", g.version, "module", "papyri.examples") in targets
+        stores.append(ingester.gstore)
+
+    serial, parallel = stores
+    keys = serial.glob((None, None, "module", None))
+    assert keys == parallel.glob((None, None, "module", None))
+    for key in keys:
+        assert serial.get(key) == parallel.get(key), key
+        assert serial.get_backref(key) == parallel.get_backref(key), key
+
+
+def test_imap_bounded():
+    consumed = []
+
+    def items():
+        for i in range(100):
+            consumed.append(i)
+            yield i
+
+    with multiprocessing.get_context("fork").Pool(2) as pool:
+        results = crosslink._imap_bounded(pool, abs, items(), chunksize=4, chunks=3)
+        assert next(results) == 0
+        # the first chunk is consumed, and its replacement sent.
+        assert len(consumed) == 16
+        assert list(results) == list(range(1, 100))
+
+
+def test_ingest_many_jobs(tmp_path, monkeypatch):
+    """
+    With several bundles and processes, the documents are read from the
+    bundles as they are written, not all at once.
+    """
+    from papyri.bundle import Bundle, BundleWriter
+    from papyri.graphstore import GraphStore
+
+    tmp_path.joinpath("papyri_mc.py").write_text(
+        '"""\nModule papyri_mc.\n"""\n__version__ = "1.0"\n'
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    bundles = []
+    for name, submodules in [("papyri_mc", []), ("papyri", ["examples", "tree"])]:
+        g = Gen(
+            dummy_progress=True,
+            config=Config(exec=False, infer=False, submodules=submodules),
+        )
+        g.collect_package_metadata(name, relative_dir=None)
+        g.stream_to(BundleWriter(tmp_path / name))
+        g.collect_api_docs(name)
+        g.finish()
+        bundles.append(tmp_path / name)
+
+    events = []
+    read_bytes, put = Bundle.read_bytes, GraphStore.put
+
+    def record_read(self, path):
+        if path.startswith("module/"):
+            events.append(1)
+        return read_bytes(self, path)
+
+    def record_put(self, key, *args, **kwargs):
+        if key.kind == "module":
+            events.append(-1)
+        return put(self, key, *args, **kwargs)
+
+    monkeypatch.setattr(Bundle, "read_bytes", record_read)
+    monkeypatch.setattr(GraphStore, "put", record_put)
+    monkeypatch.setattr(crosslink, "ingest_dir", tmp_path / "ingest")
+    crosslink.Ingester().ingest_many(bundles, False, jobs=2)
+
+    assert events.count(-1) > 40
+    in_flight = [sum(events[: i + 1]) for i in range(len(events))]
+    # two chunks of 4 documents per worker, and the one being written.
+    assert max(in_flight) <= 5 * 4
+
+
+def test_ingest_many(tmp_path, monkeypatch):
+    """
+    Bundles ingested together are cross-linked with each other, without
+    relinking.
+    """
+    from papyri.bundle import BundleWriter
+
+    for name, other in [("papyri_ma", "papyri_mb"), ("papyri_mb", "papyri_ma")]:
+        tmp_path.joinpath(f"{name}.py").write_text(f'''
+"""
+Module {name}.
+"""
+__version__ = "1.0"
+
+
+def f():
+    """
+    Function of {name}, like `{other}.f`.
+
+    See Also
+    --------
+    {other}.f
+    """
+''')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    bundles = []
+    for name in ["papyri_ma", "papyri_mb"]:
+        g = Gen(dummy_progress=True, config=Config(exec=False, infer=False))
+        g.collect_package_metadata(name, relative_dir=None)
+        g.stream_to(BundleWriter(tmp_path / f"{name}_1.0"))
+        g.collect_api_docs(name)
+        g.finish()
+        bundles.append(tmp_path / f"{name}_1.0")
+
+    monkeypatch.setattr(crosslink, "ingest_dir", tmp_path / "ingest")
+    ingester = crosslink.Ingester()
+    targets = ingester.ingest_many(bundles, False)
+    fa = Key("papyri_ma", "1.0", "module", "papyri_ma.f")
+    fb = Key("papyri_mb", "1.0", "module", "papyri_mb.f")
+    assert {RefInfo(*fa), RefInfo(*fb)} <= targets
+    assert ingester.gstore.get_backref(fa) == [fb]
+    assert ingester.gstore.get_backref(fb) == [fa]
+    assert ingester.gstore.find_unresolved(["papyri_ma.f", "papyri_mb.f"]) == []
+    (see_also,) = loads(ingester.gstore.get(fa))["see_also"]
+    assert see_also["name"]["exists"]
+    # the graphs are computed at ingest.
+    assert ingester.gstore.stale_graphs() == []
+    assert ingester.gstore.get_graph(fa) is not None
+    # without examples there is nothing in the galleries.
+    gallery = Key("papyri_ma", "1.0", "meta", "gallery.json")
+    assert json.loads(ingester.gstore.get(gallery)) == []
+
+    # stores ingested before the gallery indices get them at relink.
+    data = loads(ingester.gstore.get(fa))
+    data["backrefs"] = []
+    blob = IngestedBlobs.from_json(data)
+    blob.example_section_data.append(Fig("fig-0.png"))
+    js = blob.to_json()
+    del js["backrefs"]
+    ingester.gstore.put(fa, dumps(js), ingester.gstore.get_refs(fa))
+    ingester.gstore.remove(gallery)
+    ingester.relink()
+    assert json.loads(ingester.gstore.get(gallery)) == [
+        ["module", "papyri_ma.f", "fig-0.png"]
+    ]
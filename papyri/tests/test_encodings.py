@@ -0,0 +1,66 @@
+import pytest
+
+from papyri.encodings import ENCODINGS, dumps, loads, sniff
+from papyri.gen import Config, DocBlob, Gen
+
+
+@pytest.fixture(scope="module")
+def blobs():
+    config = Config(exec=False, infer=False, submodules=["examples"])
+    g = Gen(dummy_progress=True, config=config)
+    g.collect_package_metadata("papyri", relative_dir=None)
+    g.collect_api_docs("papyri")
+    return g.data
+
+
+@pytest.fixture(params=ENCODINGS)
+def encoding(request):
+    if request.param == "msgpack":
+        pytest.importorskip("msgpack")
+    return request.param
+
+
+def test_roundtrip(blobs, encoding):
+    assert blobs
+    for name, data in blobs.items():
+        expected = loads(data)
+        encoded = dumps(DocBlob.from_json(expected).to_json(), encoding)
+        assert sniff(encoded) == encoding
+        assert loads(encoded) == expected, name
+        blob = DocBlob.from_json(loads(encoded))
+        assert dumps(blob.to_json()) == dumps(expected), name
+
+
+def test_json_is_readable():
+    assert (
+        dumps({"b": [1, None], "a": "é"})
+        == b'{\n  "a": "\\u00e9",\n  "b": [\n    1,\n    null\n  ]\n}'
+    )
+    assert loads(' {"a": 1}') == {"a": 1}
+
+
+def test_unknown_encoding():
+    with pytest.raises(ValueError):
+        dumps({}, "pickle")
+
+
+def test_gen_encoding(blobs, encoding):
+    """
+    The encoding is used for all the documents of a docbundle, and does not
+    change their content.
+    """
+    config = Config(exec=False, infer=False, submodules=["examples"], encoding=encoding)
+    g = Gen(dummy_progress=True, config=config)
+    g.collect_package_metadata("papyri", relative_dir=None)
+    g.collect_api_docs("papyri")
+    assert g.data.keys() == blobs.keys()
+    for name, data in g.data.items():
+        assert sniff(data) == encoding
+        assert loads(data) == loads(blobs[name]), name
+
+
+def test_same_key_order(encoding):
+    data = {"b": {"d": 1, "c": [{"f": 0, "e": 1}]}, "a": None}
+    assert list(loads(dumps(data, encoding))) == ["a", "b"]
+    assert dumps(loads(dumps(data, encoding))) == dumps(data)
+    assert repr(loads(dumps(data, encoding))) == repr(loads(dumps(data)))
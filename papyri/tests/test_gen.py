@@ -1,6 +1,17 @@
 from functools import lru_cache
+from typing import List
 
-from papyri.gen import Config, Gen, NumpyDocString, BlockExecutor, APIObjectInfo
+import pytest
+
+from papyri.gen import (
+    APIObjectInfo,
+    BlockExecutor,
+    Config,
+    ErrorCollector,
+    Gen,
+    JediCache,
+    NumpyDocString,
+)
 
 
 @lru_cache
@@ -66,3 +77,340 @@ def test_infer():
     )
 
     assert list(res) == list(expected)
+
+
+def test_error_collector_replay():
+    """
+    Errors seen in worker processes are replayed in the parent collector, this
+    should give the same state as recording them directly.
+    """
+    import logging
+
+    config = Config(
+        expected_errors={"ValueError": ["a.b", "a.b"], "TypeError": ["a.c"]}
+    )
+    log = logging.getLogger("papyri")
+    direct = ErrorCollector(config, log)
+    worker = ErrorCollector(config, log)
+    for qa, ename in [
+        ("a.b", "ValueError"),
+        ("a.c", "KeyError"),
+        ("a.b", "ValueError"),
+    ]:
+        direct.record(qa, ename)
+        worker.record(qa, ename)
+
+    replayed = ErrorCollector(config, log)
+    for qa, ename in worker.events:
+        replayed.record(qa, ename)
+
+    assert replayed._errors == direct._errors == {"KeyError": ["a.c"]}
+    assert (
+        replayed._expected_unseen == direct._expected_unseen == {"a.c": ["TypeError"]}
+    )
+
+
+def test_collect_api_docs_jobs():
+    """
+    Parallel collection should give the same output as the serial one.
+    """
+    config = Config(exec=False, infer=False, submodules=["examples"])
+    serial = Gen(dummy_progress=True, config=config)
+    serial.collect_package_metadata("papyri", relative_dir=None)
+    serial.collect_api_docs("papyri")
+
+    parallel = Gen(dummy_progress=True, config=config)
+    parallel.collect_package_metadata("papyri", relative_dir=None)
+    parallel.collect_api_docs("papyri", jobs=2)
+
+    assert list(parallel.data.items()) == list(serial.data.items())
+    assert parallel.bdata == serial.bdata
+
+
+def test_collect_api_docs_incremental(tmp_path):
+    """
+    Unchanged objects should be reused from the previous docbundle.
+    """
+    config = Config(exec=False, infer=False, submodules=["examples"])
+    first = Gen(dummy_progress=True, config=config)
+    first.collect_package_metadata("papyri", relative_dir=None)
+    # no previous docbundle yet.
+    first.load_manifest(tmp_path)
+    first.collect_api_docs("papyri")
+    first.write(tmp_path)
+
+    second = Gen(dummy_progress=True, config=config)
+    second.collect_package_metadata("papyri", relative_dir=None)
+    second.load_manifest(tmp_path)
+    second._collect_one = None  # nothing should need to be processed again.
+    second.collect_api_docs("papyri")
+
+    assert second.data == first.data
+    assert second.manifest == first.manifest
+
+    for changes in [{"wait_for_plt_show": False}, {"exec_sandbox": True}]:
+        changed = Gen(dummy_progress=True, config=config.replace(**changes))
+        changed.collect_package_metadata("papyri", relative_dir=None)
+        changed.load_manifest(tmp_path)
+        changed.collect_api_docs("papyri")
+        assert changed.data.keys() == first.data.keys()
+        assert changed.manifest.keys() == first.manifest.keys()
+        assert all(
+            changed.manifest[k]["fingerprint"] != first.manifest[k]["fingerprint"]
+            for k in first.manifest
+        ), changes
+
+    # objects are not fingerprinted unless they may be reused.
+    plain = Gen(dummy_progress=True, config=config)
+    plain.collect_package_metadata("papyri", relative_dir=None)
+    plain._fingerprint = None
+    plain.collect_api_docs("papyri")
+    assert plain.data == first.data
+    assert all(v["fingerprint"] is None for v in plain.manifest.values())
+
+
+def _example_function():
+    pass
+
+
+EXAMPLES = """
+>>> import numpy as np
+>>> x = np.arange(3)
+
+Some text between the code blocks.
+
+>>> y = x.sum()
+
+More text.
+
+>>> z = [y, y]
+... w = z.copy()
+
+And the end.
+
+>>> w.append(np.float64(1))
+>>> _example_function()
+""".splitlines()
+
+
+@pytest.mark.parametrize("exec_", [False, True])
+def test_infer_chunks_per_chunk(tmp_path, monkeypatch, exec_):
+    """
+    Inferring the chunks of an example section together, by groups sharing
+    the same namespace, gives the same tokens as inferring each chunk with the
+    previous ones as context.
+    """
+    import logging
+
+    from papyri import gen
+
+    monkeypatch.setattr(gen, "_JEDI_CACHE", JediCache(tmp_path / "jedi.db"))
+    config = Config(infer=True, exec=exec_)
+    groups = []
+    actual = []
+    infer_chunks = gen.infer_chunks
+
+    def recording(chunks, ns, config, *, prev="", where=None):
+        groups.append((list(chunks), ns, prev))
+        results = infer_chunks(chunks, ns, config, prev=prev, where=where)
+        actual.extend(results)
+        return results
+
+    monkeypatch.setattr(gen, "infer_chunks", recording)
+    gen.get_example_data(
+        EXAMPLES,
+        obj=_example_function,
+        qa="papyri.tests.test_gen._example_function",
+        config=config,
+        log=logging.getLogger("papyri"),
+    )
+    monkeypatch.setattr(gen, "infer_chunks", infer_chunks)
+
+    expected = []
+    for chunks, ns, prev in groups:
+        for chunk in chunks:
+            expected.append(gen.parse_script(chunk, ns, prev, config))
+            prev += "\n" + chunk
+    assert len(actual) == 4
+    # inferred from the previous chunks, at the right lines.
+    assert ("append", "builtins.list.append") in actual[3]
+    assert actual == expected
+    if exec_:
+        # executed chunks change the namespace, which splits the groups.
+        assert len(groups) > 1
+    else:
+        assert [len(chunks) for chunks, _, _ in groups] == [4]
+
+
+def test_jedi_cache(tmp_path):
+    cache = JediCache(tmp_path / "jedi.db", max_size=1000)
+    key = cache.key("x = 1\nx", {"np": object()}, True)
+    assert key != cache.key("x = 1\nx", {"np": object()}, False)
+    assert key != cache.key("x = 1\nx", {}, True)
+    assert cache.get(key) is None
+    cache.set(key, [("x", "builtins.int"), (" ", "")])
+    assert cache.get(key) == [["x", "builtins.int"], [" ", ""]]
+    assert (cache.hits, cache.misses) == (1, 1)
+    # access times are written in batches.
+    (atime,) = cache.conn.execute("SELECT atime FROM jedi").fetchone()
+    assert cache.conn.execute("SELECT atime FROM jedi").fetchone() == (atime,)
+    cache.flush()
+    assert cache.conn.execute("SELECT atime FROM jedi").fetchone() != (atime,)
+
+    cache.library = ("papyri", "0.0.0")
+    assert cache.key("x = 1\nx", {"np": object()}, True) != key
+
+    # the last insertion trigger the eviction.
+    for i in range(cache._check_every - 1):
+        cache.set(str(i), [("x" * 10, None)])
+    (total,) = cache.conn.execute("SELECT SUM(size) FROM jedi").fetchone()
+    assert total <= 900
+    assert cache.get(key) is None
+    assert cache.get(str(cache._check_every - 2)) is not None
+
+
+def test_infer_chunks_without_inference(tmp_path, monkeypatch):
+    from papyri import gen
+
+    cache = JediCache(tmp_path / "jedi.db")
+    monkeypatch.setattr(gen, "_JEDI_CACHE", cache)
+    config = Config(infer=False)
+    [entries] = gen.infer_chunks(["x = 1"], {}, config)
+    assert entries == [("x", ""), (" ", ""), ("=", ""), (" ", ""), ("1", "")]
+    # the cache was not even opened.
+    assert not (tmp_path / "jedi.db").exists()
+
+
+def test_sandboxed_executor():
+    from papyri.errors import SandboxTimeoutError
+    from papyri.miscs import SandboxedExecutor
+
+    executor = SandboxedExecutor(
+        {"np": "numpy", "plt": "matplotlib.pyplot", "Config": "papyri.gen:Config"},
+        timeout=20,
+    )
+    with executor:
+        res, figs, out, _ = executor.exec("a = np.arange(3)\nprint('hi')\na")
+        assert (res, figs, out) == ("array([0, 1, 2])", [], "hi\n")
+        assert executor.exec("Config")[0] == "<class 'papyri.gen.Config'>"
+        _, figs, _, _ = executor.exec("plt.plot(a)")
+        assert len(figs) == 1
+        [png] = executor.get_figs()
+        assert png.startswith(b"\x89PNG")
+        with pytest.raises(ZeroDivisionError):
+            executor.exec("1 / 0")
+        executor.timeout = 1
+        with pytest.raises(SandboxTimeoutError):
+            executor.exec("import time\ntime.sleep(10)")
+        # the worker is restarted, previous state is lost.
+        with pytest.raises(NameError):
+            executor.exec("a")
+
+
+def test_stream_and_resume(tmp_path):
+    """
+    An interrupted generation can be resumed, and gives the same docbundle as
+    a generation kept in memory.
+    """
+    from papyri.bundle import BundleWriter
+
+    config = Config(exec=False, infer=False, submodules=["examples"])
+    reference = Gen(dummy_progress=True, config=config)
+    reference.collect_package_metadata("papyri", relative_dir=None)
+    # fingerprinted like the resumed objects, for the manifests to be equal.
+    reference.incremental = True
+    reference.collect_api_docs("papyri")
+    (tmp_path / "reference").mkdir()
+    reference.write(tmp_path / "reference")
+
+    def counting(gen, calls, limit=None):
+        original = gen._collect_one
+
+        def _collect_one(qa, *args, **kwargs):
+            if len(calls) == limit:
+                raise KeyboardInterrupt
+            calls.append(qa)
+            return original(qa, *args, **kwargs)
+
+        gen._collect_one = _collect_one
+
+    first_calls: List[str] = []
+    interrupted = Gen(dummy_progress=True, config=config)
+    interrupted.collect_package_metadata("papyri", relative_dir=None)
+    interrupted.stream_to(BundleWriter(tmp_path / "bundle", resume=True))
+    counting(interrupted, first_calls, limit=50)
+    with pytest.raises(KeyboardInterrupt):
+        interrupted.collect_api_docs("papyri")
+    assert not (tmp_path / "bundle").exists()
+
+    second_calls: List[str] = []
+    resumed = Gen(dummy_progress=True, config=config)
+    resumed.collect_package_metadata("papyri", relative_dir=None)
+    resumed.stream_to(BundleWriter(tmp_path / "bundle", resume=True))
+    counting(resumed, second_calls)
+    resumed.collect_api_docs("papyri")
+    resumed.finish()
+
+    assert not set(first_calls) & set(second_calls)
+    assert len(first_calls) + len(second_calls) == len(reference.manifest)
+    assert not (tmp_path / "bundle.partial").exists()
+    expected = sorted(
+        p.relative_to(tmp_path / "reference")
+        for p in (tmp_path / "reference").rglob("*")
+    )
+    actual = sorted(
+        p.relative_to(tmp_path / "bundle") for p in (tmp_path / "bundle").rglob("*")
+    )
+    assert actual == expected
+    for path in expected:
+        if (tmp_path / "reference" / path).is_file():
+            assert (tmp_path / "bundle" / path).read_bytes() == (
+                tmp_path / "reference" / path
+            ).read_bytes(), path
+
+
+def test_archive_bundle(tmp_path):
+    """
+    A docbundle written as a zip file has the same content as the folder one,
+    and can be read back without extracting it.
+    """
+    from papyri.bundle import Bundle, BundleWriter
+
+    config = Config(exec=False, infer=False, submodules=["examples"])
+    bundles = []
+    for archive in [False, True]:
+        g = Gen(dummy_progress=True, config=config)
+        g.collect_package_metadata("papyri", relative_dir=None)
+        # fingerprint the objects, like --incremental does.
+        g.incremental = True
+        g.stream_to(BundleWriter(tmp_path / "papyri_x", archive=archive))
+        g.collect_api_docs("papyri")
+        g.finish()
+        bundles.append(Bundle(tmp_path / ("papyri_x.zip" if archive else "papyri_x")))
+
+    folder, archived = bundles
+    # the staging folder and the temporary archive are cleaned up.
+    assert not (tmp_path / "papyri_x.partial").exists()
+    assert not (tmp_path / "papyri_x.zip.tmp").exists()
+    assert archived.name == folder.name == "papyri_x"
+    for sub in ["module", "docs", "examples", "assets"]:
+        assert archived.list(sub) == folder.list(sub)
+        for name in folder.list(sub):
+            path = sub + "/" + name
+            assert archived.read_bytes(path) == folder.read_bytes(path), path
+    assert archived.read_text("papyri.json") == folder.read_text("papyri.json")
+
+    # the same bundle can be used for an incremental build.
+    g = Gen(dummy_progress=True, config=config)
+    g.collect_package_metadata("papyri", relative_dir=None)
+    g.load_manifest(tmp_path / "papyri_x.zip")
+    calls: List[str] = []
+    original = g._collect_one
+
+    def _collect_one(qa, *args, **kwargs):
+        calls.append(qa)
+        return original(qa, *args, **kwargs)
+
+    g._collect_one = _collect_one  # type: ignore
+    g.collect_api_docs("papyri")
+    assert calls == []
@@ -0,0 +1,315 @@
+import json
+import os
+import sqlite3
+import stat
+
+import pytest
+
+from papyri.graphstore import GraphStore, Key
+
+A = Key("mod", "1.0", "module", "mod.a")
+B = Key("mod", "1.0", "module", "mod.b")
+C = Key("other", "2.0", "module", "other.c")
+
+
+def test_put_get_backrefs(tmp_path):
+    store = GraphStore(tmp_path)
+    store.put(A, b"a", [B, C])
+    store.put(B, b"b", [C], schema="s1")
+    assert store.get(A) == b"a"
+    assert store.get_backref(C) == [A, B]
+    assert store.get_backref(B) == [A]
+    assert store.get_backref(A) == []
+    assert store.is_validated(B, "s1")
+    assert not store.is_validated(B, "s2")
+    assert not store.is_validated(A, "s1")
+    assert sorted(store.glob((None, None, "module", None))) == [A, B]
+
+    # updating a document replaces its edges.
+    store.put(A, b"a2", [B])
+    assert store.get(A) == b"a2"
+    assert store.get_backref(C) == [B]
+    assert store.get_backref(B) == [A]
+    store.put(B, b"b", [C])
+    assert not store.is_validated(B, "s1")
+
+    store.remove(A)
+    assert store.get_backref(B) == []
+    assert store.glob((None, None, "module", None)) == [B]
+
+    # persisted
+    assert GraphStore(tmp_path).get_backref(C) == [B]
+
+
+def test_migrate(tmp_path):
+    """
+    Stores with keys as strings and json backref files are migrated when
+    opened.
+    """
+    for key in [A, B, C]:
+        path = tmp_path.joinpath(*key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(key.path.encode())
+    tmp_path.joinpath(*C[:-1], "other.c.br").write_text(json.dumps([A, B]))
+    db = sqlite3.connect(str(tmp_path / "papyri.db"))
+    with db:
+        db.execute(
+            "CREATE TABLE links(source, dest, reason, unique(source, dest, reason))"
+        )
+        db.execute("CREATE TABLE validated(key PRIMARY KEY, schema)")
+        db.execute("insert into links values (?,?,?)", (str(A), str(B), "debug"))
+        db.execute("insert into links values (?,?,?)", (str(A), str(C), "debug"))
+        db.execute("insert into validated values (?,?)", (str(B), "s1"))
+    db.close()
+
+    store = GraphStore(tmp_path)
+    assert store.get_backref(B) == [A]
+    assert store.get_backref(C) == [A, B]
+    assert store.is_validated(B, "s1")
+    assert not list(tmp_path.glob("*/*/*/*.br"))
+    assert sorted(store.glob((None, None, None, None))) == [A, B, C]
+    assert GraphStore(tmp_path).get_backref(C) == [A, B]
+    # we don't know what those failed to resolve.
+    assert sorted(store.unknown_unresolved()) == [A, B, C]
+
+
+def test_batch(tmp_path):
+    store = GraphStore(tmp_path)
+    store.put(A, b"a", [C])
+    with store.batch():
+        store.put(A, b"a2", [B])
+        store.put_many([(B, b"b", [C]), (C, b"c", [])], schema="s1")
+        assert store.get(A) == b"a2"
+        assert not tmp_path.joinpath(*B).exists()
+        assert GraphStore(tmp_path).get_backref(C) == [A]
+    assert store.get_backref(C) == [B]
+    assert tmp_path.joinpath(*B).read_bytes() == b"b"
+    assert GraphStore(tmp_path).is_validated(C, "s1")
+    generation = store.generation()
+
+    try:
+        with store.batch():
+            store.put(A, b"a3", [C])
+            raise ValueError
+    except ValueError:
+        pass
+    assert store.get(A) == b"a2"
+    assert store.get_backref(C) == [B]
+    assert store.generation() == generation
+
+
+def test_batch_remove(tmp_path):
+    store = GraphStore(tmp_path)
+    store.put(A, b"a", [])
+    store.put(B, b"b", [])
+    with store.batch():
+        store.put(A, b"a2", [])
+        store.remove(A)
+        assert store.glob((None, None, "module", None)) == [B]
+        assert tmp_path.joinpath(*A).exists()
+    assert store.glob((None, None, "module", None)) == [B]
+    assert not tmp_path.joinpath(*A).exists()
+
+    # a batch that raises doesn't remove anything.
+    try:
+        with store.batch():
+            store.remove(B)
+            raise ValueError
+    except ValueError:
+        pass
+    assert store.glob((None, None, "module", None)) == [B]
+    assert store.get(B) == b"b"
+
+    # nor does a removal whose transaction fails.
+    store.table.execute(
+        "CREATE TRIGGER fail BEFORE DELETE ON documents "
+        "BEGIN SELECT RAISE(ABORT, 'fail'); END"
+    )
+    with pytest.raises(sqlite3.IntegrityError):
+        store.remove(B)
+    assert store.glob((None, None, "module", None)) == [B]
+    assert store.get(B) == b"b"
+
+
+def test_batch_is_staged_on_disk(tmp_path):
+    store = GraphStore(tmp_path)
+    fig = Key("mod", "1.0", "assets", "fig.png")
+    try:
+        with store.batch():
+            store.put_many([(A, b"a", []), (fig, b"png", [])])
+            # written as they are put, not kept in memory.
+            assert all(v is not None for v in store._pending.values())
+            assert store.get(A) == b"a"
+            assert store.get(fig) == b"png"
+            raise ValueError
+    except ValueError:
+        pass
+    assert [p for p in tmp_path.rglob("*") if p.is_file()] == [tmp_path / "papyri.db"]
+
+
+def test_glob(tmp_path):
+    store = GraphStore(tmp_path)
+    with store.batch():
+        store.put(A, b"a", [])
+        store.put(C, b"c", [])
+        # documents put in a batch are already listed.
+        assert store.glob((None, None, None, None)) == [A, C]
+    store.put(B, b"b", [])
+    store.put(Key("mod", "1.0", "assets", "fig.png"), b"png", [])
+    assert store.glob((None, None, "module", None)) == [A, B, C]
+    assert store.glob(("mod", None, "module", "mod.b")) == [B]
+    assert store.glob((None, None, "module", "*.[ac]")) == [A, C]
+    assert store.glob((None, None)) == [("mod", "1.0"), ("other", "2.0")]
+    assert store.glob(("o*",)) == [("other",)]
+    store.remove(A)
+    assert store.glob(("mod", "1.0", "module", None)) == [B]
+
+
+def test_index_existing_documents(tmp_path):
+    store = GraphStore(tmp_path)
+    store.put(A, b"a", [B])
+    with store.table:
+        store.table.execute("DROP TABLE documents")
+        store.table.execute("DROP TABLE unresolved")
+        store.table.execute("DROP TABLE generation")
+        store.table.execute("DROP TABLE graphs")
+        store.table.execute("PRAGMA user_version=1")
+    store.table.close()
+    tmp_path.joinpath(*C).parent.mkdir(parents=True)
+    tmp_path.joinpath(*C).write_bytes(b"c")
+
+    store = GraphStore(tmp_path)
+    assert store.glob((None, None, None, None)) == [A, C]
+    assert store.get_backref(B) == [A]
+
+
+def test_assets_are_shared(tmp_path):
+    store = GraphStore(tmp_path)
+    fig1 = Key("mod", "1.0", "assets", "fig.png")
+    fig2 = Key("mod", "2.0", "assets", "fig.png")
+    store.put(fig1, b"png", [])
+    store.put_many([(fig2, b"png", []), (A, b"png", [])])
+    path1, path2 = tmp_path.joinpath(*fig1), tmp_path.joinpath(*fig2)
+    assert path1.samefile(path2)
+    assert not path1.samefile(tmp_path.joinpath(*A))
+    assert store.get(fig2) == b"png"
+    (blob,) = tmp_path.glob(".blobs/*/*")
+
+    # blobs are shared, they can't be edited in place.
+    assert stat.S_IMODE(blob.stat().st_mode) == 0o444
+    store.link(fig1, tmp_path / "out.png")
+    assert not (tmp_path / "out.png").samefile(path1)
+    assert (tmp_path / "out.png").read_bytes() == b"png"
+    store.link(fig1, tmp_path / "out.png", hard=True)
+    assert (tmp_path / "out.png").samefile(path1)
+
+    store.put(fig2, b"png2", [])
+    assert store.get(fig2) == b"png2"
+    assert store.get(fig1) == b"png"
+    store.remove(fig1)
+    assert len(list(tmp_path.glob(".blobs/*/*"))) == 1
+    assert not blob.exists()
+
+
+def test_share_existing_assets(tmp_path):
+    fig1 = Key("mod", "1.0", "assets", "fig.png")
+    fig2 = Key("mod", "2.0", "assets", "fig.png")
+    for key in [fig1, fig2]:
+        tmp_path.joinpath(*key).parent.mkdir(parents=True)
+        tmp_path.joinpath(*key).write_bytes(b"png")
+
+    store = GraphStore(tmp_path)
+    assert store.glob((None, None, "assets", None)) == [fig1, fig2]
+    assert tmp_path.joinpath(*fig1).samefile(tmp_path.joinpath(*fig2))
+    (blob,) = tmp_path.glob(".blobs/*/*")
+    assert stat.S_IMODE(blob.stat().st_mode) == 0o444
+
+
+def test_assets_without_hard_links(tmp_path, monkeypatch):
+    def link(src, dst):
+        raise OSError("not supported")
+
+    monkeypatch.setattr(os, "link", link)
+    store = GraphStore(tmp_path)
+    fig = Key("mod", "1.0", "assets", "fig.png")
+    store.put(fig, b"png", [])
+    with store.batch():
+        store.put(fig, b"png2", [])
+    assert store.get(fig) == b"png2"
+    # stored once.
+    assert not tmp_path.joinpath(".blobs").exists()
+    store.link(fig, tmp_path / "out.png", hard=True)
+    assert (tmp_path / "out.png").read_bytes() == b"png2"
+
+
+def test_unresolved(tmp_path):
+    store = GraphStore(tmp_path)
+    store.put(A, b"a", [], unresolved=["x", "mod.y"])
+    store.put(C, b"c", [], unresolved=["x"])
+    assert sorted(store.find_unresolved(["x", "z"])) == [(A, "x"), (C, "x")]
+    assert sorted(store.unresolved("mod")) == [(A, "mod.y"), (A, "x")]
+    store.put(A, b"a", [], unresolved=["z"])
+    assert sorted(store.find_unresolved(["x", "z"])) == [(A, "z"), (C, "x")]
+    store.remove(C)
+    assert store.find_unresolved(["x"]) == []
+    assert store.unknown_unresolved() == []
+
+
+def test_generation(tmp_path):
+    store = GraphStore(tmp_path)
+    assert store.generation() == 0
+    store.put(A, b"a", [])
+    assert store.generation() == 1
+    with store.batch():
+        store.put(B, b"b", [A])
+        store.put(C, b"c", [A])
+        assert GraphStore(tmp_path).generation() == 1
+    # seen by other connections.
+    assert GraphStore(tmp_path).generation() == 2
+    store.remove(C)
+    assert store.generation() == 3
+
+
+def test_neighbourhood_digest(tmp_path):
+    store = GraphStore(tmp_path)
+    store.put(A, b"a", [B])
+    store.put(B, b"b", [])
+    digest = store.neighbourhood_digest(A)
+    assert store.neighbourhood_digest(C) is None
+    # unrelated to A
+    store.put(B, b"b2", [C])
+    assert store.neighbourhood_digest(A) == digest
+    # a new backref of B, a neighbour of A
+    store.put(C, b"c", [B])
+    assert store.neighbourhood_digest(A) != digest
+    digest = store.neighbourhood_digest(A)
+    store.put(A, b"a2", [B])
+    assert store.neighbourhood_digest(A) != digest
+
+
+def test_stale_graphs(tmp_path):
+    D = Key("mod", "1.0", "module", "mod.d")
+    store = GraphStore(tmp_path)
+    store.put(A, b"a", [B])
+    store.put(B, b"b", [])
+    store.put(C, b"c", [])
+    store.put(D, b"d", [C])
+    assert store.stale_graphs() == [A, B, D, C]
+    for key in [A, B, C, D]:
+        store.put_graph(key, key.path)
+    assert store.stale_graphs() == []
+    assert store.get_graph(A) == "mod.a"
+    assert store.get_refs(A) == [B]
+
+    # same edges
+    store.put(A, b"a2", [B])
+    assert store.stale_graphs() == []
+    # C gets a new backref, that changes its graph and the ones of the
+    # documents that refer to it, not the one of A.
+    store.put(B, b"b", [C])
+    assert store.stale_graphs() == [B, D, C]
+    for key in [A, B, C, D]:
+        store.put_graph(key, key.path)
+    store.remove(D)
+    assert store.stale_graphs() == [B, C]
+    assert store.get_graph(D) is None
@@ -0,0 +1,98 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+import pytest
+
+from papyri.miniserde import _deserialize, _serialize, deserialize, serialize
+
+
+@dataclass
+class Author:
+    first: Optional[str]
+    last: str
+
+
+@dataclass
+class Reviewer:
+    first: Optional[str]
+    last: str
+
+
+@dataclass
+class Book:
+    author: List[Union[Author, Reviewer]]
+    title: str
+    tags: Tuple[str, ...]
+    notes: Dict[str, Optional[Union[Author, Reviewer]]]
+    sequel: Optional["Book"]
+
+
+def book():
+    sequel = Book([Reviewer(None, "Fast")], "two", (), {}, None)
+    return Book(
+        [Author("Matthias", "B"), Reviewer("Tony", "Fast")],
+        "pyshs",
+        ("a", "b"),
+        {"x": Author(None, "C")},
+        sequel,
+    )
+
+
+def test_roundtrip_keeps_types():
+    data = serialize(book(), Book)
+    assert data == _serialize(book(), Book)
+    assert data["author"][1] == {
+        "type": "Reviewer",
+        "data": {"first": "Tony", "last": "Fast"},
+    }
+    assert data["sequel"]["sequel"] is None
+    assert data["tags"] == ("a", "b")
+
+    new = deserialize(Book, Book, data)
+    assert new == _deserialize(Book, Book, data)
+    assert new == book()
+    assert type(new.author[1]) is Reviewer
+    assert new.tags == ("a", "b")
+
+
+@pytest.mark.parametrize(
+    "instance, annotation",
+    [
+        (1, str),
+        (None, int),
+        (["a"], Tuple[str, ...]),
+        (Author("a", "b"), Reviewer),
+        (Author(1, "b"), Author),  # type: ignore
+        ([Book([], "t", (), {}, None)], List[Union[Author, Reviewer]]),
+    ],
+)
+def test_serialize_errors(instance, annotation):
+    with pytest.raises(Exception) as compiled:
+        serialize(instance, annotation)
+    with pytest.raises(Exception) as interpreted:
+        _serialize(instance, annotation)
+    assert type(compiled.value) is type(interpreted.value)
+    assert str(compiled.value) == str(interpreted.value)
+
+
+def test_tagged_none():
+    """
+    None in a Union that is not just Optional is tagged, but can't be
+    de-serialised.
+    """
+    annotation = Optional[Union[Author, Reviewer]]
+    data = serialize(None, annotation)
+    assert data == _serialize(None, annotation) == {"type": "NoneType", "data": None}
+    with pytest.raises(AssertionError):
+        deserialize(annotation, annotation, data)
+
+
+def test_deserialize_errors():
+    data = serialize(book(), Book)
+    data["author"][0]["type"] = "Editor"
+    with pytest.raises(IndexError):
+        deserialize(Book, Book, data)
+    data["author"][0]["type"] = "Author"
+    del data["title"]
+    with pytest.raises(KeyError):
+        deserialize(Book, Book, data)
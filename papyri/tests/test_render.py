@@ -0,0 +1,207 @@
+import json
+import logging
+
+from papyri.crosslink import compute_graph
+from papyri.graphstore import GraphStore, Key
+from papyri.render import (
+    HtmlRenderer,
+    PageCache,
+    RefsSnapshot,
+    compute_siblings_II,
+    load_graph,
+)
+
+PATHS = [
+    ("mod", "1.0", "mod"),
+    ("mod", "1.0", "mod.a"),
+    ("mod", "1.0", "mod.a.f"),
+    ("mod", "1.0", "mod.b"),
+    ("mod", "0.9", "mod.old"),
+    ("other", "2.0", "other.c.g"),
+]
+
+
+def store(tmp_path):
+    gstore = GraphStore(tmp_path)
+    for module, version, path in PATHS:
+        gstore.put(Key(module, version, "module", path), b"{}", [])
+    return gstore
+
+
+def test_siblings(tmp_path):
+    snapshot = RefsSnapshot.from_store(store(tmp_path))
+    for ref in ["mod", "mod.a", "mod.a.f", "mod.old", "other.c", "mod.x.y"]:
+        assert snapshot.siblings(ref) == compute_siblings_II(
+            ref, snapshot.known_refs
+        ), ref
+
+
+def test_snapshot_generation(tmp_path):
+    gstore = store(tmp_path)
+    renderer = HtmlRenderer(gstore, sidebar=False, old_store=None)
+    snapshot = renderer.snapshot()
+    assert renderer.snapshot() is snapshot
+    # written by another process, like ingest.
+    GraphStore(tmp_path).put(Key("mod", "1.0", "module", "mod.c"), b"{}", [])
+    new = renderer.snapshot()
+    assert new is not snapshot
+    assert "mod.c" in new.ref_map
+    assert "mod.c" not in snapshot.ref_map
+
+
+def test_gallery(tmp_path, caplog):
+    import trio
+
+    gstore = store(tmp_path)
+    for version, figures in [
+        ("1.0", [["module", "mod.a.f", "fig-0.png"], ["examples", "ex.py", "ex.png"]]),
+        ("0.9", [["module", "mod.old", "fig-old.png"]]),
+    ]:
+        key = Key("mod", version, "meta", "gallery.json")
+        gstore.put(key, json.dumps(figures).encode(), [])
+    renderer = HtmlRenderer(gstore, sidebar=False, old_store=None)
+
+    html = trio.run(renderer.gallery, "mod", "1.0")
+    assert "<a href='/p/mod/1.0/api/mod.a.f'>mod.a.f</a>" in html
+    assert "src='/p/mod/1.0/img/fig-0.png'" in html
+    assert "<a href='/p/mod/1.0/examples/ex.py'>ex.py</a>" in html
+    assert "fig-old.png" not in html
+    # all the versions, and all the modules.
+    assert "fig-old.png" in trio.run(renderer.gallery, "mod")
+    assert "fig-old.png" in trio.run(renderer.gallery, "*")
+    assert "fig-old.png" not in trio.run(renderer.gallery, "other")
+
+    # other was ingested before the gallery indices.
+    with caplog.at_level(logging.WARNING, logger="papyri"):
+        trio.run(renderer.gallery, "other", "2.0")
+    assert "No gallery index for other 2.0" in caplog.text
+
+
+def test_page_cache(tmp_path):
+    a, b = Key("mod", "1.0", "module", "mod.a"), Key("mod", "1.0", "module", "mod.b")
+    cache = PageCache(maxsize=1)
+    cache.put(a, 1, "e1", "<a>")
+    assert cache.get(a, 1) == ("e1", "<a>")
+    # the store changed, but not the page.
+    assert cache.get(a, 2) is None
+    assert cache.revalidate(a, 2, "e1") == "<a>"
+    assert cache.get(a, 2) == ("e1", "<a>")
+    assert cache.revalidate(a, 3, "e2") is None
+    cache.put(b, 1, "e3", "<b>")
+    assert len(cache) == 1
+    assert cache.get(a, 2) is None
+    assert cache.stats()["hits"] == 3
+
+    disk = PageCache(maxsize=1, directory=tmp_path / "pages")
+    disk.put(a, 1, "e1", "<a>")
+    disk.put(b, 1, "e3", "<b>")
+    assert PageCache(directory=tmp_path / "pages").revalidate(a, 4, "e1") == "<a>"
+    # the previous version of a page is deleted when it changes.
+    disk.put(a, 5, "e4", "<a2>")
+    assert PageCache(directory=tmp_path / "pages").revalidate(a, 5, "e1") is None
+    pages = sorted(p.name for p in (tmp_path / "pages").rglob("*") if p.is_file())
+    assert pages == ["e3.html", "e4.html"]
+
+
+def test_load_graph(tmp_path):
+    gstore = store(tmp_path)
+    a, f = Key("mod", "1.0", "module", "mod.a"), Key("mod", "1.0", "module", "mod.a.f")
+    gstore.put(f, b"{}", [a])
+    # computed when missing
+    data = load_graph(gstore, a)
+    assert [n["label"] for n in data["nodes"]] == ["mod.a.f"]
+    assert data["nodes"][0]["url"] == "/p/mod/1.0/api/mod.a.f"
+    gstore.put_graph(a, json.dumps(compute_graph(gstore, a)))
+    assert load_graph(gstore, a) == data
+
+
+def ingest_papyri(tmp_path, monkeypatch):
+    from papyri import crosslink, render
+    from papyri.gen import Config, Gen
+
+    g = Gen(dummy_progress=True, config=Config(exec=False, infer=False))
+    g.collect_package_metadata("papyri", relative_dir=None)
+    g.collect_api_docs("papyri")
+    (tmp_path / "bundle").mkdir()
+    g.write(tmp_path / "bundle")
+
+    monkeypatch.setattr(crosslink, "ingest_dir", tmp_path / "ingest")
+    monkeypatch.setattr(render, "ingest_dir", tmp_path / "ingest")
+    crosslink.main(tmp_path / "bundle", False, dummy_progress=True)
+    return g.version
+
+
+def test_render_jobs(tmp_path, monkeypatch):
+    import trio
+
+    from papyri import config, render
+
+    version = ingest_papyri(tmp_path, monkeypatch)
+    pages = []
+    for jobs in [1, 2]:
+        html_dir = tmp_path / f"html{jobs}"
+        html_dir.mkdir()
+        monkeypatch.setattr(config, "html_dir", html_dir)
+        trio.run(render.main, False, True, False, True, jobs)
+        api = html_dir / "p" / "papyri" / version / "api"
+        pages.append({p.name: p.read_text() for p in api.iterdir()})
+    assert "papyri.take2.Link.html" in pages[0]
+    assert pages[0] == pages[1]
+
+
+def test_render_incremental(tmp_path, monkeypatch):
+    import trio
+
+    from papyri import config, crosslink, render
+
+    version = ingest_papyri(tmp_path, monkeypatch)
+    html_dir = tmp_path / "html"
+    html_dir.mkdir()
+    monkeypatch.setattr(config, "html_dir", html_dir)
+    rendered = []
+    write_api_file = render._write_api_file
+
+    async def record(gfiles, *args, **kwargs):
+        rendered[:] = sorted(k.path for k in gfiles)
+        await write_api_file(gfiles, *args, **kwargs)
+
+    monkeypatch.setattr(render, "_write_api_file", record)
+
+    def run():
+        trio.run(render.main, False, True, False, True, 1, True)
+
+    run()
+    api = html_dir / "p" / "papyri" / version / "api"
+    assert "papyri.take2.Link" in rendered
+    assert (api / "papyri.take2.Link.html").exists()
+    run()
+    assert rendered == []
+
+    gstore = GraphStore(tmp_path / "ingest")
+    link = Key("papyri", version, "module", "papyri.take2.Link")
+    gstore.put(link, gstore.get(link) + b" ", gstore.get_refs(link))
+    gstore.remove(Key("papyri", version, "module", "papyri.take2.Words"))
+    crosslink.relink()
+    run()
+    assert "papyri.take2.Link" in rendered
+    # take2 pages list Words among their siblings, encodings ones do not.
+    assert "papyri.take2.indent" in rendered
+    assert "papyri.encodings.dumps" not in rendered
+    assert (api / "papyri.take2.Link.html").exists()
+    assert not (api / "papyri.take2.Words.html").exists()
+
+    # once a version has no documents, all its output is removed.
+    old = Key("papyri", "0.0.1", "module", "papyri")
+    gstore.put(old, gstore.get(Key("papyri", version, "module", "papyri")), [])
+    crosslink.relink()
+    run()
+    old_dir = html_dir / "p" / "papyri" / "0.0.1"
+    assert (old_dir / "api" / "papyri.html").exists()
+    assert (old_dir / "gallery" / "index.html").exists()
+    gstore.remove(old)
+    gstore.remove(Key("papyri", "0.0.1", "meta", "gallery.json"))
+    run()
+    assert not old_dir.exists()
+    assert (api / "papyri.take2.Link.html").exists()
+    manifest = json.loads((html_dir / "manifest.json").read_text())
+    assert "p/papyri/0.0.1/api/papyri.html" not in manifest["pages"]
@@ -1,3 +1,5 @@
+from typing import List
+
 import pytest
 
 from papyri.ts import parse
@@ -26,3 +28,25 @@ def test_parse_blocks(target, type_, number):
     sections = parse(dedent_but_first(get_object(target).__doc__).encode())
     filtered = [b for section in sections for b in section.children if type(b) == type_]
     assert len(filtered) == number
+
+
+def test_schema_digest():
+    from ..take2 import Node, Section, schema_digest
+
+    class Leaf(Node):
+        value: int
+
+    class Tree(Node):
+        children: List[Leaf]
+
+    digest = schema_digest(Tree)
+    assert digest == schema_digest(Tree)
+    assert digest != schema_digest(Section)
+
+    class Leaf(Node):  # type: ignore[no-redef]
+        value: str
+
+    class Tree(Node):  # type: ignore[no-redef]
+        children: List[Leaf]
+
+    assert schema_digest(Tree) != digest
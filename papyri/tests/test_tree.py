@@ -0,0 +1,75 @@
+import pytest
+
+from papyri.take2 import RefInfo
+from papyri.tree import ResolverCache, ResolverIndex, resolve_
+
+PATHS = [
+    "mod",
+    "mod.linalg",
+    "mod.linalg.norm",
+    "mod.linalg.solve",
+    "mod.fft.fft",
+    "mod.fft.ifft",
+    "mod.core.ndarray",
+    "mod.core.ndarray.sum",
+    "other.norm",
+]
+KNOWN = frozenset(RefInfo(p.split(".")[0], "1.0", "module", p) for p in PATHS)
+
+
+@pytest.mark.parametrize("ref", ["norm", "fft", "ndarray.s", "lin", "a", "x"])
+def test_index_lookups(ref):
+    index = ResolverIndex(KNOWN)
+    assert sorted(index.containing(ref, "mod")) == sorted(
+        p for p in PATHS if ref in p and p.startswith("mod")
+    )
+    assert sorted(index.trailing(ref, "mod")) == sorted(
+        p for p in PATHS if p.split(".")[-1] == ref and p.startswith("mod")
+    )
+    assert sorted(index.endswith("." + ref, "")) == sorted(
+        p for p in PATHS if p.endswith("." + ref)
+    )
+    assert len(index.containing(ref, "mod", limit=2)) == min(
+        2, len(index.containing(ref, "mod"))
+    )
+
+
+@pytest.mark.parametrize(
+    "qa, ref, expected",
+    [
+        ("mod.linalg.solve", "norm", "mod.linalg.norm"),
+        ("mod.linalg.solve", "mod.fft.fft", "mod.fft.fft"),
+        ("mod.fft.fft", ".linalg.norm", "mod.linalg.norm"),
+        ("mod.fft.fft", "ndarray.sum", "mod.core.ndarray.sum"),
+        ("other.norm", "solve", None),
+        ("mod.core", "fft", "mod.fft.fft"),
+        ("mod.core", "ff", None),
+    ],
+)
+def test_resolve(qa, ref, expected):
+    r = resolve_(qa, KNOWN, frozenset(), ref)
+    if expected is None:
+        assert r.kind == "missing"
+    else:
+        assert r.path == expected
+
+
+def test_resolver_cache():
+    cache = ResolverCache(maxsize=2)
+    refs = [frozenset(list(KNOWN)[:i]) for i in range(1, 4)]
+    index = cache.get(refs[0])
+    assert cache.get(frozenset(refs[0])) is index
+    cache.get(refs[1])
+    cache.get(refs[0])
+    # refs[1] is the least recently used.
+    cache.get(refs[2])
+    assert len(cache) == 2
+    assert cache.get(refs[0]) is index
+    assert cache.stats()["misses"] == 3
+    assert cache.hit_rate == 0.5
+
+    cache.set_generation(1)
+    assert len(cache) == 0
+    cache.get(refs[0])
+    cache.set_generation(1)
+    assert len(cache) == 1
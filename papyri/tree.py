@@ -4,9 +4,9 @@ usually trees, and update nodes.
 
 """
 
+from bisect import bisect_left
 from collections import Counter, defaultdict
-from functools import lru_cache
-from typing import Any, Dict, FrozenSet, List, Set, Tuple
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Set, Tuple
 
 from .take2 import (
     Admonition,
@@ -22,8 +22,6 @@ from .take2 import (
     Verbatim,
 )
 
-_cache: Dict[int, Tuple[Dict[str, RefInfo], FrozenSet[str]]] = {}
-
 
 # @lru_cache(maxsize=100000)
 def _build_resolver_cache(
@@ -66,20 +64,168 @@ def _build_resolver_cache(
     return _m2, frozenset(_m2.keys())
 
 
-@lru_cache
-def root_start(root, refs):
+class ResolverIndex:
     """
-    Compute a subset of references that start with given root.
+    Index of the known references, to resolve names without scanning all of
+    them.
+
+    It is built once for a set of known references, see `resolver_index`, and
+    answers the relative (``.name``), suffix and substring lookups of
+    `resolve_` from dictionaries and a sorted list of the suffixes of the
+    name segments.
+
+    Parameters
+    ----------
+    known_refs : frozenset of RefInfo
     """
-    return frozenset(r for r in refs if r.startswith(root))
+
+    def __init__(self, known_refs: FrozenSet[RefInfo]):
+        self.paths: Dict[str, RefInfo]
+        self.keyset: FrozenSet[str]
+        self.paths, self.keyset = _build_resolver_cache(known_refs)
+        # "b.c" -> ["a.b.c", "x.b.c"], the paths ending with "." + "b.c".
+        self._suffixes: Dict[str, List[str]] = defaultdict(list)
+        # "b" -> {"a.b.c", "a.b"}, the paths with a given segment.
+        self._segments: Dict[str, Set[str]] = defaultdict(set)
+        for path in self.keyset:
+            parts = path.split(".")
+            for i in range(1, len(parts)):
+                self._suffixes[".".join(parts[i:])].append(path)
+            for part in parts:
+                self._segments[part].add(path)
+        # (suffix, segment) for all the suffixes of all the segments, a
+        # segment contains a string iff one of its suffixes starts with it.
+        self._segment_suffixes: List[Tuple[str, str]] = sorted(
+            {(seg[i:], seg) for seg in self._segments for i in range(len(seg))}
+        )
+
+    def endswith(self, end: str, root: str) -> List[str]:
+        """
+        Paths that start with `root` and end with `end`, a relative name like
+        ``.linalg.norm``.
+        """
+        assert end.startswith("."), end
+        return [p for p in self._suffixes.get(end[1:], ()) if p.startswith(root)]
+
+    def _containing_segments(self, part: str) -> Iterator[str]:
+        suffixes = self._segment_suffixes
+        i = bisect_left(suffixes, (part,))
+        while i < len(suffixes) and suffixes[i][0].startswith(part):
+            yield suffixes[i][1]
+            i += 1
+
+    def containing(self, ref: str, root: str, limit: Optional[int] = None) -> List[str]:
+        """
+        Paths that start with `root` and contain `ref`.
+
+        At most `limit` paths are returned, `resolve_` only needs to know
+        whether there is a single one.
+        """
+        # each dot separated part of ref is in a segment of the path, look
+        # up the longest one and check the candidates.
+        part = max(ref.split("."), key=len)
+        found: Set[str] = set()
+        for segment in self._containing_segments(part):
+            for q in self._segments[segment]:
+                if ref in q and q.startswith(root):
+                    found.add(q)
+                    if len(found) == limit:
+                        return list(found)
+        return list(found)
+
+    def trailing(self, ref: str, root: str) -> List[str]:
+        """
+        Paths that start with `root` and with `ref` as last segment.
+        """
+        if "." in ref:
+            return []
+        return [
+            q
+            for q in self._segments.get(ref, ())
+            if q.startswith(root) and q.split(".")[-1] == ref
+        ]
 
 
-@lru_cache(10000)
-def endswith(end, refs):
+class ResolverCache:
     """
-    Compute as subset of references that ends with given root.
+    The `ResolverIndex` of the last few sets of known references.
+
+    Long running processes like ``papyri serve`` see a new set of known
+    references after each ingest, the cache keeps at most `maxsize` indexes
+    and drops all of them when the generation of the store changes, see
+    `GraphStore.generation`.
+
+    Parameters
+    ----------
+    maxsize : int
+        maximum number of indexes kept.
     """
-    return frozenset(r for r in refs if r.endswith(end))
+
+    def __init__(self, maxsize: int = 4):
+        self.maxsize = maxsize
+        self.generation: Optional[int] = None
+        self._indexes: Dict[FrozenSet[RefInfo], ResolverIndex] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, known_refs: FrozenSet[RefInfo]) -> ResolverIndex:
+        """
+        The index of `known_refs`, built if it is not in the cache.
+        """
+        index = self._indexes.pop(known_refs, None)
+        if index is None:
+            self.misses += 1
+            index = ResolverIndex(known_refs)
+            if len(self._indexes) >= self.maxsize:
+                # dicts are ordered, the first one is the least recently used.
+                del self._indexes[next(iter(self._indexes))]
+        else:
+            self.hits += 1
+        self._indexes[known_refs] = index
+        return index
+
+    def set_generation(self, generation: int) -> None:
+        """
+        Drop the indexes if the store changed since the last call.
+        """
+        if generation != self.generation:
+            self.clear()
+            self.generation = generation
+
+    def clear(self) -> None:
+        self._indexes.clear()
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Size and hit rate of the cache, for monitoring.
+        """
+        return {
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "generation": self.generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+        }
+
+
+# shared by all the calls to resolve_
+resolver_cache = ResolverCache()
+
+
+def resolver_index(known_refs: FrozenSet[RefInfo]) -> ResolverIndex:
+    """
+    The `ResolverIndex` of `known_refs`, from `resolver_cache`.
+    """
+    return resolver_cache.get(known_refs)
 
 
 def resolve_(
@@ -116,8 +262,6 @@ def resolve_(
 
     # RefInfo(module, version, kind, path)
     # print('resolve', qa)
-    hk = hash(known_refs)
-    hash(local_refs)
     if rev_aliases is None:
         rev_aliases = {}
     if ref in rev_aliases:
@@ -130,20 +274,11 @@ def resolve_(
 
     assert isinstance(ref, str), ref
 
-    # TODO: LRU Cache seem to have speed problem here; and get slow while this should be just fine.
-    # this seem to be due to the fact that even if the hash is the same this still needs to compare the objects, as
-    # those may have been muted.
-    if hk not in _cache:
-        _cache[hk] = _build_resolver_cache(known_refs)
+    index = resolver_index(known_refs)
 
     # this is a mappign from the key to the most relevant
     # Refinfo to a document
-    k_path_map: Dict[str, RefInfo]
-
-    # hashable for cachign /optimisation.
-    keyset: FrozenSet[str]
-
-    k_path_map, keyset = _cache[hk]
+    k_path_map: Dict[str, RefInfo] = index.paths
 
     if ref.startswith("builtins."):
         return RefInfo(None, None, "missing", ref)
@@ -172,10 +307,9 @@ def resolve_(
                 return k_path_map[found]
             else:
                 root = qa.split(".")[0]
-                sub1 = root_start(root, keyset)
-                subset = endswith(ref, sub1)
+                subset = index.endswith(ref, root)
                 if len(subset) == 1:
-                    return k_path_map[next(iter(subset))]
+                    return k_path_map[subset[0]]
                     # return RefInfo(None, None, "exists", next(iter(subset)))
                 else:
                     if len(subset) > 1:
@@ -193,13 +327,12 @@ def resolve_(
                 return k_path_map[attempt]
 
     q0 = qa.split(".")[0]
-    rs = root_start(q0, keyset)
-    attempts = [q for q in rs if (ref in q)]
+    attempts = index.containing(ref, q0, limit=2)
     if len(attempts) == 1:
         # return RefInfo(None, None, "exists", attempts[0])
         return k_path_map[attempts[0]]
     else:
-        trail = [q for q in attempts if q.split(".")[-1] == ref]
+        trail = index.trailing(ref, q0)
         if len(trail) == 1:
             return k_path_map[trail[0]]
 
@@ -299,6 +432,9 @@ class DirectiveVisiter(TreeReplacer):
         # short -> long
         self.rev_aliases = {v: k for k, v in aliases.items()}
         self._targets: Set[Any] = set()
+        # references we could not resolve, that may be resolved once more
+        # libraries are ingested.
+        self.unresolved: Set[str] = set()
 
     def replace_BlockDirective(self, block_directive: BlockDirective):
         block_directive.children = [self.visit(c) for c in block_directive.children]
@@ -468,6 +604,7 @@ class DirectiveVisiter(TreeReplacer):
                 assert None not in r, r
                 self._targets.add(r)
             return [Link(text, r, exists, exists != "missing")]
+        self.unresolved.add(to_resolve)
         return [directive]
 
 
@@ -498,6 +635,7 @@ class DVR(DirectiveVisiter):
                         )
                     )
                     continue
+                self.unresolved.add(token.link)
             new_entries.append(token)
 
         return [Code2(new_entries, code.out, code.ce_status)]
@@ -528,6 +666,7 @@ class DVR(DirectiveVisiter):
                         )
                     )
                     continue
+                self.unresolved.add(entry[1])
             new_entries.append(
                 Token(str(entry[0]), entry[2]),
             )
@@ -65,9 +65,11 @@ def progress(iterable, *, description="Progress", transient=True):
         except StopIteration:
             p.stop()
             if transient:
+                delta = time.monotonic() - now
+                rate = f" ({c / delta:.1f} items/s)" if c and delta else ""
                 print(
                     description,
-                    f"Done {c} items in {time.monotonic() - now:.2f} seconds",
+                    f"Done {c} items in {delta:.2f} seconds{rate}",
                 )
             return
         except BaseException: